@@ -3,6 +3,7 @@ Add test users - South Indian multi-regional users
 """
 from app import create_app
 from models import db, User
+from migrations import upgrade
 
 app = create_app()
 
@@ -20,6 +21,7 @@ test_users = [
 ]
 
 with app.app_context():
+    upgrade(db.engine)
     print("\n=== Adding South Indian Test Users ===\n")
     
     for user_data in test_users:
@@ -0,0 +1,270 @@
+"""
+Per-user emotion and genre affinities in a memory-mapped table shared by all workers
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from lazy import lazy_import
+from models import db, Song
+
+np = lazy_import('numpy')
+
+# Affinity added per interaction; skipping a song counts against its emotion and genre
+INTERACTION_WEIGHTS = {'select': 1.0, 'play': 1.0, 'complete': 2.0, 'skip': -1.0}
+
+# Only ratios between a user's scores matter, so a row is halved before any
+# score leaves the range where float16 still resolves +1
+RESCALE_AT = 1024.0
+
+
+class AffinityStore:
+    """
+    Decayed emotion and genre scores per user, one fixed-size row per user id.
+    
+    A row is a uint32 last-update time followed by float16 scores for
+    AFFINITY_EMOTION_SLOTS emotions and AFFINITY_GENRE_SLOTS genres (68 bytes
+    with the defaults, so a million users take 68 MB). The table is a sparse
+    file sized for AFFINITY_MAX_USERS and mapped shared, so forked and
+    separately started workers read each other's updates and the state
+    survives restarts. Every interaction updates one row in place: the row
+    decays by its age (AFFINITY_HALF_LIFE_DAYS) and the new weight is added,
+    so history never has to be re-read. Each update holds a POSIX record lock
+    on the user's row, so workers updating the same user do not lose each
+    other's increments.
+    
+    Emotion and genre names get slots in order of first use, recorded in an
+    append-only vocabulary file that every worker reads the same way. Once
+    every slot is taken, further names hash onto one of them (a stable CRC32
+    of the name), sharing its score with the name already there.
+    """
+    
+    def __init__(self):
+        self.directory = None
+        self.max_users = 0
+        self.slots = {'emotion': 8, 'genre': 24}
+        self.half_life = 30 * 86400.0
+        self.table = None
+        self._table_fd = None
+        self._vocab = {'emotion': {}, 'genre': {}}
+        self._vocab_offset = 0
+        self._lock = threading.Lock()
+        self._vocab_lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Configure storage location, table size and decay"""
+        self.directory = app.config['AFFINITY_DIR']
+        self.max_users = app.config['AFFINITY_MAX_USERS']
+        self.slots = {'emotion': app.config['AFFINITY_EMOTION_SLOTS'], 'genre': app.config['AFFINITY_GENRE_SLOTS']}
+        self.half_life = app.config['AFFINITY_HALF_LIFE_DAYS'] * 86400.0
+        self.table = None
+    
+    def after_fork(self):
+        """Replace a lock a forking thread may have held; the shared mapping stays valid"""
+        self._lock = threading.Lock()
+        self._vocab_lock = threading.Lock()
+    
+    # ---- storage ----
+    
+    def _path(self, name):
+        """Absolute path of a store file"""
+        return os.path.join(self.directory, name)
+    
+    @property
+    def dtype(self):
+        """Packed row layout"""
+        return np.dtype([
+            ('updated', '<u4'),
+            ('emotion', '<f2', (self.slots['emotion'],)),
+            ('genre', '<f2', (self.slots['genre'],)),
+        ])
+    
+    def _open(self):
+        """Map the table, starting an empty store when missing or laid out differently"""
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = self._path('meta.json')
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta != self.slots:
+            for name in ('table.bin', 'vocab.tsv'):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            with open(meta_path, 'w') as f:
+                json.dump(self.slots, f)
+        
+        # Extending never rewrites existing rows; unused rows stay sparse on disk
+        size = self.dtype.itemsize * self.max_users
+        with open(self._path('table.bin'), 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vocab = {'emotion': {}, 'genre': {}}
+        self._vocab_offset = 0
+        self.table = np.memmap(self._path('table.bin'), dtype=self.dtype, mode='r+', shape=(self.max_users,))
+        # Kept open for the row locks: closing any descriptor of the file drops them all
+        if self._table_fd is not None:
+            os.close(self._table_fd)
+        self._table_fd = os.open(self._path('table.bin'), os.O_RDWR)
+    
+    def _ensure_open(self):
+        """Open the table on first use"""
+        if self.table is None:
+            with self._lock:
+                if self.table is None:
+                    self._open()
+    
+    def _read_vocab(self):
+        """Pick up names other workers added to the vocabulary file"""
+        path = self._path('vocab.tsv')
+        with self._vocab_lock:
+            if not os.path.exists(path) or os.path.getsize(path) == self._vocab_offset:
+                return
+            with open(path, 'rb') as f:
+                f.seek(self._vocab_offset)
+                data = f.read()
+            # A line still being appended is read on a later call
+            data = data[:data.rfind(b'\n') + 1]
+            self._vocab_offset += len(data)
+            for line in data.decode('utf-8').splitlines():
+                kind, name = line.split('\t', 1)
+                names = self._vocab[kind]
+                names.setdefault(name, len(names))
+    
+    def _slot(self, kind, name, add=False):
+        """Score slot for an emotion or genre name, or None if it has none"""
+        name = (name or '').strip().lower()
+        if not name:
+            return None
+        names = self._vocab[kind]
+        if name not in names:
+            self._read_vocab()
+            if name not in names:
+                if not add:
+                    return None
+                # O_APPEND writes of one short line do not interleave between workers
+                fd = os.open(self._path('vocab.tsv'), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+                try:
+                    os.write(fd, f'{kind}\t{name}\n'.encode('utf-8'))
+                finally:
+                    os.close(fd)
+                self._read_vocab()
+        slot = names[name]
+        if slot >= self.slots[kind]:
+            slot = zlib.crc32(name.encode('utf-8')) % self.slots[kind]
+        return slot
+    
+    # ---- updates ----
+    
+    def _update(self, user_id, items):
+        """Decay one user's row and add (emotion, genre, weight) items to it"""
+        if not 0 < user_id < self.max_users:
+            return
+        weights = []
+        for emotion, genre, weight in items:
+            weights.append(('emotion', self._slot('emotion', emotion, add=True), weight))
+            weights.append(('genre', self._slot('genre', genre, add=True), weight))
+        
+        # The thread lock orders this process's updates; the record lock, which
+        # POSIX holds per process, orders them against other workers
+        size = self.dtype.itemsize
+        fcntl.lockf(self._table_fd, fcntl.LOCK_EX, size, user_id * size, os.SEEK_SET)
+        try:
+            row = self.table[user_id:user_id + 1]
+            scores = {kind: row[kind][0].astype(np.float32) for kind in ('emotion', 'genre')}
+            now = int(time.time())
+            updated = int(row['updated'][0])
+            if updated and now > updated:
+                decay = 0.5 ** ((now - updated) / self.half_life)
+                for values in scores.values():
+                    values *= decay
+            for kind, slot, weight in weights:
+                if slot is not None:
+                    scores[kind][slot] += weight
+            peak = max(np.abs(values).max() for values in scores.values())
+            while peak >= RESCALE_AT:
+                for values in scores.values():
+                    values *= 0.5
+                peak *= 0.5
+            row['emotion'][0] = scores['emotion']
+            row['genre'][0] = scores['genre']
+            row['updated'][0] = now
+        finally:
+            fcntl.lockf(self._table_fd, fcntl.LOCK_UN, size, user_id * size, os.SEEK_SET)
+    
+    def record_selection(self, user_id, emotion):
+        """Count a user choosing a mood"""
+        self._ensure_open()
+        with self._lock:
+            self._update(int(user_id), [(emotion, None, INTERACTION_WEIGHTS['select'])])
+    
+    def record_events(self, rows):
+        """Count validated listening-event rows towards their songs' emotions and genres"""
+        self._ensure_open()
+        song_ids = {row['song_id'] for row in rows}
+        songs = {
+            song_id: (emotion, genre)
+            for song_id, emotion, genre in db.session.execute(
+                db.select(Song.song_id, Song.emotion_tag, Song.genre).where(Song.song_id.in_(song_ids))
+            )
+        }
+        by_user = defaultdict(list)
+        for row in rows:
+            if row['song_id'] in songs:
+                emotion, genre = songs[row['song_id']]
+                by_user[int(row['user_id'])].append((emotion, genre, INTERACTION_WEIGHTS[row['event_type']]))
+        with self._lock:
+            for user_id, items in by_user.items():
+                self._update(user_id, items)
+    
+    # ---- queries ----
+    
+    def scores(self, user_id):
+        """Return ({emotion: score}, {genre: score}) for a user, normalized to sum to 1 per kind"""
+        self._ensure_open()
+        self._read_vocab()
+        user_id = int(user_id)
+        result = []
+        for kind in ('emotion', 'genre'):
+            values = self.table[user_id][kind].astype(np.float32) if 0 < user_id < self.max_users else None
+            scores = {}
+            if values is not None:
+                total = float(np.clip(values, 0, None).sum())
+                for name, slot in self._vocab[kind].items():
+                    if slot < len(values) and values[slot] > 0:
+                        scores[name] = round(float(values[slot]) / total, 4)
+            result.append(scores)
+        return tuple(result)
+    
+    def rank_genres(self, user_id, genres):
+        """Order genre names by the user's affinity, highest first; ties keep their given order"""
+        self._ensure_open()
+        user_id = int(user_id)
+        if not 0 < user_id < self.max_users:
+            return list(genres)
+        values = self.table[user_id]['genre']
+        if not values.any():
+            return list(genres)
+        
+        def score(genre):
+            slot = self._slot('genre', genre)
+            return float(values[slot]) if slot is not None else 0.0
+        return sorted(genres, key=score, reverse=True)
+    
+    def stats(self):
+        """Table size and vocabulary counts"""
+        self._ensure_open()
+        self._read_vocab()
+        return {
+            'max_users': self.max_users,
+            'row_bytes': self.dtype.itemsize,
+            'emotions': len(self._vocab['emotion']),
+            'genres': len(self._vocab['genre']),
+            'slots': self.slots,
+        }
+
+
+affinity_store = AffinityStore()
@@ -1,8 +1,21 @@
 from flask import Flask
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
 from config import config
 from models import db, bcrypt
+from database import init_database
+from cache import song_cache
+from hashing import password_hasher
+from recommender import recommendation_index
+from events import event_buffer, mood_buffer
+from affinity import affinity_store
+from invalidation import invalidation_bus
+from replicas import replica_router
+from jobs import job_queue
+from links import link_enricher
+from identity import TimedJWTManager, init_identity
+from metrics import init_metrics
+from prefork import install_fork_hooks
+from ratelimit import rate_limiter
 import os
 
 def create_app(config_name='default'):
@@ -12,13 +25,39 @@ def create_app(config_name='default'):
     # Load configuration
     app.config.from_object(config[config_name])
     
+    # Take the client address from trusted proxies' X-Forwarded-For (used by rate limiting)
+    if app.config['PROXY_FIX_HOPS']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'])
+    
     # Enable CORS for all routes (including file:// origin for local testing)
-    CORS(app, resources={r"/api/*": {"origins": "*", "supports_credentials": False}})
+    CORS(app, resources={r"/api/*": {
+        "origins": "*",
+        "supports_credentials": False,
+        "expose_headers": ["X-Next-Cursor"]
+    }})
     
     # Initialize extensions
-    db.init_app(app)
+    init_database(app, db)
+    replica_router.init_app(app)
     bcrypt.init_app(app)
-    jwt = JWTManager(app)
+    password_hasher.init_app(app)
+    recommendation_index.init_app(app)
+    event_buffer.init_app(app)
+    mood_buffer.init_app(app)
+    affinity_store.init_app(app)
+    jwt = TimedJWTManager(app)
+    rate_limiter.init_app(app)
+    init_identity(app)
+    invalidation_bus.init_app(app)
+    job_queue.init_app(app)
+    link_enricher.init_app(app)
+    
+    # Per-endpoint latency, SQL and serialization metrics for /api/metrics
+    init_metrics(app, db)
+    
+    # Size the in-process song cache
+    song_cache.max_entries = app.config['SONG_CACHE_MAX_ENTRIES']
     
     # Create instance folder if it doesn't exist
     instance_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance')
@@ -29,15 +68,20 @@ def create_app(config_name='default'):
     from routes import api
     app.register_blueprint(api)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-        print("Database tables created successfully!")
+    # Workers forked from a preloaded app get fresh connections, pools and ETag generations.
+    # The schema is managed by migrate_db.py, not created here on every boot.
+    install_fork_hooks(app)
     
     return app
 
 if __name__ == '__main__':
     app = create_app('development')
+    
+    # The dev server applies pending migrations itself so a fresh checkout just runs
+    from migrations import upgrade
+    with app.app_context():
+        upgrade(db.engine)
+    
     print("Starting Flask backend server...")
     print("API endpoints available at: http://localhost:5001/api/")
     app.run(host='0.0.0.0', port=5001, debug=True)
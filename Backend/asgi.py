@@ -0,0 +1,291 @@
+"""
+ASGI entry point: native async handlers for the hot read and login paths,
+with every other api blueprint route served by the Flask app on a thread pool
+
+Run: uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+"""
+import contextlib
+import functools
+import os
+import time
+import zlib
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+from app import create_app
+from async_db import create_async_db_engine
+from cache import song_list_bodies, catalog_version, emotion_cache_key
+from encoding import ETAG_TAGS, JSON, negotiate
+from facets import FACETS_QUERY, emotions_body
+from hashing import HashQueueFull, password_hasher
+from identity import profile_claims
+from invalidation import invalidation_bus
+from jobs import job_queue
+from metrics import begin_request, current_stats, end_request, install_sql_timing, observe_request
+from models import User, Song
+from pagination import PAGE_ARGS
+from ratelimit import RateLimitExceeded, rate_limiter
+from replicas import replica_config, replica_router
+from singleflight import async_song_list_flights
+
+flask_app = create_app(os.environ.get('APP_CONFIG', 'production'))
+flask_asgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_WORKERS'])
+
+engine = create_async_db_engine(flask_app.config)
+install_sql_timing(engine.sync_engine)
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Async engines for the read replicas, in the router's order
+replica_engines = []
+for index, url in enumerate(replica_router.urls):
+    replica_engine = create_async_db_engine(replica_config(flask_app.config, url))
+    install_sql_timing(replica_engine.sync_engine)
+    replica_router.install_guards(replica_engine.sync_engine, index)
+    replica_engines.append(replica_engine)
+replica_sessions = [async_sessionmaker(replica_engine, expire_on_commit=False) for replica_engine in replica_engines]
+
+# Flask-CORS adds these to blueprint responses; mirror them on the async handlers
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'X-Next-Cursor'
+}
+
+
+class FlaskFallback:
+    """Response that hands the request to the Flask app unchanged"""
+    
+    async def __call__(self, scope, receive, send):
+        await flask_asgi(scope, receive, send)
+
+
+def read_session(request):
+    """Session factory for a read-only handler: a read replica when one is available, else the primary"""
+    index = replica_router.choose(replica_router.pinned(request.cookies))
+    return async_session if index is None else replica_sessions[index]
+
+
+def json_response(data, status=200, headers=None):
+    """Serialize data exactly as Flask's jsonify would"""
+    body = flask_app.json.response(data).get_data()
+    return Response(body, status_code=status, media_type='application/json',
+                    headers={**CORS_HEADERS, **(headers or {})})
+
+
+def is_not_modified(request, etag, last_modified):
+    """Check the request's validators; If-None-Match takes precedence over If-Modified-Since"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        return parse_etags(if_none_match).contains(etag)
+    if_modified_since = parse_date(request.headers.get('if-modified-since'))
+    if if_modified_since and last_modified:
+        return last_modified <= if_modified_since
+    return False
+
+
+def cache_headers(etag, last_modified):
+    """Validators and Cache-Control for a catalog response"""
+    return {
+        **CORS_HEADERS,
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': flask_app.config['CATALOG_CACHE_CONTROL']
+    }
+
+
+def not_modified_response(etag, last_modified):
+    """Build an empty 304 response carrying the current validators"""
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
+
+
+def instrumented(handler):
+    """Record request metrics for an async handler, as the Flask hooks do for blueprint routes"""
+    endpoint = f'api.{handler.__name__}'
+    
+    @functools.wraps(handler)
+    async def wrapper(request):
+        token = begin_request()
+        start = time.perf_counter()
+        try:
+            response = await handler(request)
+        except Exception:
+            observe_request(endpoint, request.method, 500, time.perf_counter() - start, current_stats())
+            raise
+        else:
+            # The Flask app records requests handed to it
+            if not isinstance(response, FlaskFallback):
+                observe_request(endpoint, request.method, response.status_code,
+                                time.perf_counter() - start, current_stats())
+            return response
+        finally:
+            end_request(token)
+    return wrapper
+
+
+# ============ ASYNC ROUTES ============
+
+@instrumented
+async def health_check(request):
+    """Health check endpoint"""
+    return json_response({'status': 'healthy', 'message': 'Flask backend is running'})
+
+
+@instrumented
+async def login(request):
+    """Login user and return JWT tokens"""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        
+        # Validate required fields
+        if not data or 'login' not in data or 'password' not in data:
+            return json_response({'error': 'Username/Email and password are required'}, 400)
+        
+        # Throttle before any bcrypt work
+        rate_limiter.check(('login_ip', request.client.host if request.client else None),
+                           ('login_account', data['login']))
+        
+        async with async_session() as session:
+            # Find user by email or username
+            login_identifier = data['login']
+            user = (await session.scalars(select(User).where(
+                (User.email == login_identifier) | (User.username == login_identifier)
+            ))).first()
+            
+            # bcrypt runs on the hashing pool while the event loop keeps serving
+            if not user or not await password_hasher.check_async(user.password_hash, data['password']):
+                return json_response({'error': 'Invalid username/email or password'}, 401)
+            
+            # Upgrade hashes made with an outdated bcrypt cost
+            if user.password_needs_rehash(flask_app.config['BCRYPT_LOG_ROUNDS']):
+                user.password_hash = await password_hasher.hash_async(data['password'])
+                await session.commit()
+        
+        with flask_app.app_context():
+            access_token = create_access_token(identity=user.id, additional_claims=profile_claims(user))
+            refresh_token = create_refresh_token(identity=user.id)
+        
+        return json_response({
+            'message': 'Login successful',
+            'user': user.to_dict(),
+            'access_token': access_token,
+            'refresh_token': refresh_token
+        })
+    except RateLimitExceeded as e:
+        return json_response({'error': 'Too many attempts, please retry later'}, 429,
+                             {'Retry-After': str(e.retry_after)})
+    except HashQueueFull:
+        return json_response({'error': 'Server is busy, please retry shortly'}, 429, {'Retry-After': '1'})
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+async def encode_song_list(emotion, bodies, session_factory):
+    """Query and encode the whole catalog, or one mood, as JSON and store it in bodies"""
+    if JSON in bodies:
+        return bodies[JSON]
+    stmt = select(Song)
+    if emotion:
+        stmt = stmt.where(Song.emotion_key == Song.normalize_emotion(emotion)).order_by(Song.song_id)
+    async with session_factory() as session:
+        songs = (await session.scalars(stmt)).all()
+    
+    return bodies.setdefault(JSON, flask_app.json.dumps([song.to_dict() for song in songs]).encode('utf-8'))
+
+
+@instrumented
+async def get_songs(request):
+    """Get all songs or filter by emotion"""
+    # Paginated, projected, MessagePack and personalized (signed-in) requests use the Flask implementation
+    if any(arg in request.query_params for arg in PAGE_ARGS) or negotiate(request.headers.get('accept')) != JSON \
+            or 'authorization' in request.headers:
+        return FlaskFallback()
+    
+    try:
+        emotion = request.query_params.get('emotion')
+        cache_key = emotion_cache_key(emotion)
+        
+        # Same bucket-version ETag as the Flask route, so either server can revalidate
+        version, last_modified = catalog_version.bucket(cache_key)
+        etag = catalog_version.etag('songs', cache_key, version, ETAG_TAGS[JSON],
+                                    zlib.crc32(request.scope['query_string']))
+        headers = dict(cache_headers(etag, last_modified), Vary='Accept, Authorization' if emotion else 'Accept')
+        if is_not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        
+        bodies = song_list_bodies(cache_key, version)
+        body = bodies.get(JSON)
+        if body is None:
+            # Concurrent misses for the same list share one query and one encoding
+            body = await async_song_list_flights.do(
+                (cache_key, version, JSON), lambda: encode_song_list(emotion, bodies, read_session(request))
+            )
+        
+        return Response(body, media_type=JSON, headers=headers)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@instrumented
+async def get_song(request):
+    """Get a specific song by ID"""
+    try:
+        song_id = request.path_params['song_id']
+        version, last_modified = catalog_version.song(song_id)
+        etag = catalog_version.etag('song', song_id, version)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        
+        async with read_session(request)() as session:
+            song = await session.get(Song, song_id)
+        if song is None:
+            return json_response({'error': 'Song not found'}, 404)
+        return json_response(song.to_dict(), headers=cache_headers(etag, last_modified))
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@instrumented
+async def get_emotions(request):
+    """Get list of available emotions, optionally with per-emotion and per-genre song counts"""
+    try:
+        counts = request.query_params.get('counts', 'false').lower() in ('1', 'true', 'yes')
+        version, last_modified = catalog_version.catalog()
+        etag = catalog_version.etag('emotions', version, int(counts))
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        
+        async with read_session(request)() as session:
+            rows = (await session.execute(FACETS_QUERY)).all()
+        return json_response(emotions_body(rows, counts), headers=cache_headers(etag, last_modified))
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Follow cache invalidations and run background jobs from startup; close pooled async connections on shutdown"""
+    # The native handlers serve cached lists without passing through Flask's before_request
+    invalidation_bus.ensure_started()
+    job_queue.ensure_started()
+    yield
+    await engine.dispose()
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
+
+
+# Routes matched by path but not method (e.g. POST /api/songs) fall through to Flask
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/api/auth/login', login, methods=['POST']),
+    Route('/api/songs', get_songs, methods=['GET']),
+    Route('/api/songs/emotions', get_emotions, methods=['GET']),
+    Route('/api/songs/{song_id:int}', get_song, methods=['GET']),
+    Mount('/', app=flask_asgi),
+])
@@ -0,0 +1,35 @@
+"""
+Async database engine for the ASGI entry point
+"""
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from database import engine_options, install_sqlite_pragmas
+
+# Async driver used for each synchronous backend
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_uri(uri):
+    """Swap the driver in a SQLAlchemy URI for its asyncio counterpart"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend}')
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def create_async_db_engine(config):
+    """Create an async engine with the same pool sizing and pragmas as the sync one"""
+    options = engine_options(config)
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        # aiosqlite already confines each connection to its own thread, and every
+        # pre-ping would cost an extra hop to it for a file that cannot disconnect
+        options['connect_args'].pop('check_same_thread', None)
+        options['pool_pre_ping'] = False
+    
+    engine = create_async_engine(async_database_uri(config['SQLALCHEMY_DATABASE_URI']), **options)
+    install_sqlite_pragmas(engine.sync_engine, config)
+    return engine
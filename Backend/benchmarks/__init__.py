@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Flask backend
+Run from the Backend directory, e.g. python -m benchmarks.sqlite_concurrency
+"""
@@ -0,0 +1,86 @@
+"""
+Compare two benchmarks.run reports, e.g. before and after a commit
+
+Usage: python -m benchmarks.compare baseline.json candidate.json [--threshold 10] [--json]
+
+Exits with status 1 when any workload loses more than --threshold percent
+throughput or gains more than --threshold percent p99 latency.
+"""
+import argparse
+import json
+import sys
+
+# (metric, True when higher is better)
+METRICS = (
+    ('operations_per_sec', True),
+    ('p50_ms', False),
+    ('p99_ms', False),
+    ('errors', False),
+)
+
+
+def load(path):
+    """Load a report and index its results by workload"""
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    return report, {result['workload']: result for result in report['results']}
+
+
+def change(before, after):
+    """Percent change from before to after, or None when undefined"""
+    if before in (None, 0) or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(baseline, candidate, threshold):
+    """Return per-workload metric deltas and the list of regressions"""
+    rows, regressions = [], []
+    for workload in baseline:
+        if workload not in candidate:
+            continue
+        row = {'workload': workload}
+        for metric, higher_is_better in METRICS:
+            before, after = baseline[workload].get(metric), candidate[workload].get(metric)
+            delta = change(before, after)
+            row[metric] = {'baseline': before, 'candidate': after, 'change_pct': delta}
+            if metric in ('operations_per_sec', 'p99_ms') and delta is not None:
+                worse = -delta if higher_is_better else delta
+                if worse > threshold:
+                    regressions.append(f'{workload} {metric} {delta:+.1f}%')
+        rows.append(row)
+    return rows, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10, help='regression threshold in percent')
+    parser.add_argument('--json', action='store_true', help='print the comparison as JSON')
+    args = parser.parse_args()
+    
+    baseline_report, baseline = load(args.baseline)
+    candidate_report, candidate = load(args.candidate)
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    
+    if args.json:
+        print(json.dumps({
+            'baseline_commit': baseline_report['meta'].get('commit'),
+            'candidate_commit': candidate_report['meta'].get('commit'),
+            'workloads': rows,
+            'regressions': regressions,
+        }, indent=2))
+    else:
+        print(f"baseline  {baseline_report['meta'].get('commit')}")
+        print(f"candidate {candidate_report['meta'].get('commit')}")
+        for row in rows:
+            print(row['workload'])
+            for metric, _ in METRICS:
+                values = row[metric]
+                delta = '' if values['change_pct'] is None else f"{values['change_pct']:+.1f}%"
+                print(f"  {metric:<20} {values['baseline']!s:>12} -> {values['candidate']!s:>12}  {delta}")
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+    
+    sys.exit(1 if regressions else 0)
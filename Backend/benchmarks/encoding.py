@@ -0,0 +1,116 @@
+"""
+Encoding benchmark: bytes on the wire and CPU time of the song list encodings
+
+Usage: python -m benchmarks.encoding [--songs 100000] [--repeat 5] [--output encoding.json]
+
+For the full catalog and one emotion bucket, each path loads the list and encodes
+it the way GET /api/songs does:
+
+  orm_json      Song objects -> to_dict() -> JSON (the default, Accept: application/json)
+  rows_json     selected row tuples -> dicts -> JSON (paginated JSON responses)
+  rows_msgpack  selected row tuples -> columnar MessagePack (Accept: application/msgpack)
+
+CPU time (time.process_time) is reported for the query and the encoding separately,
+as the median over --repeat runs. Gzipped sizes show what compressing proxies send.
+"""
+import argparse
+import gzip
+import os
+import statistics
+import tempfile
+import time
+from benchmarks.generators import ensure_database
+from benchmarks.report import run_metadata, write_results
+from benchmarks.run import make_app
+
+
+def orm_json(app, emotion):
+    """Current default path: load Song objects, then serialize their dicts"""
+    from models import Song
+    query = Song.query
+    if emotion:
+        query = query.filter(Song.emotion_key == Song.normalize_emotion(emotion)).order_by(Song.song_id)
+    songs = query.all()
+    return lambda: app.json.dumps([song.to_dict() for song in songs]).encode('utf-8')
+
+
+def _song_rows(emotion):
+    """Select every Song field as row tuples"""
+    from models import db, Song
+    fields = list(Song.FIELDS)
+    stmt = db.select(*[getattr(Song, field) for field in fields])
+    if emotion:
+        stmt = stmt.where(Song.emotion_key == Song.normalize_emotion(emotion)).order_by(Song.song_id)
+    return fields, db.session.execute(stmt).all()
+
+
+def rows_json(app, emotion):
+    """Row tuples turned into dicts and serialized as JSON"""
+    from pagination import row_dicts
+    fields, rows = _song_rows(emotion)
+    return lambda: app.json.dumps(row_dicts(fields, rows)).encode('utf-8')
+
+
+def rows_msgpack(app, emotion):
+    """Row tuples packed as columnar MessagePack"""
+    from encoding import pack_rows
+    fields, rows = _song_rows(emotion)
+    return lambda: pack_rows(fields, rows)
+
+
+PATHS = {'orm_json': orm_json, 'rows_json': rows_json, 'rows_msgpack': rows_msgpack}
+
+
+def measure(app, path, emotion, repeat):
+    """Median query and encode CPU milliseconds of one path, with its output sizes"""
+    from models import db
+    query_times, encode_times = [], []
+    for _ in range(repeat):
+        # Start each run from an empty identity map, as a fresh request would
+        db.session.remove()
+        start = time.process_time()
+        encode = PATHS[path](app, emotion)
+        loaded = time.process_time()
+        body = encode()
+        encoded = time.process_time()
+        query_times.append(loaded - start)
+        encode_times.append(encoded - loaded)
+    db.session.remove()
+    return {
+        'bytes': len(body),
+        'gzip_bytes': len(gzip.compress(body, compresslevel=6)),
+        'query_cpu_ms': round(statistics.median(query_times) * 1000, 1),
+        'encode_cpu_ms': round(statistics.median(encode_times) * 1000, 1),
+        'total_cpu_ms': round(statistics.median(q + e for q, e in zip(query_times, encode_times)) * 1000, 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the song list response encodings')
+    parser.add_argument('--songs', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--emotion', default='happy', help='emotion bucket measured besides the full list')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', help='catalog file to generate or reuse (default: a cached file in the temp dir)')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    
+    # Users do not matter here; bcrypt cost 4 keeps generation fast
+    db_path = args.db or os.path.join(tempfile.gettempdir(), f'moodtunes-bench-{args.songs}-10-{args.seed}.db')
+    catalog = ensure_database(db_path, args.songs, 10, args.seed, log_rounds=4)
+    app = make_app(db_path, catalog, tempfile.mkdtemp(prefix='bench-encoding-'))
+    
+    results = {}
+    with app.app_context():
+        for label, emotion in (('all_songs', None), (f'emotion={args.emotion}', args.emotion)):
+            paths = {path: measure(app, path, emotion, args.repeat) for path in PATHS}
+            baseline = paths['orm_json']
+            for path in paths.values():
+                path['bytes_vs_orm_json'] = round(path['bytes'] / baseline['bytes'], 3)
+                path['total_cpu_vs_orm_json'] = round(path['total_cpu_ms'] / baseline['total_cpu_ms'], 3)
+            results[label] = paths
+    
+    write_results({
+        'meta': run_metadata(repeat=args.repeat, **catalog),
+        'results': results,
+    }, args.output)
@@ -0,0 +1,123 @@
+"""
+Deterministic synthetic catalogs and user populations for benchmarking
+
+Usage: python -m benchmarks.generators --db /tmp/catalog.db [--songs 1000000] [--users 10000] [--seed 42]
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from sqlalchemy import create_engine, insert
+from models import bcrypt, db, Song, User
+from migrations import MIGRATIONS, upgrade
+
+EMOTIONS = ('Happy', 'Sad', 'Angry', 'Relaxed')
+GENRES = ('Pop', 'Rock', 'Indie', 'Electronic', 'Alternative', 'Country', 'Metal', 'Nu Metal', 'Classical', 'Ambient')
+
+# Every generated user logs in with this password
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+
+def zipf_weights(n, exponent):
+    """Normalized Zipf weights: rank k gets 1 / k**exponent (exponent 0 is uniform)"""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def song_batches(count, seed=42, batch_size=10000, emotion_skew=1.0, genre_skew=1.2, artists=None):
+    """
+    Yield insert-ready song rows in batches.
+    
+    Emotions, genres and artists follow Zipf distributions, so the first
+    emotion and the first genres dominate the catalog the way popular moods
+    and genres do in real listening data. The same seed always yields the
+    same catalog.
+    """
+    rng = np.random.default_rng(seed)
+    artists = artists or max(count // 20, 1)
+    emotion_p = zipf_weights(len(EMOTIONS), emotion_skew)
+    genre_p = zipf_weights(len(GENRES), genre_skew)
+    artist_p = zipf_weights(artists, 1.0)
+    
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        emotions = rng.choice(len(EMOTIONS), size=size, p=emotion_p)
+        genres = rng.choice(len(GENRES), size=size, p=genre_p)
+        artist_ids = rng.choice(artists, size=size, p=artist_p)
+        yield [{
+            'title': f'Song {start + i}',
+            'artist': f'Artist {artist_ids[i]}',
+            'genre': GENRES[genres[i]],
+            'emotion_tag': EMOTIONS[emotions[i]],
+            'emotion_key': Song.normalize_emotion(EMOTIONS[emotions[i]]),
+            'link': f'https://example.com/songs/{start + i}',
+        } for i in range(size)]
+
+
+def user_batches(count, log_rounds, batch_size=10000):
+    """Yield user rows in batches; all users share one bcrypt hash of BENCHMARK_PASSWORD"""
+    # Hashing once keeps generation fast while logins still pay the full bcrypt cost
+    password_hash = bcrypt.generate_password_hash(BENCHMARK_PASSWORD, log_rounds).decode('utf-8')
+    for start in range(0, count, batch_size):
+        yield [{
+            'username': f'user{i}',
+            'email': f'user{i}@example.com',
+            'password_hash': password_hash,
+        } for i in range(start, min(start + batch_size, count))]
+
+
+def _meta_path(path):
+    """Sidecar file recording the parameters a database was generated with"""
+    return path + '.json'
+
+
+def ensure_database(path, songs, users, seed=42, log_rounds=12, emotion_skew=1.0, genre_skew=1.2):
+    """
+    Generate a SQLite benchmark database at path unless one with the same
+    parameters already exists; returns the generation parameters.
+    """
+    params = {
+        'songs': songs, 'users': users, 'seed': seed, 'log_rounds': log_rounds,
+        'emotion_skew': emotion_skew, 'genre_skew': genre_skew, 'schema': MIGRATIONS[-1][0],
+    }
+    if os.path.exists(path) and os.path.exists(_meta_path(path)):
+        with open(_meta_path(path), encoding='utf-8') as f:
+            if json.load(f).get('params') == params:
+                return params
+    
+    for stale in (path, path + '-wal', path + '-shm', _meta_path(path)):
+        if os.path.exists(stale):
+            os.remove(stale)
+    
+    start = time.perf_counter()
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for batch in song_batches(songs, seed, emotion_skew=emotion_skew, genre_skew=genre_skew):
+            conn.execute(insert(Song.__table__), batch)
+        for batch in user_batches(users, log_rounds):
+            conn.execute(insert(User.__table__), batch)
+    # Applied after loading so indexes such as the search index are built in one pass
+    upgrade(engine, log=lambda message: None)
+    engine.dispose()
+    
+    with open(_meta_path(path), 'w', encoding='utf-8') as f:
+        json.dump({'params': params, 'seconds': round(time.perf_counter() - start, 2)}, f)
+    return params
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic benchmark database')
+    parser.add_argument('--db', required=True, help='SQLite file to create')
+    parser.add_argument('--songs', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--log-rounds', type=int, default=12, help='bcrypt cost of the user password hash')
+    parser.add_argument('--emotion-skew', type=float, default=1.0, help='Zipf exponent for emotions (0 = uniform)')
+    parser.add_argument('--genre-skew', type=float, default=1.2, help='Zipf exponent for genres (0 = uniform)')
+    args = parser.parse_args()
+    
+    params = ensure_database(args.db, args.songs, args.users, args.seed, args.log_rounds,
+                             args.emotion_skew, args.genre_skew)
+    print(json.dumps({'db': args.db, 'params': params}, indent=2))
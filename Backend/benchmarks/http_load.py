@@ -0,0 +1,169 @@
+"""
+HTTP load test: the threaded Flask server vs the ASGI entry point under many
+concurrent keep-alive connections
+
+Usage: python -m benchmarks.http_load [--connections 1000] [--seconds 10] [--songs 20000]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from sqlalchemy import create_engine
+from benchmarks.report import BACKEND_DIR, percentile
+from benchmarks.sqlite_concurrency import seed
+
+SERVERS = {
+    'sync': [sys.executable, '-c',
+             "import os; from app import create_app; "
+             "create_app('production').run(host='127.0.0.1', port=int(os.environ['PORT']), threaded=True)"],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}',
+             '--log-level', 'warning', '--no-access-log', '--backlog', '4096'],
+}
+
+
+def request_paths(songs):
+    """Request mix: mostly single-song reads, some emotion lists and emotion lookups"""
+    paths = [f'/api/songs/{random.randint(1, songs)}' for _ in range(800)]
+    paths += ['/api/songs?emotion=happy&limit=50'] * 100
+    paths += ['/api/songs/emotions'] * 100
+    random.shuffle(paths)
+    return paths
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response and return (status, keep_alive)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def connection(port, paths, deadline, latencies, errors):
+    """Send requests back to back over one keep-alive connection until the deadline"""
+    reader = writer = None
+    index = random.randrange(len(paths))
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            path = paths[index % len(paths)]
+            index += 1
+            start = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.encode())
+            status, keep_alive = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 500:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+def client_process(port, connections, seconds, songs, queue):
+    """Drive a share of the connections from one process and report its samples"""
+    async def main():
+        paths = request_paths(songs)
+        latencies, errors = [], []
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(
+            connection(port, paths, deadline, latencies, errors) for _ in range(connections)
+        ))
+        return latencies, errors
+    
+    queue.put(asyncio.run(main()))
+
+
+def wait_until_ready(port, timeout=30):
+    """Poll the health endpoint until the server answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def run(mode, port, db_path, connections, seconds, songs, clients):
+    """Start one server against the seeded database and load it"""
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        DATABASE_URL=f'sqlite:///{db_path}',
+        EVENT_SPOOL_DIR=os.path.join(workdir, 'event_spool'),
+        RECOMMENDER_DIR=os.path.join(workdir, 'recommender'),
+        AFFINITY_DIR=os.path.join(workdir, 'affinity'),
+    )
+    command = [part.format(port=port) for part in SERVERS[mode]]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port)
+        queue = multiprocessing.Queue()
+        shares = [connections // clients + (1 if n < connections % clients else 0) for n in range(clients)]
+        workers = [multiprocessing.Process(target=client_process, args=(port, share, seconds, songs, queue))
+                   for share in shares]
+        for worker in workers:
+            worker.start()
+        latencies, errors = [], []
+        for _ in workers:
+            samples, failures = queue.get()
+            latencies.extend(samples)
+            errors.extend(failures)
+        for worker in workers:
+            worker.join()
+    finally:
+        server.terminate()
+        server.wait()
+    
+    return {
+        'mode': mode,
+        'connections': connections,
+        'requests_per_sec': round(len(latencies) / seconds, 1),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else None,
+        'errors': len(errors),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the sync and ASGI servers under concurrent load')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=4, help='client processes sharing the connections')
+    parser.add_argument('--port', type=int, default=5101)
+    parser.add_argument('--mode', choices=sorted(SERVERS), action='append',
+                        help='server to test (default: both)')
+    args = parser.parse_args()
+    
+    db_path = os.path.join(tempfile.mkdtemp(), 'load.db')
+    seed(create_engine(f'sqlite:///{db_path}'), args.songs)
+    
+    results = [run(mode, args.port + n, db_path, args.connections, args.seconds, args.songs, args.clients)
+               for n, mode in enumerate(args.mode or ['sync', 'asgi'])]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,151 @@
+"""
+Invalidation benchmark: how long other server processes keep serving stale cached
+data after a write, with several servers sharing one database
+
+Usage: python -m benchmarks.invalidation [--servers 4] [--rounds 10] [--bound 2.0] [--mode sync]
+
+Each server is a separate process with its own in-process caches, as separate
+workers or nodes would be. Every round first warms each server's song list
+cache for one emotion and its profile cache for one user, then writes through
+one server (POST /api/songs, then PUT /api/users/<id>) and polls every other
+server until the change shows up. The report gives the convergence delays per
+change kind; the exit status is 1 if any server took longer than --bound
+seconds or never converged.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from benchmarks.generators import BENCHMARK_PASSWORD, ensure_database
+from benchmarks.http_load import SERVERS, wait_until_ready
+from benchmarks.report import BACKEND_DIR, percentile, run_metadata, write_results
+
+EMOTIONS = ('happy', 'sad', 'energetic', 'calm')
+
+
+def call(port, method, path, body=None, token=None):
+    """Send one JSON request and return the decoded response body"""
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', method=method,
+                                     data=json.dumps(body).encode() if body is not None else None)
+    request.add_header('Content-Type', 'application/json')
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def converge(ports, check, timeout, interval=0.01):
+    """Seconds until check(port) holds on every port (polled every interval), or None per port on timeout"""
+    start = time.perf_counter()
+    delays = {port: None for port in ports}
+    while time.perf_counter() - start < timeout:
+        for port in ports:
+            if delays[port] is None and check(port):
+                delays[port] = time.perf_counter() - start
+        if all(delay is not None for delay in delays.values()):
+            break
+        time.sleep(interval)
+    return list(delays.values())
+
+
+def start_servers(mode, ports, db_path, poll_interval):
+    """Start one server process per port against the shared database"""
+    workdir = tempfile.mkdtemp(prefix='bench-invalidation-')
+    servers = []
+    for port in ports:
+        env = dict(
+            os.environ,
+            PORT=str(port),
+            DATABASE_URL=f'sqlite:///{db_path}',
+            EVENT_SPOOL_DIR=os.path.join(workdir, f'event_spool-{port}'),
+            RECOMMENDER_DIR=os.path.join(workdir, f'recommender-{port}'),
+            AFFINITY_DIR=os.path.join(workdir, 'affinity'),
+            BCRYPT_LOG_ROUNDS='4',
+            RATE_LIMIT_ENABLED='false',
+            INVALIDATION_POLL_INTERVAL=str(poll_interval),
+        )
+        command = [part.format(port=port) for part in SERVERS[mode]]
+        servers.append(subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    return servers
+
+
+def run(ports, rounds, bound):
+    """Write through each server in turn and time how long the others take to see it"""
+    login = call(ports[0], 'POST', '/api/auth/login', {'login': 'user1', 'password': BENCHMARK_PASSWORD})
+    token, user_id = login['access_token'], login['user']['id']
+    delays = {'songs': [], 'users': []}
+    for round_number in range(rounds):
+        writer = ports[round_number % len(ports)]
+        readers = [port for port in ports if port != writer]
+        emotion = EMOTIONS[round_number % len(EMOTIONS)]
+        
+        # Warm every server's caches with the data about to change
+        for port in ports:
+            call(port, 'GET', f'/api/songs?emotion={emotion}')
+            call(port, 'GET', f'/api/users/{user_id}', token=token)
+        
+        title = f'Invalidation {round_number} {time.time_ns()}'
+        call(writer, 'POST', '/api/songs', {'title': title, 'artist': 'Bench', 'emotion_tag': emotion})
+        delays['songs'] += converge(readers, lambda port: any(
+            song['title'] == title for song in call(port, 'GET', f'/api/songs?emotion={emotion}')
+        ), timeout=bound * 5)
+        
+        email = f'user1+{round_number}-{time.time_ns()}@example.com'
+        call(writer, 'PUT', f'/api/users/{user_id}', {'email': email}, token=token)
+        delays['users'] += converge(readers, lambda port: call(
+            port, 'GET', f'/api/users/{user_id}', token=token
+        )['email'] == email, timeout=bound * 5)
+    
+    results = {}
+    for kind, samples in delays.items():
+        converged = sorted(delay for delay in samples if delay is not None)
+        results[kind] = {
+            'changes_observed': len(samples),
+            'not_converged': len(samples) - len(converged),
+            'p50_ms': percentile(converged, 50),
+            'p99_ms': percentile(converged, 99),
+            'max_ms': round(converged[-1] * 1000, 3) if converged else None,
+            'within_bound': len(converged) == len(samples) and (not converged or converged[-1] <= bound),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure how fast cache invalidations reach other servers')
+    parser.add_argument('--servers', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--songs', type=int, default=5000)
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='INVALIDATION_POLL_INTERVAL of the servers')
+    parser.add_argument('--bound', type=float, default=2.0, help='seconds within which every server must converge')
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--mode', choices=sorted(SERVERS), default='sync')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    
+    # The rounds write to the catalog, so use a fresh one; bcrypt cost 4 keeps the login fast
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench-invalidation-'), 'catalog.db')
+    catalog = ensure_database(db_path, args.songs, 10, log_rounds=4)
+    
+    ports = [args.port + n for n in range(args.servers)]
+    servers = start_servers(args.mode, ports, db_path, args.poll_interval)
+    try:
+        for port in ports:
+            wait_until_ready(port)
+        results = run(ports, args.rounds, args.bound)
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait()
+    
+    write_results({
+        'meta': run_metadata(mode=args.mode, servers=args.servers, rounds=args.rounds,
+                             poll_interval=args.poll_interval, bound=args.bound, **catalog),
+        'results': results,
+    }, args.output)
+    sys.exit(0 if all(result['within_bound'] for result in results.values()) else 1)
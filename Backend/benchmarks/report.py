@@ -0,0 +1,70 @@
+"""
+Shared result helpers for the benchmarks: percentiles, run metadata and JSON output
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of samples in milliseconds"""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000, 3)
+
+
+def summarize(latencies, seconds, errors=0, **extra):
+    """Summarize per-operation latencies (in seconds) as throughput and percentiles"""
+    latencies = sorted(latencies)
+    summary = {
+        'operations': len(latencies),
+        'operations_per_sec': round(len(latencies) / seconds, 1) if seconds else None,
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'p999_ms': percentile(latencies, 99.9),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else None,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+        'errors': errors,
+    }
+    summary.update(extra)
+    return summary
+
+
+def _git(*args):
+    """Run a git command in the repository, returning its output or None"""
+    try:
+        return subprocess.run(['git', *args], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(**params):
+    """Describe the commit, interpreter and machine a benchmark ran on"""
+    status = _git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'params': params,
+    }
+
+
+def write_results(document, path=None):
+    """Print the result document and optionally save it as JSON"""
+    text = json.dumps(document, indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
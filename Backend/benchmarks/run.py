@@ -0,0 +1,162 @@
+"""
+Reproducible benchmark suite: generate (or reuse) a synthetic catalog, run scripted
+workloads against the application and report throughput and latency percentiles
+
+Usage: python -m benchmarks.run [--songs 100000] [--users 1000] [--workloads mood_browse,login_storm]
+                                [--threads 8] [--seconds 10] [--output results.json]
+
+Each workload runs in a fresh process through the Flask test client, so results
+measure the application and database without HTTP server overhead. Workloads that
+write get their own copy of the catalog. Compare two result files with
+python -m benchmarks.compare.
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from benchmarks.generators import ensure_database
+from benchmarks.report import run_metadata, summarize, write_results
+from benchmarks.workloads import WORKLOADS
+
+
+def make_app(db_path, catalog, workdir):
+    """Create the application against the benchmark database"""
+    from app import create_app
+    from config import ProductionConfig, config
+    
+    config['benchmark'] = type('BenchmarkConfig', (ProductionConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'BCRYPT_LOG_ROUNDS': catalog['log_rounds'],
+        'EVENT_SPOOL_DIR': os.path.join(workdir, 'event_spool'),
+        'RECOMMENDER_DIR': os.path.join(workdir, 'recommender'),
+        'AFFINITY_DIR': os.path.join(workdir, 'affinity'),
+        # Workloads log in far faster than any real client may
+        'RATE_LIMIT_ENABLED': False,
+        # Song writes queue link checks; keep them off the network
+        'LINK_FETCHER': 'links:offline_fetch',
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+    })
+    # Keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        return create_app('benchmark')
+
+
+def run_workload(name, db_path, catalog, threads, seconds, warmup, seed, queue):
+    """Run one workload with the given number of threads and report its summary"""
+    workload_class = WORKLOADS[name]
+    workdir = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    if workload_class.mutates:
+        copy = os.path.join(workdir, 'catalog.db')
+        shutil.copyfile(db_path, copy)
+        db_path = copy
+    app = make_app(db_path, catalog, workdir)
+    
+    workloads = [workload_class(catalog, seed * 1000 + n) for n in range(threads)]
+    latencies = [[] for _ in range(threads)]
+    statuses = [Counter() for _ in range(threads)]
+    failures = [0] * threads
+    ready = threading.Barrier(threads + 1)
+    timing = {}
+    
+    def worker(n):
+        client = app.test_client()
+        workloads[n].setup(client)
+        ready.wait()
+        samples, counts = latencies[n], statuses[n]
+        while True:
+            start = time.perf_counter()
+            if start >= timing['stop']:
+                break
+            try:
+                status = workloads[n].step(client)
+            except Exception:
+                failures[n] += 1
+                continue
+            if start >= timing['record']:
+                samples.append(time.perf_counter() - start)
+                counts[status] += 1
+    
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    now = time.perf_counter()
+    timing.update(record=now + warmup, stop=now + warmup + seconds)
+    ready.wait()
+    for thread in pool:
+        thread.join()
+    
+    status_counts = Counter()
+    for counts in statuses:
+        status_counts.update(counts)
+    extra = {}
+    if workload_class.rows_per_step:
+        succeeded = sum(count for status, count in status_counts.items() if status < 400)
+        extra['rows_per_sec'] = round(succeeded * workload_class.rows_per_step / seconds, 1)
+    errors = sum(failures) + sum(count for status, count in status_counts.items() if status >= 500)
+    
+    queue.put(summarize(
+        [sample for samples in latencies for sample in samples], seconds, errors,
+        workload=name,
+        threads=threads,
+        status_counts={str(status): count for status, count in sorted(status_counts.items())},
+        **extra
+    ))
+    
+    # Write out buffered events before their spool directory goes away
+    from events import event_buffer, mood_buffer
+    event_buffer.stop()
+    mood_buffer.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the scripted benchmark workloads')
+    parser.add_argument('--songs', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--log-rounds', type=int, default=12, help='bcrypt cost for users and the app')
+    parser.add_argument('--emotion-skew', type=float, default=1.0)
+    parser.add_argument('--genre-skew', type=float, default=1.2)
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help=f"comma-separated subset of {', '.join(WORKLOADS)}")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--db', help='catalog file to generate or reuse (default: a cached file in the temp dir)')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    
+    names = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(unknown)}")
+    
+    db_path = args.db or os.path.join(
+        tempfile.gettempdir(), f'moodtunes-bench-{args.songs}-{args.users}-{args.seed}.db')
+    start = time.perf_counter()
+    catalog = ensure_database(db_path, args.songs, args.users, args.seed, args.log_rounds,
+                              args.emotion_skew, args.genre_skew)
+    print(f'Catalog ready in {time.perf_counter() - start:.1f}s: {db_path}', file=sys.stderr)
+    
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name in names:
+        queue = context.Queue()
+        process = context.Process(target=run_workload, args=(
+            name, db_path, catalog, args.threads, args.seconds, args.warmup, args.seed, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+        print(f"{name}: {results[-1]['operations_per_sec']} ops/s, p99 {results[-1]['p99_ms']} ms",
+              file=sys.stderr)
+    
+    write_results({
+        'meta': run_metadata(threads=args.threads, seconds=args.seconds, warmup=args.warmup, **catalog),
+        'results': results,
+    }, args.output)
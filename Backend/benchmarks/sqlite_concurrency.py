@@ -0,0 +1,121 @@
+"""
+Concurrent read/write benchmark: default SQLite settings vs the tuned engine setup
+
+Usage: python -m benchmarks.sqlite_concurrency [--songs 20000] [--readers 8] [--seconds 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, insert, select
+from benchmarks.report import percentile
+from config import Config
+from database import engine_options, install_sqlite_pragmas
+from models import db, Song
+
+EMOTIONS = ['happy', 'sad', 'angry', 'relaxed']
+
+
+def make_engine(path, tuned):
+    """Create an engine with stock settings or the application's tuned settings"""
+    config = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+    config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    if not tuned:
+        return create_engine(config['SQLALCHEMY_DATABASE_URI'])
+    engine = create_engine(config['SQLALCHEMY_DATABASE_URI'], **engine_options(config))
+    install_sqlite_pragmas(engine, config)
+    return engine
+
+
+def seed(engine, songs):
+    """Create the schema and insert the synthetic catalog"""
+    db.metadata.create_all(engine)
+    rows = [{
+        'title': f'Song {i}',
+        'artist': f'Artist {i % 500}',
+        'genre': 'Pop',
+        'emotion_tag': EMOTIONS[i % 4].title(),
+        'emotion_key': EMOTIONS[i % 4],
+    } for i in range(songs)]
+    with engine.begin() as conn:
+        conn.execute(insert(Song.__table__), rows)
+
+
+def run(tuned, songs, readers, seconds):
+    """Run readers and one writer against a fresh database and collect latencies"""
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = make_engine(path, tuned)
+    seed(engine, songs)
+    
+    stop = threading.Event()
+    read_latency, write_latency, errors = [], [], []
+    lock = threading.Lock()
+    
+    def reader(n):
+        samples = []
+        stmt = select(Song.song_id, Song.title, Song.artist).where(Song.emotion_key == EMOTIONS[n % 4]).limit(100)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(stmt).all()
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            samples.append(time.perf_counter() - start)
+        with lock:
+            read_latency.extend(samples)
+    
+    def writer():
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(Song.__table__), {
+                        'title': f'New {i}', 'artist': 'Writer', 'genre': 'Pop',
+                        'emotion_tag': 'Happy', 'emotion_key': 'happy'
+                    })
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            write_latency.append(time.perf_counter() - start)
+            i += 1
+    
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    
+    return {
+        'mode': 'tuned' if tuned else 'default',
+        'reads_per_sec': round(len(read_latency) / seconds, 1),
+        'writes_per_sec': round(len(write_latency) / seconds, 1),
+        'read_p50_ms': percentile(read_latency, 50),
+        'read_p99_ms': percentile(read_latency, 99),
+        'write_p50_ms': percentile(write_latency, 50),
+        'write_p99_ms': percentile(write_latency, 99),
+        'read_mean_ms': round(statistics.fmean(read_latency) * 1000, 3) if read_latency else None,
+        'errors': len(errors),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark concurrent SQLite reads and writes')
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    
+    results = [run(tuned, args.songs, args.readers, args.seconds) for tuned in (False, True)]
+    print(json.dumps(results, indent=2))
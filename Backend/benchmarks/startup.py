@@ -0,0 +1,149 @@
+"""
+Startup benchmark: cold process start vs workers forked from a preloaded app
+
+Usage: python -m benchmarks.startup [--runs 10] [--forks 4] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.report import BACKEND_DIR, percentile, run_metadata, write_results
+
+# Runs in a fresh interpreter: time the imports, the factory and the first request
+COLD_START = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app('production')
+created = time.perf_counter()
+app.test_client().get('/api/health')
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_request': served - created}))
+"""
+
+
+def memory_kib(pid):
+    """Return RSS, PSS and private memory in KiB from /proc/<pid>/smaps_rollup, or None"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    value = lambda name: int(fields.get(name, '0 kB').split()[0])
+    return {
+        'rss_kib': value('Rss'),
+        'pss_kib': value('Pss'),
+        'private_kib': value('Private_Clean') + value('Private_Dirty'),
+    }
+
+
+def cold_starts(runs, env):
+    """Start fresh interpreters and collect their phase timings and wall time"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', COLD_START], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        phases = json.loads(output.strip().splitlines()[-1])
+        phases['wall'] = time.perf_counter() - start
+        samples.append(phases)
+    return samples
+
+
+def forked_starts(forks, env):
+    """Preload the app here, then fork workers and time each until it serves a request"""
+    os.environ.update(env)
+    sys.path.insert(0, BACKEND_DIR)
+    from app import create_app
+    from prefork import warm_up
+    
+    app = create_app('production')
+    warm_up(app)
+    
+    samples, memory = [], []
+    for _ in range(forks):
+        read_fd, write_fd = os.pipe()
+        start = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            app.test_client().get('/api/health')
+            os.write(write_fd, b'1')
+            # Stay alive long enough for the parent to read memory usage
+            time.sleep(1)
+            os._exit(0)
+        os.close(write_fd)
+        os.read(read_fd, 1)
+        samples.append(time.perf_counter() - start)
+        memory.append(memory_kib(pid))
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+    return samples, [m for m in memory if m], memory_kib(os.getpid())
+
+
+def import_costs(env, top=10):
+    """Return the slowest top-level imports of app, from python -X importtime"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=BACKEND_DIR,
+                            env=env, capture_output=True, text=True, check=True).stderr
+    costs = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Two-space indent marks modules imported directly by app
+        if name.startswith('   ') and not name.startswith('    '):
+            costs.append({'module': name.strip(), 'cumulative_ms': round(int(cumulative) / 1000, 1)})
+    return sorted(costs, key=lambda cost: cost['cumulative_ms'], reverse=True)[:top]
+
+
+def phase_summary(samples, phase):
+    """Median and p90 of one phase, in milliseconds"""
+    values = [sample[phase] for sample in samples]
+    return {'median_ms': round(statistics.median(values) * 1000, 1), 'p90_ms': percentile(values, 90)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure application startup time')
+    parser.add_argument('--runs', type=int, default=10, help='cold starts to measure')
+    parser.add_argument('--forks', type=int, default=4, help='workers to fork from a preloaded app')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        EVENT_SPOOL_DIR=os.path.join(workdir, 'event_spool'),
+        RECOMMENDER_DIR=os.path.join(workdir, 'recommender'),
+        AFFINITY_DIR=os.path.join(workdir, 'affinity'),
+    )
+    
+    # The app no longer creates tables on boot, so migrate the scratch database first
+    subprocess.run([sys.executable, 'migrate_db.py', '--config', 'production'], cwd=BACKEND_DIR, env=env,
+                   capture_output=True, check=True)
+    
+    cold = cold_starts(args.runs, env)
+    imports = import_costs(env)
+    forked, worker_memory, master_memory = forked_starts(args.forks, env)
+    
+    write_results({
+        'meta': run_metadata(runs=args.runs, forks=args.forks),
+        'cold_start': {phase: phase_summary(cold, phase)
+                       for phase in ('wall', 'import', 'create_app', 'first_request')},
+        'forked_start': {
+            'median_ms': round(statistics.median(forked) * 1000, 1),
+            'p90_ms': percentile(forked, 90),
+        },
+        'memory': {
+            'master': master_memory,
+            'worker_mean': {key: round(statistics.fmean(m[key] for m in worker_memory))
+                            for key in ('rss_kib', 'pss_kib', 'private_kib')} if worker_memory else None,
+        },
+        'slowest_imports': imports,
+    }, args.output)
@@ -0,0 +1,185 @@
+"""
+Scripted request mixes for benchmarks.run, driven through the Flask test client
+"""
+import numpy as np
+from benchmarks.generators import BENCHMARK_PASSWORD, EMOTIONS, GENRES, zipf_weights
+
+
+class Workload:
+    """
+    One scripted operation mix; every benchmark thread runs its own instance.
+    
+    step() performs a single request and returns its status code.
+    """
+    
+    name = None
+    # Workloads that write run against a private copy of the catalog
+    mutates = False
+    # Rows written per successful step, reported as rows_per_sec
+    rows_per_step = None
+    
+    def __init__(self, catalog, seed):
+        self.catalog = catalog
+        self.rng = np.random.default_rng(seed)
+        self.emotion_p = zipf_weights(len(EMOTIONS), catalog['emotion_skew'])
+    
+    def setup(self, client):
+        """Prepare per-thread state before timing starts"""
+    
+    def step(self, client):
+        raise NotImplementedError
+    
+    def _emotion(self):
+        """Pick an emotion with the catalog's skew"""
+        return EMOTIONS[self.rng.choice(len(EMOTIONS), p=self.emotion_p)]
+    
+    def _song_id(self):
+        """Pick an existing song id uniformly"""
+        return int(self.rng.integers(1, self.catalog['songs'] + 1))
+    
+    def _login(self, client):
+        """Log in as a random generated user and return the access token"""
+        user = int(self.rng.integers(0, self.catalog['users']))
+        response = client.post('/api/auth/login', json={'login': f'user{user}', 'password': BENCHMARK_PASSWORD})
+        return response, (response.get_json() or {}).get('access_token')
+
+
+class MoodBrowse(Workload):
+    """Page through emotion lists with keyset cursors, open songs, refresh the emotion list"""
+    
+    name = 'mood_browse'
+    page_size = 50
+    
+    def setup(self, client):
+        self.cursors = {}
+    
+    def step(self, client):
+        roll = self.rng.random()
+        if roll < 0.6:
+            emotion = self._emotion()
+            url = f'/api/songs?emotion={emotion}&limit={self.page_size}'
+            if self.cursors.get(emotion):
+                url += f'&after={self.cursors[emotion]}'
+            response = client.get(url)
+            # Keep paging until the list ends or the listener loses interest
+            cursor = response.headers.get('X-Next-Cursor')
+            self.cursors[emotion] = cursor if cursor and self.rng.random() < 0.8 else None
+        elif roll < 0.95:
+            response = client.get(f'/api/songs/{self._song_id()}')
+        else:
+            response = client.get('/api/songs/emotions')
+        return response.status_code
+
+
+class LoginStorm(Workload):
+    """Concurrent logins of random users, dominated by bcrypt checks"""
+    
+    name = 'login_storm'
+    
+    def step(self, client):
+        response, _ = self._login(client)
+        return response.status_code
+
+
+class BulkInsert(Workload):
+    """Upload JSON batches of new songs to the bulk endpoint"""
+    
+    name = 'bulk_insert'
+    mutates = True
+    rows_per_step = 1000
+    
+    def step(self, client):
+        emotions = self.rng.choice(len(EMOTIONS), size=self.rows_per_step, p=self.emotion_p)
+        genres = self.rng.integers(0, len(GENRES), size=self.rows_per_step)
+        songs = [{
+            'title': f'Bulk {self.rng.integers(1 << 62)}',
+            'artist': f'Bulk Artist {int(genres[i])}',
+            'genre': GENRES[genres[i]],
+            'emotion_tag': EMOTIONS[emotions[i]],
+        } for i in range(self.rows_per_step)]
+        return client.post('/api/songs/bulk', json=songs).status_code
+
+
+class Search(Workload):
+    """Search by artist, by exact title and by a typed-so-far title prefix, sometimes within a mood"""
+    
+    name = 'search'
+    
+    def setup(self, client):
+        # Same artist count and popularity skew as generators.song_batches
+        artists = max(self.catalog['songs'] // 20, 1)
+        self.artist_p = zipf_weights(artists, 1.0)
+    
+    def step(self, client):
+        roll = self.rng.random()
+        if roll < 0.4:
+            q = f'artist {self.rng.choice(len(self.artist_p), p=self.artist_p)}'
+        elif roll < 0.7:
+            q = f'song {self._song_id() - 1}'
+        else:
+            # A partially typed title: "song 12" matches "Song 12", "Song 120", ...
+            title = str(self._song_id() - 1)
+            q = f'song {title[:max(len(title) - 2, 2)]}'
+        url = f'/api/songs/search?q={q}'
+        if self.rng.random() < 0.3:
+            url += f'&emotion={self._emotion()}'
+        return client.get(url).status_code
+
+
+class MixedReadWrite(MoodBrowse):
+    """Mostly browsing, with song creation and listening-event uploads from logged-in users"""
+    
+    name = 'mixed'
+    mutates = True
+    
+    def setup(self, client):
+        super().setup(client)
+        _, token = self._login(client)
+        self.headers = {'Authorization': f'Bearer {token}'}
+    
+    def step(self, client):
+        roll = self.rng.random()
+        if roll < 0.85:
+            return super().step(client)
+        if roll < 0.9:
+            response = client.post('/api/songs', json={
+                'title': f'Mixed {self.rng.integers(1 << 62)}',
+                'artist': 'Mixed Artist',
+                'genre': GENRES[self.rng.integers(len(GENRES))],
+                'emotion_tag': self._emotion(),
+            })
+        else:
+            events = [{
+                'song_id': self._song_id(),
+                'event_type': ('play', 'skip', 'complete')[self.rng.integers(3)],
+                'duration_ms': int(self.rng.integers(1000, 300000)),
+            } for _ in range(10)]
+            response = client.post('/api/events', json={'events': events}, headers=self.headers)
+        return response.status_code
+
+
+class PersonalizedBrowse(Workload):
+    """Signed-in users open whole mood lists ranked by their affinities and report what they played"""
+    
+    name = 'personalized'
+    mutates = True
+    
+    def setup(self, client):
+        _, token = self._login(client)
+        self.headers = {'Authorization': f'Bearer {token}'}
+    
+    def step(self, client):
+        if self.rng.random() < 0.8:
+            response = client.get(f'/api/songs?emotion={self._emotion()}', headers=self.headers)
+        else:
+            events = [{
+                'song_id': self._song_id(),
+                'event_type': ('play', 'skip', 'complete')[self.rng.integers(3)],
+            } for _ in range(10)]
+            response = client.post('/api/events', json={'events': events}, headers=self.headers)
+        return response.status_code
+
+
+WORKLOADS = {workload.name: workload for workload in (
+    MoodBrowse, LoginStorm, BulkInsert, Search, MixedReadWrite, PersonalizedBrowse
+)}
@@ -0,0 +1,148 @@
+"""
+Bulk song ingestion shared by POST /api/songs/bulk and bulk_load.py
+"""
+import csv
+import io
+import json
+from models import db, Song, LINK_PENDING
+from facets import record_inserted
+from jobs import job_queue
+
+REQUIRED_FIELDS = ('title', 'artist', 'emotion_tag')
+OPTIONAL_FIELDS = ('genre', 'link')
+
+# Column length limits from the Song model
+MAX_LENGTHS = {
+    name: Song.__table__.c[name].type.length
+    for name in REQUIRED_FIELDS + OPTIONAL_FIELDS
+}
+
+
+def parse_rows(text, fmt):
+    """Parse a JSON array, NDJSON or CSV document into a list of dicts"""
+    if fmt == 'json':
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError('Expected a JSON array of songs')
+        return rows
+    if fmt == 'ndjson':
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    raise ValueError(f'Unsupported format: {fmt}')
+
+
+def detect_format(filename=None, mimetype=None):
+    """Guess the upload format from a filename or content type"""
+    name = (filename or '').lower()
+    mimetype = (mimetype or '').lower()
+    if name.endswith('.csv') or mimetype == 'text/csv':
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return 'json'
+
+
+def _clean(column):
+    """Strip a column of strings, treating empty values as missing"""
+    return [value.strip() or None if isinstance(value, str) else None for value in column]
+
+
+def validate_rows(rows):
+    """
+    Validate and normalize rows column by column.
+    
+    Each field is checked across every row at once and only rejected rows are
+    revisited to build their messages. Values must be strings (CSV cells always
+    are); numbers, booleans and nested values are rejected rather than coerced.
+    Returns (valid, errors) where valid holds insert-ready dicts and errors
+    lists {'row': index, 'error': message} for rejected input rows.
+    """
+    fields = REQUIRED_FIELDS + OPTIONAL_FIELDS
+    objects = [index for index, row in enumerate(rows) if isinstance(row, dict)]
+    raw = {name: [rows[index].get(name) for index in objects] for name in fields}
+    columns = {name: _clean(column) for name, column in raw.items()}
+    
+    # Row positions failing each check, per field
+    not_string = {name: {pos for pos, value in enumerate(column) if value is not None and not isinstance(value, str)}
+                  for name, column in raw.items()}
+    missing = {name: {pos for pos, value in enumerate(columns[name]) if value is None} - not_string[name]
+               for name in REQUIRED_FIELDS}
+    too_long = {name: {pos for pos, value in enumerate(column) if value and len(value) > MAX_LENGTHS[name]}
+                for name, column in columns.items()}
+    
+    errors = [{'row': index, 'error': 'Row must be an object'}
+              for index, row in enumerate(rows) if not isinstance(row, dict)]
+    rejected = set().union(*not_string.values(), *missing.values(), *too_long.values())
+    for pos in rejected:
+        for checks, message in ((not_string, 'Fields must be strings'),
+                                (missing, 'Missing required fields'),
+                                (too_long, 'Fields too long')):
+            names = [name for name in fields if pos in checks.get(name, ())]
+            if names:
+                errors.append({'row': objects[pos], 'error': f"{message}: {', '.join(names)}"})
+                break
+    errors.sort(key=lambda error: error['row'])
+    
+    emotion_keys = [Song.normalize_emotion(tag) for tag in columns['emotion_tag']]
+    link_statuses = [LINK_PENDING if link else None for link in columns['link']]
+    valid = [
+        dict(zip(fields, values), emotion_key=key, link_status=status)
+        for pos, (values, key, status) in enumerate(zip(zip(*columns.values()), emotion_keys, link_statuses))
+        if pos not in rejected
+    ]
+    return valid, errors
+
+
+def _existing_pairs(chunk):
+    """Return the (title, artist) pairs from chunk that are already stored"""
+    pairs = list({(song['title'], song['artist']) for song in chunk})
+    stmt = db.select(Song.title, Song.artist).where(
+        db.tuple_(Song.title, Song.artist).in_(pairs)
+    )
+    return {tuple(row) for row in db.session.execute(stmt)}
+
+
+def insert_songs(songs, chunk_size=1000, dedupe=False):
+    """
+    Insert validated songs with executemany, committing once per chunk.
+    
+    With dedupe, songs whose (title, artist) already exists in the database
+    or earlier in the input are skipped. Chunks with links also queue an
+    enrich_pending job. Returns a per-chunk report.
+    """
+    report = []
+    seen = set()
+    
+    for start in range(0, len(songs), chunk_size):
+        chunk = songs[start:start + chunk_size]
+        skipped = 0
+        
+        if dedupe:
+            seen |= _existing_pairs(chunk)
+            unique = []
+            for song in chunk:
+                pair = (song['title'], song['artist'])
+                if pair in seen:
+                    skipped += 1
+                    continue
+                seen.add(pair)
+                unique.append(song)
+            chunk = unique
+        
+        if chunk:
+            db.session.execute(db.insert(Song.__table__), chunk)
+            record_inserted(chunk)
+            if any(song['link'] for song in chunk):
+                # One job per chunk finds the chunk's pending links; rows enriched by an earlier one are skipped
+                job_queue.enqueue('enrich_pending')
+            db.session.commit()
+        
+        report.append({
+            'chunk': len(report),
+            'offset': start,
+            'inserted': len(chunk),
+            'skipped': skipped
+        })
+    
+    return report
@@ -0,0 +1,47 @@
+"""
+Bulk song loader
+Loads songs from a JSON array, NDJSON or CSV file in executemany chunks
+
+Usage: python bulk_load.py songs.csv [--format csv] [--chunk-size 5000] [--dedupe]
+"""
+import argparse
+from app import create_app
+from bulk import detect_format, insert_songs, parse_rows, validate_rows
+from migrations import upgrade
+from models import db
+
+
+def load_songs(path, fmt=None, chunk_size=None, dedupe=False):
+    """Validate and insert every song in the given file"""
+    app = create_app('development')
+    
+    with app.app_context():
+        upgrade(db.engine)
+        with open(path, encoding='utf-8') as f:
+            rows = parse_rows(f.read(), fmt or detect_format(path))
+        
+        songs, errors = validate_rows(rows)
+        for error in errors:
+            print(f"  ⚠️  Row {error['row']}: {error['error']}")
+        
+        chunks = insert_songs(
+            songs,
+            chunk_size=chunk_size or app.config['BULK_CHUNK_SIZE'],
+            dedupe=dedupe
+        )
+        for chunk in chunks:
+            print(f"  - Chunk {chunk['chunk']}: {chunk['inserted']} inserted, {chunk['skipped']} skipped")
+        
+        inserted = sum(chunk['inserted'] for chunk in chunks)
+        print(f"Successfully added {inserted} songs to the database! ({len(errors)} rejected)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load songs into the database')
+    parser.add_argument('path', help='JSON array, NDJSON or CSV file of songs')
+    parser.add_argument('--format', choices=['json', 'ndjson', 'csv'], help='Input format (default: from file extension)')
+    parser.add_argument('--chunk-size', type=int, help='Rows per executemany batch (default: BULK_CHUNK_SIZE)')
+    parser.add_argument('--dedupe', action='store_true', help='Skip songs whose (title, artist) already exists')
+    args = parser.parse_args()
+    
+    load_songs(args.path, fmt=args.format, chunk_size=args.chunk_size, dedupe=args.dedupe)
@@ -0,0 +1,236 @@
+"""
+In-process caches for read-heavy API responses
+"""
+from collections import OrderedDict
+from datetime import datetime, timezone
+import threading
+import time
+import uuid
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with optional TTL and hit/miss counters"""
+    
+    def __init__(self, max_entries=128, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry if full"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, *keys):
+        """Drop the given keys from the cache"""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+    
+    def clear(self):
+        """Drop every entry from the cache"""
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self):
+        """Return cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+# Marker rows of the shared catalog_versions table: the epoch (its version is a random
+# token drawn when the table was created) and the version songs fall back to once their
+# individual rows have been compacted away
+EPOCH_KEY = '#epoch'
+SONG_FLOOR_KEY = '#song-floor'
+SONG_KEY_PREFIX = 'song:'
+
+
+def song_version_key(song_id):
+    """catalog_versions key of one song"""
+    return f'{SONG_KEY_PREFIX}{song_id}'
+
+
+class CatalogVersion:
+    """
+    Version counters for the song catalog, per emotion bucket and per song.
+    
+    Once load() has mirrored the shared catalog_versions table, versions are
+    the numbers every worker assigns to the same catalog changes (published
+    through the invalidation bus) and the generation is the database's epoch,
+    so any worker revalidates an ETag issued by another. Until then, or after
+    a change could not be recorded in the table, versions are local to this
+    process and the generation is a per-process token.
+    """
+    
+    def __init__(self, max_songs=100000):
+        self.generation = uuid.uuid4().hex[:8]
+        self.shared = False
+        self.max_songs = max_songs
+        self.version = 0
+        self._started = self._now()
+        self._last_modified = self._started
+        self._buckets = {}
+        self._songs = OrderedDict()
+        # Version reported for songs not tracked individually (never bumped or evicted)
+        self._song_floor = (0, self._started)
+        self._lock = threading.Lock()
+    
+    def after_fork(self):
+        """Give a forked worker its own generation unless its versions are the shared ones"""
+        if not self.shared:
+            self.generation = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+    
+    def renew(self):
+        """Start a local generation so no ETag issued so far matches again"""
+        with self._lock:
+            self.generation = uuid.uuid4().hex[:8]
+            self.shared = False
+    
+    @staticmethod
+    def _now():
+        """Current time at HTTP-date (whole second) precision"""
+        return datetime.now(timezone.utc).replace(microsecond=0)
+    
+    @staticmethod
+    def _stamp(version, changed_at):
+        """(version, last_modified) from a stored naive-UTC time"""
+        return version, changed_at.replace(tzinfo=timezone.utc, microsecond=0)
+    
+    def load(self, rows):
+        """Replace every version with the shared (key, version, changed_at) rows; False if they are incomplete"""
+        rows = {key: self._stamp(version, changed_at) for key, version, changed_at in rows}
+        if EPOCH_KEY not in rows or ALL_SONGS_KEY not in rows or SONG_FLOOR_KEY not in rows:
+            return False
+        songs = OrderedDict(sorted(
+            (int(key[len(SONG_KEY_PREFIX):]), stamp) for key, stamp in rows.items() if key.startswith(SONG_KEY_PREFIX)
+        ))
+        with self._lock:
+            self.generation = f'{rows[EPOCH_KEY][0]:08x}'
+            self.shared = True
+            self._started = rows[EPOCH_KEY][1]
+            self.version, self._last_modified = rows[ALL_SONGS_KEY]
+            self._buckets = {key: stamp for key, stamp in rows.items()
+                             if not key.startswith(('#', SONG_KEY_PREFIX))}
+            self._songs = songs
+            self._song_floor = rows[SONG_FLOOR_KEY]
+        return True
+    
+    def bump(self, bucket_keys=(), song_ids=(), version=None, changed_at=None, song_floor=False):
+        """
+        Record a catalog write touching the given emotion buckets and songs.
+        
+        version and changed_at are the shared stamp the writer stored for the
+        change (song_floor when it compacted the per-song rows). Without them
+        the change gets a local version and this process stops sharing ETags.
+        """
+        with self._lock:
+            if version is None:
+                if self.shared:
+                    self.generation = uuid.uuid4().hex[:8]
+                    self.shared = False
+                stamp = (self.version + 1, self._now())
+            else:
+                stamp = self._stamp(version, changed_at)
+            # Changes applied out of order never move a version back
+            self.version = max(self.version, stamp[0])
+            self._last_modified = max(self._last_modified, stamp[1])
+            for key in set(bucket_keys) | {ALL_SONGS_KEY}:
+                if self._buckets.get(key, (0,))[0] < stamp[0]:
+                    self._buckets[key] = stamp
+            if song_floor:
+                self._songs.clear()
+                self._song_floor = stamp
+            for song_id in song_ids:
+                if self._songs.get(song_id, (0,))[0] < stamp[0]:
+                    self._songs[song_id] = stamp
+                    self._songs.move_to_end(song_id)
+            # Shared song rows are compacted by the writers (song_floor) instead
+            while not self.shared and len(self._songs) > self.max_songs:
+                self._songs.popitem(last=False)
+                self._song_floor = stamp
+            return self.version
+    
+    def catalog(self):
+        """Return (version, last_modified) for the whole catalog"""
+        with self._lock:
+            return self.version, self._last_modified
+    
+    def bucket(self, key):
+        """Return (version, last_modified) for one emotion bucket"""
+        with self._lock:
+            return self._buckets.get(key, (0, self._started))
+    
+    def song(self, song_id):
+        """Return (version, last_modified) for one song"""
+        with self._lock:
+            return self._songs.get(song_id, self._song_floor)
+    
+    def etag(self, *parts):
+        """Build a strong ETag value from version parts"""
+        return '-'.join([self.generation] + [str(part) for part in parts])
+
+
+# Serialized GET /api/songs responses as (bucket version, {media type: body}),
+# keyed by normalized emotion (ALL_SONGS_KEY for the unfiltered list)
+song_cache = LRUCache()
+ALL_SONGS_KEY = '*'
+
+catalog_version = CatalogVersion()
+
+
+def emotion_cache_key(emotion):
+    """Normalize an emotion filter into a song_cache key"""
+    return emotion.lower() if emotion else ALL_SONGS_KEY
+
+
+def song_list_bodies(cache_key, version):
+    """Encoded bodies of one song list at version, by media type; fill in missing encodings"""
+    cached = song_cache.get(cache_key)
+    if cached is None or cached[0] != version:
+        cached = (version, {})
+        song_cache.set(cache_key, cached)
+    return cached[1]
+
+
+def catalog_changed(emotions=(), song_ids=(), **stamp):
+    """Bump catalog versions (to the change's shared stamp, if any) and drop cached lists after songs are written"""
+    keys = {emotion_cache_key(emotion) for emotion in emotions if emotion}
+    catalog_version.bump(keys, song_ids, **stamp)
+    song_cache.invalidate(ALL_SONGS_KEY, *keys)
@@ -0,0 +1,26 @@
+"""
+HTTP conditional request helpers (ETag / Last-Modified / 304) for catalog endpoints
+"""
+from flask import Response, current_app, request
+
+
+def is_not_modified(etag, last_modified):
+    """Check the request's validators; If-None-Match takes precedence over If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def add_cache_headers(response, etag, last_modified):
+    """Attach validators and Cache-Control to a catalog response"""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = current_app.config['CATALOG_CACHE_CONTROL']
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    """Build an empty 304 response carrying the current validators"""
+    return add_cache_headers(Response(status=304), etag, last_modified)
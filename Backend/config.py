@@ -14,20 +14,146 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # Embed the user's profile in access tokens so /auth/me needs no database query
+    JWT_PROFILE_CLAIMS = os.environ.get('JWT_PROFILE_CLAIMS', 'false').lower() == 'true'
+    
+    # TTL+LRU cache of user profiles for protected routes
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    
+    # Password hashing: bcrypt cost and the bounded pool that runs it
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    HASH_WORKERS = int(os.environ.get('HASH_WORKERS', 4))
+    HASH_QUEUE_SIZE = int(os.environ.get('HASH_QUEUE_SIZE', 16))
     
     # Database configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'database.db')
     
+    # Read replicas: comma-separated URLs serving read-only GET routes round-robin. A client's reads
+    # stay on the primary for REPLICA_MAX_LAG seconds after its write (through the REPLICA_PIN_COOKIE
+    # cookie), so size it to the replication lag
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_HEALTH_INTERVAL = float(os.environ.get('REPLICA_HEALTH_INTERVAL', 5))
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 2))
+    REPLICA_PIN_COOKIE = os.environ.get('REPLICA_PIN_COOKIE', 'read_primary_until')
+    
     # Disable SQLAlchemy modification tracking (saves resources)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool sizing (per worker process)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    
+    # SQLite tuning: WAL lets readers proceed while a writer commits
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # negative = KiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+    
+    # ASGI serving (asgi.py): threads running the Flask routes that have no async handler
+    ASGI_WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 16))
+    
+    # Opt-in sampling profiler: dump collapsed stacks for requests slower than the threshold
+    PROFILE_SLOW_REQUESTS = os.environ.get('PROFILE_SLOW_REQUESTS', 'false').lower() == 'true'
+    PROFILE_SLOW_THRESHOLD_MS = float(os.environ.get('PROFILE_SLOW_THRESHOLD_MS', 500))
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 1.0))  # fraction of requests sampled
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))  # seconds
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'profiles')
+    
+    # Maximum number of emotion buckets kept in the in-process song cache
+    SONG_CACHE_MAX_ENTRIES = int(os.environ.get('SONG_CACHE_MAX_ENTRIES', 128))
+    
+    # Cache-Control for catalog reads; ETags let caches revalidate cheaply once stale
+    CATALOG_CACHE_CONTROL = os.environ.get('CATALOG_CACHE_CONTROL', 'public, max-age=30')
+    
+    # Upper bound on ?limit= for paginated list endpoints
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 500))
+    
+    # Full-text search: default page size, and the share of the catalog at which a
+    # term becomes too common to rank on
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+    SEARCH_STOPWORD_RATIO = float(os.environ.get('SEARCH_STOPWORD_RATIO', 0.1))
+    
+    # Rows fetched per round-trip when streaming the catalog export
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    
+    # Rows inserted per executemany/commit during bulk ingestion
+    BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+    
+    # Memory-mapped recommendation index location and vector size
+    RECOMMENDER_DIR = os.environ.get('RECOMMENDER_DIR') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'recommender')
+    RECOMMENDER_DIM = int(os.environ.get('RECOMMENDER_DIM', 32))
+    # Days of play_events that feed the popularity signal
+    RECOMMENDER_POPULARITY_DAYS = float(os.environ.get('RECOMMENDER_POPULARITY_DAYS', 30))
+    
+    # Listening-event buffering: group commit on size or interval, spooled to disk first
+    EVENT_SPOOL_DIR = os.environ.get('EVENT_SPOOL_DIR') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'event_spool')
+    EVENT_FLUSH_SIZE = int(os.environ.get('EVENT_FLUSH_SIZE', 500))
+    EVENT_FLUSH_INTERVAL = float(os.environ.get('EVENT_FLUSH_INTERVAL', 1.0))
+    EVENT_SPOOL_FSYNC = os.environ.get('EVENT_SPOOL_FSYNC', 'false').lower() == 'true'
+    EVENT_MAX_BATCH = int(os.environ.get('EVENT_MAX_BATCH', 1000))
+    # Seconds the popularity refresh queued by a flush waits, so flushes in between share it
+    EVENT_FLUSH_JOB_DELAY = float(os.environ.get('EVENT_FLUSH_JOB_DELAY', 60))
+    
+    # Per-user emotion/genre affinities: memory-mapped table location and size, score
+    # slots per user, decay half-life, and Cache-Control of personalized song lists
+    AFFINITY_DIR = os.environ.get('AFFINITY_DIR') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'affinity')
+    AFFINITY_MAX_USERS = int(os.environ.get('AFFINITY_MAX_USERS', 1 << 22))
+    AFFINITY_EMOTION_SLOTS = int(os.environ.get('AFFINITY_EMOTION_SLOTS', 8))
+    AFFINITY_GENRE_SLOTS = int(os.environ.get('AFFINITY_GENRE_SLOTS', 24))
+    AFFINITY_HALF_LIFE_DAYS = float(os.environ.get('AFFINITY_HALF_LIFE_DAYS', 30))
+    AFFINITY_CACHE_CONTROL = os.environ.get('AFFINITY_CACHE_CONTROL', 'private, no-cache')
+    
+    # Token-bucket limits ("<tokens>/<second|minute|hour|day>") on the bcrypt-heavy auth
+    # endpoints, per client IP and per login name; memory:// or a redis:// URL for storage
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL', 'memory://')
+    RATE_LIMITS = {
+        'login_ip': os.environ.get('RATE_LIMIT_LOGIN_IP', '20/minute'),
+        'login_account': os.environ.get('RATE_LIMIT_LOGIN_ACCOUNT', '5/minute'),
+        'register_ip': os.environ.get('RATE_LIMIT_REGISTER_IP', '5/minute'),
+    }
+    # Reverse proxies in front of the app whose X-Forwarded-For entry is trusted for the client IP
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 0))
+    
+    # Cache invalidation bus: each worker polls the cache_invalidations change log every
+    # POLL_INTERVAL seconds for other workers' catalog and user changes; rows are kept RETENTION seconds
+    INVALIDATION_ENABLED = os.environ.get('INVALIDATION_ENABLED', 'true').lower() == 'true'
+    INVALIDATION_POLL_INTERVAL = float(os.environ.get('INVALIDATION_POLL_INTERVAL', 0.5))
+    INVALIDATION_RETENTION = float(os.environ.get('INVALIDATION_RETENTION', 3600))
+    
+    # Background jobs (jobs table): worker threads per process (0 leaves them to run_jobs.py),
+    # idle poll interval, attempts per job, exponential retry backoff, the lease after which a
+    # running job whose worker died is requeued, and how long finished jobs are kept (seconds)
+    JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', 30))
+    JOB_BACKOFF_MAX = float(os.environ.get('JOB_BACKOFF_MAX', 3600))
+    JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 300))
+    JOB_RETENTION = float(os.environ.get('JOB_RETENTION', 86400))
+    
+    # Song link enrichment: "module:function" fetching a URL's HTTP status (links:offline_fetch
+    # only normalizes), per-check timeout in seconds, and pending songs queued per enrich_pending job
+    LINK_FETCHER = os.environ.get('LINK_FETCHER', 'links:http_fetch')
+    LINK_CHECK_TIMEOUT = float(os.environ.get('LINK_CHECK_TIMEOUT', 5))
+    LINK_ENRICH_BATCH = int(os.environ.get('LINK_ENRICH_BATCH', 500))
+    
     # Enable debug mode (set to False in production)
     DEBUG = True
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 10))
 
 class ProductionConfig(Config):
     """Production configuration"""
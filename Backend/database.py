@@ -0,0 +1,87 @@
+"""
+Database engine tuning: SQLite pragmas and connection pool sizing
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def normalize_database_uri(uri):
+    """Accept the legacy postgres:// scheme used by some hosting providers"""
+    if uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def is_sqlite_memory(url):
+    """Check whether a SQLite URL points at an in-memory database"""
+    return url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """Build SQLAlchemy create_engine options for the configured backend"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {
+        'pool_pre_ping': True,
+    }
+    
+    if url.get_backend_name() == 'sqlite':
+        if not is_sqlite_memory(url):
+            options.update(
+                pool_size=config['DB_POOL_SIZE'],
+                max_overflow=config['DB_MAX_OVERFLOW'],
+                pool_timeout=config['DB_POOL_TIMEOUT'],
+            )
+        # Let the busy_timeout pragma decide how long writers wait for locks
+        options['connect_args'] = {
+            'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+            'check_same_thread': False
+        }
+    else:
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+    return options
+
+
+def sqlite_pragmas(config):
+    """Return the PRAGMA statements applied to every new SQLite connection"""
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def install_sqlite_pragmas(engine, config):
+    """Run sqlite_pragmas on every connection the engine opens"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config)
+    if is_sqlite_memory(engine.url):
+        # WAL does not apply to in-memory databases
+        pragmas = [pragma for pragma in pragmas if 'journal_mode' not in pragma]
+    
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def init_database(app, db):
+    """Configure engine options before db.init_app and tune connections after it"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    
+    db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, app.config)
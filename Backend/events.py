@@ -0,0 +1,380 @@
+"""
+Buffered listening-event and mood-selection ingestion with group commits and a crash-safe spool
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy.exc import DataError, IntegrityError
+from jobs import job_queue
+from models import db, parse_timestamp, Job, MoodSelection, PlayEvent, Song
+
+
+def _pid_alive(pid):
+    """Check whether a process with the given pid is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def validate_events(raw_events, user_id):
+    """
+    Validate raw event dicts into insert-ready rows.
+    
+    Returns (rows, errors) where errors lists {'index': i, 'error': message}.
+    Events for songs that do not exist are rejected here, with one query per
+    batch, so they never reach a group commit.
+    """
+    candidates = []
+    errors = []
+    for index, event in enumerate(raw_events):
+        if not isinstance(event, dict):
+            errors.append({'index': index, 'error': 'Event must be an object'})
+            continue
+        
+        song_id = event.get('song_id')
+        event_type = event.get('event_type')
+        if not isinstance(song_id, int) or isinstance(song_id, bool):
+            errors.append({'index': index, 'error': 'song_id must be an integer'})
+            continue
+        if event_type not in PlayEvent.EVENT_TYPES:
+            errors.append({'index': index, 'error': f"event_type must be one of {', '.join(PlayEvent.EVENT_TYPES)}"})
+            continue
+        
+        played_at = event.get('played_at')
+        try:
+            played_at = parse_timestamp(played_at) if played_at else datetime.utcnow()
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'played_at must be an ISO-8601 timestamp'})
+            continue
+        
+        duration_ms = event.get('duration_ms')
+        if duration_ms is not None and (not isinstance(duration_ms, int) or duration_ms < 0):
+            errors.append({'index': index, 'error': 'duration_ms must be a non-negative integer'})
+            continue
+        
+        candidates.append((index, {
+            'event_uid': str(event.get('event_uid') or uuid.uuid4())[:36],
+            'user_id': user_id,
+            'song_id': song_id,
+            'event_type': event_type,
+            'duration_ms': duration_ms,
+            'played_at': played_at.isoformat()
+        }))
+    
+    rows = []
+    if candidates:
+        song_ids = {row['song_id'] for _, row in candidates}
+        known = set(db.session.execute(db.select(Song.song_id).where(Song.song_id.in_(song_ids))).scalars())
+        for index, row in candidates:
+            if row['song_id'] in known:
+                rows.append(row)
+            else:
+                errors.append({'index': index, 'error': 'song_id does not exist'})
+        errors.sort(key=lambda error: error['index'])
+    return rows, errors
+
+
+def mood_selection(user_id, emotion):
+    """Insert-ready mood_selections row for a user choosing emotion now"""
+    return {
+        'event_uid': str(uuid.uuid4()),
+        'user_id': user_id,
+        'emotion_key': Song.normalize_emotion(emotion),
+        'selected_at': datetime.utcnow().isoformat()
+    }
+
+
+class EventBuffer:
+    """
+    Buffers event rows for one model in memory and writes them in group commits.
+    
+    Every accepted batch is appended to a per-process spool file before it is
+    acknowledged. A flush rotates the spool, inserts the buffered rows in one
+    transaction and then deletes the rotated file, so a crash at any point
+    leaves the events on disk for the next process to replay. Inserts ignore
+    duplicate event_uids, which makes replaying an already-committed spool safe.
+    Rows the database rejects (e.g. a song deleted after the event was
+    accepted) are appended to a <name>.rejected file instead of blocking
+    every later flush.
+    """
+    
+    def __init__(self, model, name, timestamp_field, flush_job=None):
+        self.model = model
+        # Spool file prefix and flush thread name; must not contain '-'
+        self.name = name
+        # ISO-8601 column spooled as text and parsed back before inserting
+        self.timestamp_field = timestamp_field
+        # Job kind queued after a flush writes rows, e.g. to recompute aggregates over them
+        self.flush_job = flush_job
+        self.flush_job_delay = 60.0
+        self.app = None
+        self.spool_dir = None
+        self.flush_size = 500
+        self.flush_interval = 1.0
+        self.fsync = False
+        self._buffer = []
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._stopped = threading.Event()
+        # Process that last configured this buffer; spools named with its pid are its own
+        self._pid = None
+        self.flushed = 0
+        self.flushes = 0
+        self.rejected = 0
+    
+    def init_app(self, app):
+        """Configure spool location and flush thresholds"""
+        self.app = app
+        self.spool_dir = app.config['EVENT_SPOOL_DIR']
+        self.flush_size = app.config['EVENT_FLUSH_SIZE']
+        self.flush_interval = app.config['EVENT_FLUSH_INTERVAL']
+        self.fsync = app.config['EVENT_SPOOL_FSYNC']
+        self.flush_job_delay = app.config['EVENT_FLUSH_JOB_DELAY']
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Until now nothing in this process has spooled, so files carrying its pid were
+        # left by an earlier process that had the same pid (common after container restarts)
+        fresh = self._pid != os.getpid()
+        self._pid = os.getpid()
+        self._claim_orphaned_spools(include_own=fresh)
+        if self._pending:
+            self._ensure_timer()
+    
+    @property
+    def spool_path(self):
+        """Spool file for this process"""
+        return os.path.join(self.spool_dir, f'{self.name}-{os.getpid()}.spool')
+    
+    def _claim_orphaned_spools(self, include_own=False):
+        """Queue spool files left behind by processes that are no longer running"""
+        queued = {path for path, _ in self._pending}
+        for path in glob.glob(os.path.join(self.spool_dir, f'{self.name}-*.spool*')):
+            pid = int(os.path.basename(path).split('-')[1].split('.')[0])
+            if path in queued:
+                continue
+            if pid == os.getpid():
+                if not include_own:
+                    continue
+            elif _pid_alive(pid):
+                continue
+            claimed = f'{self.spool_path}.{time.time_ns()}'
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            self._pending.append((claimed, None))
+    
+    def after_fork(self):
+        """Reset threads and locks inherited from a preloaded parent and take over its spools"""
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._timer = None
+        self._buffer = []
+        inherited, self._pending = self._pending, []
+        if self.spool_dir is None:
+            return
+        # Every sibling inherits the same list; the rename decides which worker replays each spool
+        for path, _ in inherited:
+            claimed = f'{self.spool_path}.{time.time_ns()}'
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            self._pending.append((claimed, None))
+        # A forked worker has not spooled anything yet either
+        self._pid = os.getpid()
+        self._claim_orphaned_spools(include_own=True)
+        if self._pending:
+            self._ensure_timer()
+    
+    def add(self, rows):
+        """Spool rows to disk, buffer them, and flush once the buffer is large enough"""
+        self._ensure_timer()
+        lines = ''.join(json.dumps(row) + '\n' for row in rows)
+        with self._lock:
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._buffer.extend(rows)
+            should_flush = len(self._buffer) >= self.flush_size
+        
+        if should_flush:
+            # The rows are spooled, so a failed flush is retried by the timer instead of failing the request
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f'Event flush failed ({self.name}): {e}')
+    
+    def flush(self):
+        """Group-commit buffered and spooled events; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                if self._buffer:
+                    rotated = f'{self.spool_path}.{time.time_ns()}'
+                    os.replace(self.spool_path, rotated)
+                    self._pending.append((rotated, self._buffer))
+                    self._buffer = []
+                pending, self._pending = self._pending, []
+            
+            written = 0
+            for index, (path, rows) in enumerate(pending):
+                if rows is None:
+                    try:
+                        rows = self._read_spool(path)
+                    except FileNotFoundError:
+                        # Claimed and replayed by a forked worker
+                        continue
+                rejected = []
+                try:
+                    try:
+                        self._insert(rows)
+                    except (IntegrityError, DataError):
+                        # One bad row fails the whole batch: write the others and set it aside
+                        db.session.rollback()
+                        rejected = self._insert_each(rows)
+                except Exception:
+                    db.session.rollback()
+                    # Keep this and every later spool for the next attempt
+                    with self._lock:
+                        self._pending[:0] = [(p, r) for p, r in pending[index:]]
+                    raise
+                self._reject(rejected)
+                os.remove(path)
+                written += len(rows) - len(rejected)
+            
+            self.flushed += written
+            if written:
+                self.flushes += 1
+                self._queue_flush_job()
+            return written
+    
+    def _queue_flush_job(self):
+        """
+        Queue flush_job unless one is already waiting. It runs flush_job_delay
+        seconds later, so a burst of flushes from every worker triggers one run.
+        """
+        if self.flush_job is None:
+            return
+        try:
+            waiting = db.session.execute(
+                db.select(Job.id).where(Job.kind == self.flush_job, Job.status == 'queued').limit(1)
+            ).first()
+            if waiting is None:
+                job_queue.enqueue(self.flush_job, delay=self.flush_job_delay)
+                db.session.commit()
+                job_queue.wake()
+        except Exception as e:
+            # The rows are written; the next flush queues the job instead
+            db.session.rollback()
+            self.app.logger.error(f'Could not queue {self.flush_job} after an event flush: {e}')
+    
+    def _read_spool(self, path):
+        """Load rows from a spool file, ignoring a torn final line"""
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    break
+        return rows
+    
+    def _insert(self, rows):
+        """Insert rows in one transaction, skipping event_uids that already exist"""
+        if not rows:
+            return
+        field = self.timestamp_field
+        rows = [dict(row, **{field: parse_timestamp(row[field])}) for row in rows]
+        table = self.model.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects import sqlite
+            stmt = sqlite.insert(table).on_conflict_do_nothing(index_elements=['event_uid'])
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects import postgresql
+            stmt = postgresql.insert(table).on_conflict_do_nothing(index_elements=['event_uid'])
+        else:
+            stmt = db.insert(table)
+        db.session.execute(stmt, rows)
+        db.session.commit()
+    
+    def _insert_each(self, rows):
+        """Insert rows one transaction at a time; returns the rows the database rejected"""
+        rejected = []
+        for row in rows:
+            try:
+                self._insert([row])
+            except (IntegrityError, DataError):
+                db.session.rollback()
+                rejected.append(row)
+        return rejected
+    
+    def _reject(self, rows):
+        """Append rows the database refused to the rejected-events file for inspection"""
+        if not rows:
+            return
+        path = os.path.join(self.spool_dir, f'{self.name}.rejected')
+        with self._lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(row) + '\n' for row in rows))
+            self.rejected += len(rows)
+        self.app.logger.warning(f'Rejected {len(rows)} {self.name} row(s) the database refused; see {path}')
+    
+    def _ensure_timer(self):
+        """Start the background flush thread on first use"""
+        if self._timer is not None:
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._run_timer, name=f'{self.name}-flush', daemon=True)
+                self._timer.start()
+                atexit.register(self.stop)
+    
+    def _run_timer(self):
+        """Flush on a fixed interval until stopped"""
+        while not self._stopped.wait(self.flush_interval):
+            self._flush_in_context()
+    
+    def _flush_in_context(self):
+        """Flush inside an application context, logging instead of raising"""
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f'Event flush failed ({self.name}): {e}')
+    
+    def stop(self):
+        """Stop the timer and write out whatever is still buffered"""
+        self._stopped.set()
+        self._flush_in_context()
+    
+    def stats(self):
+        """Return buffer depth and flush counters"""
+        with self._lock:
+            return {
+                'buffered': len(self._buffer),
+                'pending_spools': len(self._pending),
+                'flushed': self.flushed,
+                'flushes': self.flushes,
+                'rejected': self.rejected,
+                'flush_size': self.flush_size,
+                'flush_interval': self.flush_interval
+            }
+
+
+event_buffer = EventBuffer(PlayEvent, 'events', 'played_at', flush_job='refresh_popularity')
+mood_buffer = EventBuffer(MoodSelection, 'moods', 'selected_at')
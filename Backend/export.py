@@ -0,0 +1,41 @@
+"""
+Streaming NDJSON export of the song catalog
+"""
+import json
+from models import db, parse_timestamp, Song
+
+# Columns written for every exported song
+EXPORT_FIELDS = Song.FIELDS + ('updated_at',)
+
+
+def parse_since(raw):
+    """Parse the ?since= ISO-8601 timestamp as naive UTC, raising ValueError when malformed"""
+    if not raw:
+        return None
+    return parse_timestamp(raw)
+
+
+def iter_songs_ndjson(emotion=None, since=None, batch_size=1000):
+    """
+    Yield the catalog as newline-delimited JSON, one song per line.
+    
+    Rows are ordered by (updated_at, song_id) and fetched batch_size at a time,
+    so memory use does not depend on catalog size. since is inclusive; clients
+    resume by passing the last updated_at they saw and skipping seen song_ids.
+    """
+    columns = [getattr(Song, field) for field in EXPORT_FIELDS]
+    stmt = db.select(*columns)
+    if emotion:
+        stmt = stmt.where(Song.emotion_key == Song.normalize_emotion(emotion))
+    if since is not None:
+        stmt = stmt.where(Song.updated_at >= since)
+    stmt = stmt.order_by(Song.updated_at, Song.song_id)
+    
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    try:
+        for row in result:
+            song = dict(zip(EXPORT_FIELDS, row))
+            song['updated_at'] = song['updated_at'].isoformat()
+            yield json.dumps(song) + '\n'
+    finally:
+        result.close()
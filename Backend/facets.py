@@ -0,0 +1,105 @@
+"""
+Materialized emotion x genre song counts (song_facets), kept in step with songs
+"""
+from collections import Counter
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from models import db, Song, SongFacet
+
+# Rows for the emotions endpoint, one per facet
+FACETS_QUERY = db.select(SongFacet.emotion_tag, SongFacet.genre, SongFacet.song_count) \
+    .order_by(SongFacet.emotion_tag, SongFacet.genre)
+
+
+def facet_key(emotion_tag, genre):
+    """song_facets primary key for a song's emotion_tag and genre"""
+    return emotion_tag, genre or ''
+
+
+def apply_deltas(conn, deltas):
+    """Add per-facet count changes to song_facets in the connection's transaction"""
+    rows = [
+        {'emotion_tag': emotion_tag, 'genre': genre, 'song_count': delta}
+        for (emotion_tag, genre), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    if conn.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    stmt = insert(SongFacet.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['emotion_tag', 'genre'],
+        set_={'song_count': SongFacet.song_count + stmt.excluded.song_count}
+    )
+    conn.execute(stmt, rows)
+    if any(row['song_count'] < 0 for row in rows):
+        conn.execute(SongFacet.__table__.delete().where(SongFacet.song_count <= 0))
+
+
+def record_inserted(songs):
+    """Count songs inserted through Core (bulk loads); call before committing the insert"""
+    deltas = Counter(facet_key(song['emotion_tag'], song.get('genre')) for song in songs)
+    apply_deltas(db.session.connection(), deltas)
+
+
+def rebuild(conn):
+    """Recount every facet from the songs table"""
+    conn.execute(SongFacet.__table__.delete())
+    conn.execute(text(
+        "INSERT INTO song_facets (emotion_tag, genre, song_count) "
+        "SELECT emotion_tag, coalesce(genre, ''), count(*) FROM songs "
+        "GROUP BY emotion_tag, coalesce(genre, '')"
+    ))
+
+
+def emotions_body(rows, counts=False):
+    """
+    Build the /api/songs/emotions response from FACETS_QUERY rows.
+    
+    Song lists match emotions case-insensitively (on emotion_key), so tags
+    differing only in case are one emotion here too: listed under the first
+    spelling, counted under its emotion_key.
+    """
+    names = {}
+    for emotion_tag, _, _ in rows:
+        names.setdefault(Song.normalize_emotion(emotion_tag), emotion_tag)
+    body = {'emotions': list(names.values())}
+    if counts:
+        totals = dict.fromkeys(names, 0)
+        facets = {}
+        for emotion_tag, genre, song_count in rows:
+            emotion_key = Song.normalize_emotion(emotion_tag)
+            totals[emotion_key] += song_count
+            facets[emotion_key, genre] = facets.get((emotion_key, genre), 0) + song_count
+        body['total'] = sum(totals.values())
+        body['counts'] = totals
+        body['facets'] = [
+            {'emotion_tag': names[emotion_key], 'emotion_key': emotion_key, 'genre': genre or None, 'count': song_count}
+            for (emotion_key, genre), song_count in facets.items()
+        ]
+    return body
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_flushed_songs(session, flush_context):
+    """Apply facet changes for songs added, deleted or re-tagged through the ORM"""
+    deltas = Counter()
+    for song in session.new:
+        if isinstance(song, Song):
+            deltas[facet_key(song.emotion_tag, song.genre)] += 1
+    for song in session.deleted:
+        if isinstance(song, Song):
+            deltas[facet_key(song.emotion_tag, song.genre)] -= 1
+    for song in session.dirty:
+        if not isinstance(song, Song):
+            continue
+        state = inspect(song)
+        emotion, genre = state.attrs.emotion_tag.history, state.attrs.genre.history
+        if emotion.has_changes() or genre.has_changes():
+            old_emotion = (emotion.deleted or emotion.unchanged or [song.emotion_tag])[0]
+            old_genre = (genre.deleted or genre.unchanged or [song.genre])[0]
+            deltas[facet_key(old_emotion, old_genre)] -= 1
+            deltas[facet_key(song.emotion_tag, song.genre)] += 1
+    apply_deltas(session.connection(), deltas)
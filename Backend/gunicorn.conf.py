@@ -0,0 +1,19 @@
+"""
+Gunicorn settings: load the app once in the master and fork workers from it
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import and build the app before forking so workers share its pages copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    """Load lazily imported modules in the master before the first worker forks"""
+    from prefork import warm_up
+    from wsgi import app
+    warm_up(app)
@@ -0,0 +1,144 @@
+"""
+Bounded worker pool for bcrypt password hashing
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+from metrics import timed
+from models import bcrypt
+
+
+class HashQueueFull(Exception):
+    """Raised when every hashing worker is busy and the wait queue is full"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated thread pool with a bounded queue and latency metrics"""
+    
+    def __init__(self, app=None):
+        self.max_workers = 4
+        self.max_queue = 16
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._reset_metrics()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Size the pool from HASH_WORKERS and HASH_QUEUE_SIZE"""
+        self.max_workers = app.config['HASH_WORKERS']
+        self.max_queue = app.config['HASH_QUEUE_SIZE']
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = None
+    
+    def after_fork(self):
+        """Drop the pool inherited from a preloaded parent; its threads do not survive fork"""
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._reset_metrics()
+    
+    def _reset_metrics(self):
+        """Zero the queue and latency counters"""
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.rejected = 0
+        self._latency = {}
+    
+    def _ensure_executor(self):
+        """Create the pool on first use"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='bcrypt')
+                self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+    
+    def _record(self, kind, seconds):
+        """Record the latency of one hash or check"""
+        with self._lock:
+            stats = self._latency.setdefault(kind, {'count': 0, 'seconds_total': 0.0, 'seconds_max': 0.0})
+            stats['count'] += 1
+            stats['seconds_total'] += seconds
+            stats['seconds_max'] = max(stats['seconds_max'], seconds)
+    
+    def _release(self, slots):
+        """Free a queue slot once a task finishes"""
+        with self._lock:
+            self.in_flight -= 1
+        slots.release()
+    
+    def _submit(self, kind, fn, *args):
+        """Queue fn on the pool and return its future, or raise HashQueueFull"""
+        self._ensure_executor()
+        executor, slots = self._executor, self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashQueueFull('Password hashing queue is full')
+        
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        
+        def task():
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self._record(kind, time.perf_counter() - start)
+        
+        future = executor.submit(task)
+        future.add_done_callback(lambda _: self._release(slots))
+        return future
+    
+    def _run(self, kind, fn, *args):
+        """Run fn on the pool and wait for it"""
+        with timed('hash_seconds'):
+            return self._submit(kind, fn, *args).result()
+    
+    async def _run_async(self, kind, fn, *args):
+        """Run fn on the pool without blocking the event loop"""
+        with timed('hash_seconds'):
+            return await asyncio.wrap_future(self._submit(kind, fn, *args))
+    
+    def hash(self, password):
+        """Return a bcrypt hash of password using the configured log rounds"""
+        return self._run('hash', bcrypt.generate_password_hash, password).decode('utf-8')
+    
+    def check(self, password_hash, password):
+        """Check password against a bcrypt hash"""
+        return self._run('check', bcrypt.check_password_hash, password_hash, password)
+    
+    async def hash_async(self, password):
+        """Awaitable hash() for async request handlers"""
+        return (await self._run_async('hash', bcrypt.generate_password_hash, password)).decode('utf-8')
+    
+    async def check_async(self, password_hash, password):
+        """Awaitable check() for async request handlers"""
+        return await self._run_async('check', bcrypt.check_password_hash, password_hash, password)
+    
+    def stats(self):
+        """Return queue depth, rejection count and per-operation latency"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'queue_size': self.max_queue,
+                'in_flight': self.in_flight,
+                'queued': max(self.in_flight - self.max_workers, 0),
+                'peak_in_flight': self.peak_in_flight,
+                'rejected': self.rejected,
+                'latency': {kind: dict(stats) for kind, stats in self._latency.items()}
+            }
+
+
+def hash_rounds(password_hash):
+    """Return the bcrypt cost encoded in a $2b$NN$... hash, or None if unparseable"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+password_hasher = PasswordHasher()
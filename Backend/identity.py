@@ -0,0 +1,107 @@
+"""
+Cached identity resolution for JWT-protected routes
+"""
+import threading
+import time
+from flask import current_app
+from flask_jwt_extended import JWTManager, get_jwt, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from cache import LRUCache
+from models import User
+
+# User.to_dict() results keyed by user id
+user_cache = LRUCache(max_entries=10000, ttl=60)
+
+# Wall-clock time of each user's last profile change, kept for one access-token
+# lifetime: a token issued before the change must not serve its embedded profile
+profile_changes = LRUCache(max_entries=100000, ttl=3600)
+
+
+class TimedJWTManager(JWTManager):
+    """JWTManager that records how long token decoding and verification take"""
+    
+    def __init__(self, app=None, **kwargs):
+        self._decode_lock = threading.Lock()
+        self.decode_count = 0
+        self.decode_seconds_total = 0.0
+        self.decode_seconds_max = 0.0
+        super().__init__(app, **kwargs)
+    
+    def _decode_jwt_from_config(self, *args, **kwargs):
+        """Decode a token, timing the call"""
+        start = time.perf_counter()
+        try:
+            return super()._decode_jwt_from_config(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._decode_lock:
+                self.decode_count += 1
+                self.decode_seconds_total += elapsed
+                self.decode_seconds_max = max(self.decode_seconds_max, elapsed)
+    
+    def decode_stats(self):
+        """Return token decode count and latency"""
+        with self._decode_lock:
+            return {
+                'count': self.decode_count,
+                'seconds_total': self.decode_seconds_total,
+                'seconds_max': self.decode_seconds_max,
+                'seconds_mean': self.decode_seconds_total / self.decode_count if self.decode_count else 0.0
+            }
+
+
+def init_identity(app):
+    """Size the identity caches from configuration"""
+    user_cache.max_entries = app.config['USER_CACHE_MAX_ENTRIES']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+    profile_changes.ttl = app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+
+
+def get_user_profile(user_id):
+    """Return User.to_dict() for user_id from the cache or the database, or None"""
+    profile = user_cache.get(user_id)
+    if profile is None:
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        profile = user.to_dict()
+        user_cache.set(user_id, profile)
+    return profile
+
+
+def profile_claims(user):
+    """Extra access-token claims embedding the user's profile, when enabled"""
+    if not current_app.config['JWT_PROFILE_CLAIMS']:
+        return None
+    profile = user.to_dict() if isinstance(user, User) else user
+    return {'profile': profile}
+
+
+def profile_from_token():
+    """Return the profile embedded in the current access token if it is still current"""
+    claims = get_jwt()
+    profile = claims.get('profile')
+    if not profile:
+        return None
+    changed_at = profile_changes.get(profile['id'])
+    if changed_at is not None and changed_at >= claims['iat']:
+        return None
+    return profile
+
+
+def user_changed(user_id):
+    """Forget cached state for a user after an update or delete"""
+    user_cache.invalidate(user_id)
+    # Tokens carry whole-second iat values, so round the change time up
+    profile_changes.set(user_id, int(time.time()) + 1)
+
+
+def optional_user_id():
+    """User id of a valid access token on a public route; anonymous (None) when absent or invalid"""
+    try:
+        verify_jwt_in_request(optional=True)
+    except (JWTExtendedException, PyJWTError):
+        return None
+    identity = get_jwt_identity()
+    return int(identity) if identity is not None else None
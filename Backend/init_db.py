@@ -4,12 +4,16 @@ Populates the songs table with sample data
 """
 from app import create_app
 from models import db, Song
+from bulk import insert_songs, validate_rows
+from migrations import upgrade
 
 def init_songs():
     """Initialize songs table with sample data"""
     app = create_app('development')
     
     with app.app_context():
+        upgrade(db.engine)
+        
         # Check if songs already exist
         if Song.query.count() > 0:
             print(f"Database already has {Song.query.count()} songs. Skipping initialization.")
@@ -46,12 +50,9 @@ def init_songs():
             {'title': 'Breathe', 'artist': 'Telepopmusik', 'genre': 'Electronic', 'emotion_tag': 'Relaxed', 'link': 'https://www.youtube.com/watch?v=vyut3GyQtn0'},
         ]
         
-        # Add songs to database
-        for song_data in songs_data:
-            song = Song.from_dict(song_data)
-            db.session.add(song)
-        
-        db.session.commit()
+        # Add songs to database in one executemany batch
+        songs, _ = validate_rows(songs_data)
+        insert_songs(songs)
         print(f"Successfully added {len(songs_data)} songs to the database!")
         
         # Print summary
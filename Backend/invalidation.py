@@ -0,0 +1,307 @@
+"""
+Cache invalidation bus: catalog and user changes reach the in-process caches of every worker and node
+"""
+import atexit
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, or_, select, update
+from cache import (ALL_SONGS_KEY, SONG_FLOOR_KEY, SONG_KEY_PREFIX, catalog_changed, catalog_version,
+                   emotion_cache_key, song_cache, song_version_key)
+from identity import user_cache, user_changed
+from models import db, CacheInvalidation, CatalogStamp
+from recommender import recommendation_index
+from replicas import replica_router
+
+SONGS = 'songs'
+USERS = 'users'
+
+# PostgreSQL hands out ids before commit, so a lower id can become visible after a
+# higher one; ids skipped by a poll are looked for again for this many seconds
+GAP_TIMEOUT = 10.0
+MAX_GAP = 1000
+
+
+def record_catalog_change(conn, emotions, song_ids):
+    """
+    Give a song change the next shared catalog version in the writer's transaction.
+    
+    Stores the version on the whole catalog ('*'), the touched emotion buckets
+    and songs, and returns the stamp to publish with the change. Once more than
+    catalog_version.max_songs songs have their own row, they are dropped and the
+    song floor moves up to this version instead.
+    """
+    table = CatalogStamp.__table__
+    now = datetime.utcnow()
+    # Updating '*' first also serializes concurrent writers until commit
+    conn.execute(update(table).where(table.c.key == ALL_SONGS_KEY).values(version=table.c.version + 1, changed_at=now))
+    version = conn.execute(select(table.c.version).where(table.c.key == ALL_SONGS_KEY)).scalar_one()
+    
+    keys = {emotion_cache_key(emotion) for emotion in emotions} | {song_version_key(song_id) for song_id in song_ids}
+    if keys:
+        existing = set(conn.execute(select(table.c.key).where(table.c.key.in_(keys))).scalars())
+        if existing:
+            conn.execute(update(table).where(table.c.key.in_(existing)).values(version=version, changed_at=now))
+        if keys - existing:
+            conn.execute(insert(table), [{'key': key, 'version': version, 'changed_at': now} for key in keys - existing])
+    
+    stamp = {'version': version, 'changed_at': now.isoformat()}
+    if song_ids:
+        songs = conn.execute(select(func.count()).where(table.c.key.startswith(SONG_KEY_PREFIX))).scalar()
+        if songs > catalog_version.max_songs:
+            conn.execute(delete(table).where(table.c.key.startswith(SONG_KEY_PREFIX)))
+            conn.execute(update(table).where(table.c.key == SONG_FLOOR_KEY).values(version=version, changed_at=now))
+            stamp['song_floor'] = True
+    return stamp
+
+
+def apply_change(kind, payload):
+    """Invalidate this process's caches for one published change"""
+    if kind == SONGS:
+        # Refill caches and build ETags only from replicas that have caught up with the change
+        replica_router.catalog_changed(payload.get('version'))
+        stamp = {}
+        if 'version' in payload:
+            stamp = {'version': payload['version'], 'changed_at': datetime.fromisoformat(payload['changed_at']),
+                     'song_floor': payload.get('song_floor', False)}
+        catalog_changed(payload.get('emotions', ()), payload.get('song_ids', ()), **stamp)
+        recommendation_index.mark_stale()
+    elif kind == USERS:
+        for user_id in payload.get('user_ids', ()):
+            user_changed(user_id)
+
+
+class InvalidationBus:
+    """
+    Broadcasts cache invalidations through a change-log table in the shared database.
+    
+    A worker that writes songs or users invalidates its own caches and appends
+    a row to cache_invalidations. Every worker polls the table from a background
+    thread every INVALIDATION_POLL_INTERVAL seconds and applies the rows other
+    processes published, so workers on every node using the database converge
+    within about one interval. Rows older than INVALIDATION_RETENTION are
+    pruned; a worker that could not poll for that long may have missed some,
+    so it drops all of its caches instead. Song changes also carry the shared
+    catalog version recorded with them (record_catalog_change), which every
+    worker applies, so all of them build the same ETags.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.enabled = True
+        self.poll_interval = 0.5
+        self.retention = 3600.0
+        # Identifies this process's own rows, which it has applied already
+        self.origin = uuid.uuid4().hex
+        self._last_id = None
+        self._gaps = {}
+        self._last_poll = None
+        self._last_prune = 0.0
+        self._failing = False
+        self._lock = threading.Lock()
+        self._started = False
+        self._thread = None
+        self._stopped = threading.Event()
+        self.published = 0
+        self.applied = 0
+        self.polls = 0
+        self.resets = 0
+    
+    def init_app(self, app):
+        """Configure polling and start the poller with the first request"""
+        self.app = app
+        self.enabled = app.config['INVALIDATION_ENABLED']
+        self.poll_interval = app.config['INVALIDATION_POLL_INTERVAL']
+        self.retention = app.config['INVALIDATION_RETENTION']
+        app.before_request(self.ensure_started)
+    
+    def after_fork(self):
+        """Give a forked worker its own origin and poller; it resumes from the parent's position"""
+        self.origin = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._started = False
+        self._thread = None
+        self._stopped = threading.Event()
+    
+    def ensure_started(self):
+        """
+        Load the shared catalog versions and start the poller, first noting
+        where the change log ends so no later change is missed.
+        """
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            with self.app.app_context():
+                try:
+                    if self.enabled and self._last_id is None:
+                        self._last_id = self._max_id()
+                    # Read after the log position: a change in between is then applied twice, not missed
+                    self.load_versions()
+                except Exception as e:
+                    # Not migrated yet; the poller retries
+                    self.app.logger.error(f'Cache invalidation log unavailable: {e}')
+            if self.enabled:
+                self._thread = threading.Thread(target=self._run, name='invalidation-poll', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+            self._started = True
+    
+    def load_versions(self):
+        """Mirror the shared catalog_versions table into catalog_version"""
+        table = CatalogStamp.__table__
+        with db.engine.connect() as conn:
+            rows = conn.execute(select(table.c.key, table.c.version, table.c.changed_at)).all()
+        if not catalog_version.shared:
+            # Bodies cached under local version numbers could collide with the shared ones
+            song_cache.clear()
+        return catalog_version.load(rows)
+    
+    def _max_id(self):
+        """Id of the newest change-log row, or 0"""
+        table = CacheInvalidation.__table__
+        with db.engine.connect() as conn:
+            return conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+    
+    # ---- publishing ----
+    
+    def publish(self, kind, **payload):
+        """Record a change's catalog version, broadcast it to every other worker and apply it to this process's caches"""
+        versioned = kind == SONGS and catalog_version.shared
+        if not (versioned or self.enabled):
+            apply_change(kind, payload)
+            return
+        try:
+            # Own connection: the request's session has committed and may hold loaded objects
+            with db.engine.begin() as conn:
+                if versioned:
+                    payload.update(record_catalog_change(conn, payload.get('emotions', ()), payload.get('song_ids', ())))
+                if self.enabled:
+                    conn.execute(insert(CacheInvalidation.__table__).values(
+                        kind=kind, payload=json.dumps(payload), origin=self.origin, created_at=datetime.utcnow()
+                    ))
+        except Exception as e:
+            current_app.logger.error(f'Cache invalidation publish failed ({kind}): {e}')
+            # Still invalidate locally; without a shared version this process's ETags go local
+            payload.pop('version', None)
+            apply_change(kind, payload)
+            return
+        apply_change(kind, payload)
+        if self.enabled:
+            with self._lock:
+                self.published += 1
+    
+    # ---- polling ----
+    
+    def poll(self):
+        """Apply changes other processes published since the last poll; returns how many were applied"""
+        table = CacheInvalidation.__table__
+        if self._last_id is None:
+            self._last_id = self._max_id()
+        now = time.monotonic()
+        self._gaps = {row_id: deadline for row_id, deadline in self._gaps.items() if deadline > now}
+        condition = table.c.id > self._last_id
+        if self._gaps:
+            condition = or_(condition, table.c.id.in_(list(self._gaps)))
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.kind, table.c.payload, table.c.origin).where(condition).order_by(table.c.id)
+            ).all()
+        
+        applied = 0
+        for row_id, kind, payload, origin in rows:
+            self._gaps.pop(row_id, None)
+            if row_id > self._last_id:
+                if row_id - self._last_id <= MAX_GAP:
+                    for missing in range(self._last_id + 1, row_id):
+                        self._gaps[missing] = now + GAP_TIMEOUT
+                self._last_id = row_id
+            if origin != self.origin:
+                apply_change(kind, json.loads(payload))
+                applied += 1
+        with self._lock:
+            self.polls += 1
+            self.applied += applied
+        return applied
+    
+    def prune(self):
+        """Delete change-log rows older than the retention window"""
+        table = CacheInvalidation.__table__
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        with db.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.created_at < cutoff))
+    
+    def reset(self):
+        """Drop every cached song list, ETag and profile after changes may have been missed"""
+        song_cache.clear()
+        user_cache.clear()
+        try:
+            self.load_versions()
+        except Exception:
+            catalog_version.renew()
+        recommendation_index.mark_stale()
+        with self._lock:
+            self.resets += 1
+    
+    def _run(self):
+        """Poll on a fixed interval until stopped"""
+        while not self._stopped.wait(self.poll_interval):
+            with self.app.app_context():
+                try:
+                    stalled = self._last_poll is not None and time.monotonic() - self._last_poll > self.retention
+                    if not catalog_version.shared:
+                        # Not migrated at startup, or a change could not be versioned
+                        self.load_versions()
+                    self.poll()
+                    if stalled:
+                        self.reset()
+                    self._last_poll = time.monotonic()
+                    self._failing = False
+                    # Every worker prunes, but only every tenth of the retention window
+                    if self._last_poll - self._last_prune > self.retention / 10:
+                        self.prune()
+                        self._last_prune = self._last_poll
+                except Exception as e:
+                    # Log once per outage rather than every interval
+                    if not self._failing:
+                        self.app.logger.error(f'Cache invalidation poll failed: {e}')
+                    self._failing = True
+    
+    def stop(self):
+        """Stop the poller"""
+        self._stopped.set()
+    
+    def stats(self):
+        """Return the log position, poll lag and publish/apply counters"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'origin': self.origin,
+                'shared_versions': catalog_version.shared,
+                'last_id': self._last_id,
+                'poll_interval': self.poll_interval,
+                'lag_seconds': round(time.monotonic() - self._last_poll, 3) if self._last_poll else None,
+                'pending_gaps': len(self._gaps),
+                'published': self.published,
+                'applied': self.applied,
+                'polls': self.polls,
+                'resets': self.resets,
+            }
+
+
+invalidation_bus = InvalidationBus()
+
+
+def songs_changed(emotions=(), song_ids=()):
+    """Invalidate song lists, ETags and the recommendation index in every worker after songs are written"""
+    invalidation_bus.publish(SONGS, emotions=sorted({emotion for emotion in emotions if emotion}),
+                             song_ids=list(song_ids))
+
+
+def users_changed(*user_ids):
+    """Forget cached profiles in every worker after users are updated or deleted"""
+    invalidation_bus.publish(USERS, user_ids=list(user_ids))
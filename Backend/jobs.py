@@ -0,0 +1,249 @@
+"""
+Persistent background jobs: a jobs table, worker threads with a concurrency limit, and retries with backoff
+"""
+import atexit
+import json
+import os
+import random
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, or_, select, update
+from models import db, Job
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for a job that would fail the same way on every retry"""
+
+
+class JobQueue:
+    """
+    Jobs stored in the jobs table and run by worker threads in any process.
+    
+    Handlers are registered per job kind and receive the job's JSON payload.
+    Each process runs JOB_CONCURRENCY worker threads (0 leaves jobs to
+    run_jobs.py or other processes). A worker claims a due job with a
+    conditional UPDATE, so every job runs once even with many workers on
+    many nodes. A job whose handler raises is retried after an exponential
+    backoff (JOB_BACKOFF_BASE doubled per attempt, capped at JOB_BACKOFF_MAX)
+    until it has run JOB_MAX_ATTEMPTS times; PermanentJobError fails it at
+    once. A running job whose worker died is requeued after
+    JOB_LEASE_SECONDS. Finished jobs are deleted after JOB_RETENTION
+    seconds; failed ones are kept for inspection.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.concurrency = 2
+        self.poll_interval = 1.0
+        self.max_attempts = 5
+        self.backoff_base = 30.0
+        self.backoff_max = 3600.0
+        self.lease = 300.0
+        self.retention = 86400.0
+        self.handlers = {}
+        self._threads = []
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._last_sweep = None
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+    
+    def init_app(self, app):
+        """Configure workers and retries, and start the workers with the first request"""
+        self.app = app
+        self.concurrency = app.config['JOB_CONCURRENCY']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+        self.backoff_base = app.config['JOB_BACKOFF_BASE']
+        self.backoff_max = app.config['JOB_BACKOFF_MAX']
+        self.lease = app.config['JOB_LEASE_SECONDS']
+        self.retention = app.config['JOB_RETENTION']
+        app.before_request(self.ensure_started)
+    
+    def after_fork(self):
+        """Forget the parent's worker threads; a forked worker starts its own on first request"""
+        self._threads = []
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+    
+    def handler(self, kind):
+        """Decorator registering the function that runs jobs of a kind"""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+    
+    # ---- enqueueing ----
+    
+    def enqueue(self, kind, payload=None, delay=0, conn=None):
+        """
+        Queue a job in the caller's transaction: db.session (committed by the
+        caller, who should then call wake()) or an explicit connection.
+        """
+        row = {
+            'kind': kind,
+            'payload': json.dumps(payload or {}),
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': self.max_attempts,
+            'run_after': datetime.utcnow() + timedelta(seconds=delay),
+            'created_at': datetime.utcnow(),
+        }
+        if conn is not None:
+            conn.execute(insert(Job.__table__).values(**row))
+        else:
+            db.session.add(Job(**row))
+    
+    def wake(self):
+        """Have an idle worker in this process look for jobs now instead of at its next poll"""
+        self._wake.set()
+    
+    # ---- workers ----
+    
+    @property
+    def worker_id(self):
+        """Name recorded on the jobs this process claims"""
+        return f'{socket.gethostname()}:{os.getpid()}'
+    
+    def ensure_started(self, concurrency=None):
+        """Start the worker threads on first use"""
+        concurrency = self.concurrency if concurrency is None else concurrency
+        if concurrency <= 0 or self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f'job-worker-{n}', daemon=True)
+                for n in range(concurrency)
+            ]
+            for thread in self._threads:
+                thread.start()
+            atexit.register(self.stop)
+    
+    def _work(self):
+        """Run due jobs until stopped, sleeping while there are none"""
+        while not self._stopped.is_set():
+            with self.app.app_context():
+                try:
+                    ran = self.run_one()
+                except Exception as e:
+                    self.app.logger.error(f'Job worker failed: {e}')
+                    ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+    
+    def stop(self):
+        """Stop the workers after their current job"""
+        self._stopped.set()
+        self._wake.set()
+    
+    def _sweep(self, now):
+        """Requeue jobs whose worker died and delete old finished jobs, at most once per tenth of a lease"""
+        if self._last_sweep is not None and now - self._last_sweep < timedelta(seconds=self.lease / 10):
+            return
+        self._last_sweep = now
+        table = Job.__table__
+        with db.engine.begin() as conn:
+            conn.execute(update(table).where(
+                table.c.status == 'running', table.c.locked_at < now - timedelta(seconds=self.lease)
+            ).values(status='queued', locked_by=None, locked_at=None))
+            conn.execute(delete(table).where(
+                table.c.status == 'done', table.c.finished_at < now - timedelta(seconds=self.retention)
+            ))
+    
+    def _claim(self):
+        """Mark one due job as running for this process and return it, or None"""
+        table = Job.__table__
+        now = datetime.utcnow()
+        self._sweep(now)
+        with db.engine.connect() as conn:
+            candidates = conn.execute(
+                select(table.c.id).where(table.c.status == 'queued', table.c.run_after <= now)
+                .order_by(table.c.run_after, table.c.id).limit(max(self.concurrency, 1) * 2)
+            ).scalars().all()
+        for job_id in candidates:
+            with db.engine.begin() as conn:
+                # Another worker may have claimed it since the select
+                claimed = conn.execute(update(table).where(
+                    table.c.id == job_id, table.c.status == 'queued'
+                ).values(
+                    status='running', locked_by=self.worker_id, locked_at=now, attempts=table.c.attempts + 1
+                )).rowcount
+                if claimed:
+                    return conn.execute(
+                        select(table.c.id, table.c.kind, table.c.payload, table.c.attempts, table.c.max_attempts)
+                        .where(table.c.id == job_id)
+                    ).one()._asdict()
+        return None
+    
+    def backoff(self, attempts):
+        """Seconds to wait before retrying a job that has failed attempts times, with +-10% jitter"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.9, 1.1)
+    
+    def run_one(self):
+        """Claim and run one due job; returns False when there was none"""
+        job = self._claim()
+        if job is None:
+            return False
+        
+        table = Job.__table__
+        try:
+            handler = self.handlers.get(job['kind'])
+            if handler is None:
+                raise PermanentJobError(f"No handler for job kind {job['kind']!r}")
+            handler(json.loads(job['payload']))
+        except Exception as e:
+            db.session.rollback()
+            now = datetime.utcnow()
+            error = f'{type(e).__name__}: {e}'
+            if isinstance(e, PermanentJobError) or job['attempts'] >= job['max_attempts']:
+                values = {'status': 'failed', 'finished_at': now}
+                counter = 'failed'
+                self.app.logger.warning(f"Job {job['id']} ({job['kind']}) failed: {error}")
+            else:
+                values = {'status': 'queued', 'run_after': now + timedelta(seconds=self.backoff(job['attempts']))}
+                counter = 'retried'
+            values.update(locked_by=None, locked_at=None, last_error=error[:2000])
+        else:
+            values = {'status': 'done', 'finished_at': datetime.utcnow(), 'locked_by': None, 'locked_at': None}
+            counter = 'completed'
+        finally:
+            db.session.remove()
+        
+        with db.engine.begin() as conn:
+            conn.execute(update(table).where(table.c.id == job['id']).values(**values))
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        return True
+    
+    def stats(self):
+        """Return job counts by status, due jobs and this process's counters"""
+        table = Job.__table__
+        with db.engine.connect() as conn:
+            by_status = dict(conn.execute(select(table.c.status, func.count()).group_by(table.c.status)).all())
+            due = conn.execute(select(func.count()).where(
+                table.c.status == 'queued', table.c.run_after <= datetime.utcnow()
+            )).scalar()
+            oldest = conn.execute(select(func.min(table.c.run_after)).where(
+                or_(table.c.status == 'queued', table.c.status == 'running')
+            )).scalar()
+        with self._lock:
+            return {
+                'statuses': {status: by_status.get(status, 0) for status in Job.STATUSES},
+                'due': due,
+                'oldest_pending': oldest.isoformat() if oldest else None,
+                'workers': len(self._threads),
+                'completed': self.completed,
+                'retried': self.retried,
+                'failed': self.failed,
+            }
+
+
+job_queue = JobQueue()
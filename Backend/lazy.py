@@ -0,0 +1,18 @@
+"""
+Deferred imports for heavy modules that only some requests need
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """Return module name, executing it on first attribute access instead of now"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,311 @@
+"""
+Song link enrichment: normalize submitted links, extract provider ids and check them in background jobs
+"""
+import http.client
+import ipaddress
+import re
+import socket
+import ssl
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from werkzeug.utils import import_string
+from invalidation import songs_changed
+from jobs import PermanentJobError, job_queue
+from models import db, Song, LINK_PENDING
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {'si', 'feature', 'fbclid', 'gclid', 'igshid', 'ref', 'ref_src'}
+
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtu.be'}
+YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+SPOTIFY_PATH = re.compile(r'^/(?:intl-[a-z-]+/)?(track|album|playlist|artist|episode)/([A-Za-z0-9]{22})$')
+SPOTIFY_URI = re.compile(r'^spotify:(track|album|playlist|artist|episode):([A-Za-z0-9]{22})$')
+# A scheme without "//" (mailto:, javascript:); "host:port" is not one
+OPAQUE_SCHEME = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:(?!\d)')
+
+# oEmbed endpoints answer 404 (or 400/401/403) for removed or private items, where the
+# item pages themselves often still return 200
+OEMBED = {
+    'youtube': 'https://www.youtube.com/oembed?format=json&url=',
+    'spotify': 'https://open.spotify.com/oembed?url=',
+    'soundcloud': 'https://soundcloud.com/oembed?format=json&url=',
+}
+DEAD_STATUSES = {404, 410}
+OEMBED_DEAD_STATUSES = {400, 401, 403, 404, 410}
+
+
+class TransientLinkError(Exception):
+    """A link check that may succeed later (timeouts, 429 and 5xx responses)"""
+
+
+class UnsafeLinkError(ValueError):
+    """A link to a private, loopback, link-local or otherwise non-public address"""
+
+
+def is_public_address(address):
+    """Check whether an IP address is reachable on the public internet"""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _check_host(host):
+    """Raise UnsafeLinkError for localhost names and non-public IP literals; other names pass"""
+    if host == 'localhost' or host.endswith('.localhost'):
+        raise UnsafeLinkError(f'Link to a local host: {host!r}')
+    try:
+        public = is_public_address(host)
+    except ValueError:
+        return
+    if not public:
+        raise UnsafeLinkError(f'Link to a non-public address: {host!r}')
+
+
+def normalize_link(raw):
+    """
+    Canonical form of a submitted link as {'link', 'provider', 'provider_id'}.
+    
+    YouTube, Spotify and SoundCloud links in any of their share formats map
+    to one canonical URL per item; other links get https, a lower-case host
+    and no fragment or tracking parameters. Raises ValueError for anything
+    that is not an http(s) URL, and UnsafeLinkError (a ValueError) for
+    localhost and non-public IP addresses.
+    """
+    raw = (raw or '').strip()
+    match = SPOTIFY_URI.match(raw)
+    if match:
+        kind, item_id = match.groups()
+        return {'link': f'https://open.spotify.com/{kind}/{item_id}', 'provider': 'spotify',
+                'provider_id': f'{kind}:{item_id}'}
+    if '://' not in raw:
+        if OPAQUE_SCHEME.match(raw):
+            raise ValueError(f'Not an http(s) link: {raw!r}')
+        raw = 'https://' + raw
+    
+    parts = urllib.parse.urlsplit(raw)
+    host = (parts.hostname or '').lower()
+    # A dotted name or an IP address (IPv6 literals have colons instead)
+    if parts.scheme.lower() not in ('http', 'https') or ('.' not in host and ':' not in host):
+        raise ValueError(f'Not an http(s) link: {raw!r}')
+    _check_host(host)
+    path = parts.path.rstrip('/')
+    query = urllib.parse.parse_qs(parts.query)
+    
+    if host in YOUTUBE_HOSTS:
+        if host == 'youtu.be':
+            video_id = path.lstrip('/')
+        elif path == '/watch':
+            video_id = query.get('v', [''])[0]
+        else:
+            video_id = re.sub(r'^/(shorts|embed|live|v)/', '', path)
+        if YOUTUBE_ID.match(video_id):
+            return {'link': f'https://www.youtube.com/watch?v={video_id}', 'provider': 'youtube',
+                    'provider_id': video_id}
+    
+    if host == 'open.spotify.com':
+        match = SPOTIFY_PATH.match(path)
+        if match:
+            kind, item_id = match.groups()
+            return {'link': f'https://open.spotify.com/{kind}/{item_id}', 'provider': 'spotify',
+                    'provider_id': f'{kind}:{item_id}'}
+    
+    if host in ('soundcloud.com', 'www.soundcloud.com', 'm.soundcloud.com'):
+        segments = [segment for segment in path.split('/') if segment]
+        if len(segments) >= 2:
+            track = '/'.join(segments[:3] if segments[1] == 'sets' else segments[:2]).lower()
+            return {'link': f'https://soundcloud.com/{track}', 'provider': 'soundcloud', 'provider_id': track}
+    
+    params = [(key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+              if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')]
+    netloc = (f'[{host}]' if ':' in host else host) + (f':{parts.port}' if parts.port else '')
+    link = urllib.parse.urlunsplit(('https' if parts.scheme.lower() == 'https' else 'http', netloc,
+                                    parts.path or '/', urllib.parse.urlencode(params), ''))
+    return {'link': link, 'provider': None, 'provider_id': None}
+
+
+def check_url(info):
+    """URL whose HTTP status tells whether a normalized link still works"""
+    endpoint = OEMBED.get(info['provider'])
+    return endpoint + urllib.parse.quote(info['link'], safe='') if endpoint else info['link']
+
+
+def _public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """
+    socket.create_connection refusing hosts that resolve to a non-public address.
+    
+    The address checked is the one connected to, so a name cannot pass the
+    check and then resolve elsewhere (DNS rebinding); every redirect hop
+    opens a new connection and is checked the same way.
+    """
+    host, port = address
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for *_, sockaddr in infos:
+        if not is_public_address(sockaddr[0]):
+            raise UnsafeLinkError(f'{host} resolves to non-public address {sockaddr[0]}')
+    error = None
+    for family, socktype, proto, _, sockaddr in infos:
+        sock = socket.socket(family, socktype, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that only connects to public addresses"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection that only connects to public addresses"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    """urllib handler opening http:// URLs through PublicHTTPConnection"""
+    
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    """urllib handler opening https:// URLs through PublicHTTPSConnection"""
+    
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=ssl.create_default_context())
+
+
+# No proxies: the checked address must be the one the request goes to
+link_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), PublicHTTPHandler, PublicHTTPSHandler)
+
+
+# ---- fetchers: fetch(url, timeout) returns the HTTP status, or None when nothing was checked ----
+
+def http_fetch(url, timeout):
+    """
+    GET url (following redirects) and return the final HTTP status.
+    
+    Only public addresses are connected to, on every hop; raises
+    UnsafeLinkError for any other.
+    """
+    request = urllib.request.Request(url, headers={'User-Agent': 'MoodTunes-LinkChecker/1.0'})
+    try:
+        with link_opener.open(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError as e:
+        raise TransientLinkError(f'{url}: {e}') from e
+
+
+def offline_fetch(url, timeout):
+    """Check nothing; links are only normalized (for tests, benchmarks and offline installs)"""
+    return None
+
+
+class LinkEnricher:
+    """Runs the enrich_link and enrich_pending jobs with a configurable fetcher"""
+    
+    def __init__(self):
+        self.fetcher = http_fetch
+        self.timeout = 5.0
+        self.batch_size = 500
+    
+    def init_app(self, app):
+        """Load the fetcher named by LINK_FETCHER ("module:function") and the check limits"""
+        fetcher = app.config['LINK_FETCHER']
+        self.fetcher = import_string(fetcher) if isinstance(fetcher, str) else fetcher
+        self.timeout = app.config['LINK_CHECK_TIMEOUT']
+        self.batch_size = app.config['LINK_ENRICH_BATCH']
+    
+    def status(self, info):
+        """
+        link_status for a normalized link: ok, dead or unchecked.
+        
+        Raises TransientLinkError to retry, and UnsafeLinkError for links
+        to non-public addresses.
+        """
+        status = self.fetcher(check_url(info), self.timeout)
+        if status is None:
+            return 'unchecked'
+        if status == 429 or status >= 500:
+            raise TransientLinkError(f"{info['link']}: HTTP {status}")
+        dead = OEMBED_DEAD_STATUSES if info['provider'] in OEMBED else DEAD_STATUSES
+        return 'dead' if status in dead else 'ok'
+    
+    def enrich(self, song_id):
+        """Normalize, classify and check one song's link, then store the derived fields"""
+        row = db.session.execute(
+            db.select(Song.link, Song.emotion_tag).where(Song.song_id == song_id)
+        ).first()
+        # End the read transaction before the network call
+        db.session.rollback()
+        if row is None or not row.link:
+            return
+        submitted, emotion = row
+        
+        try:
+            info = normalize_link(submitted)
+            status = self.status(info)
+        except ValueError:
+            # Not an http(s) link, or one to a non-public address
+            values = {'link_status': 'invalid', 'link_provider': None, 'link_provider_id': None}
+        else:
+            values = {
+                'link': info['link'][:Song.__table__.c.link.type.length],
+                'link_status': status,
+                'link_provider': info['provider'],
+                'link_provider_id': info['provider_id'],
+            }
+        values['link_checked_at'] = datetime.utcnow()
+        
+        # Skip the update if the link was replaced while it was being checked
+        db.session.execute(db.update(Song).where(Song.song_id == song_id, Song.link == submitted).values(**values))
+        db.session.commit()
+        songs_changed([emotion], [song_id])
+    
+    def enqueue_pending(self, after=0):
+        """Queue an enrich_link job for the next batch of pending songs, and one for the batch after it"""
+        song_ids = db.session.execute(
+            db.select(Song.song_id).where(Song.link_status == LINK_PENDING, Song.song_id > after)
+            .order_by(Song.song_id).limit(self.batch_size)
+        ).scalars().all()
+        for song_id in song_ids:
+            job_queue.enqueue('enrich_link', {'song_id': song_id})
+        if len(song_ids) == self.batch_size:
+            job_queue.enqueue('enrich_pending', {'after': song_ids[-1]})
+        db.session.commit()
+        job_queue.wake()
+
+
+link_enricher = LinkEnricher()
+
+
+@job_queue.handler('enrich_link')
+def enrich_link(payload):
+    """Job: enrich one song's link"""
+    if 'song_id' not in payload:
+        raise PermanentJobError('enrich_link needs a song_id')
+    link_enricher.enrich(payload['song_id'])
+
+
+@job_queue.handler('enrich_pending')
+def enrich_pending(payload):
+    """Job: fan out enrich_link jobs for songs still marked pending (bulk loads, migrated rows)"""
+    link_enricher.enqueue_pending(payload.get('after', 0))
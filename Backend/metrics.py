@@ -0,0 +1,374 @@
+"""
+Per-request instrumentation: latency histograms, SQL and serialization timing,
+Prometheus text exposition and an opt-in sampling profiler for slow requests
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from datetime import datetime
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    """Render a {name="value",...} label set"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    """Render a sample value, keeping integers free of a trailing .0"""
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *label_values, amount=1):
+        """Add amount to the series for label_values"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def samples(self):
+        """Yield (suffix, label_values, extra_labels, value) for every series"""
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield '', label_values, (), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        """Record one observation for label_values"""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+    
+    def samples(self):
+        """Yield bucket, sum and count samples for every series"""
+        with self._lock:
+            items = [(labels, (list(series[0]), series[1], series[2])) for labels, series in self._series.items()]
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', label_values, (('le', _format_value(float(bound))),), cumulative
+            yield '_bucket', label_values, (('le', '+Inf'),), count
+            yield '_sum', label_values, (), total
+            yield '_count', label_values, (), count
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in Prometheus text format"""
+    
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._metrics = []
+    
+    def counter(self, name, documentation, labels=()):
+        """Create and register a counter"""
+        metric = Counter(f'{self.prefix}_{name}', documentation, labels)
+        self._metrics.append(metric)
+        return metric
+    
+    def histogram(self, name, documentation, buckets, labels=()):
+        """Create and register a histogram"""
+        metric = Histogram(f'{self.prefix}_{name}', documentation, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self, gauges=(), counters=()):
+        """
+        Render registered metrics plus (name, documentation, value) gauges for
+        point-in-time values and counters for totals since the process started.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, label_values, extra, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(metric.labels, label_values, extra)} {_format_value(value)}')
+        for kind, values in (('gauge', gauges), ('counter', counters)):
+            for name, documentation, value in values:
+                lines.append(f'# HELP {self.prefix}_{name} {documentation}')
+                lines.append(f'# TYPE {self.prefix}_{name} {kind}')
+                lines.append(f'{self.prefix}_{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry('moodtunes')
+
+request_duration = registry.histogram(
+    'request_duration_seconds', 'Request latency by endpoint', LATENCY_BUCKETS, ('endpoint', 'method'))
+requests_total = registry.counter(
+    'requests_total', 'Requests by endpoint and status', ('endpoint', 'method', 'status'))
+request_statements = registry.histogram(
+    'request_sql_statements', 'SQL statements executed per request', STATEMENT_BUCKETS, ('endpoint',))
+sql_seconds = registry.counter(
+    'sql_seconds_total', 'Time spent executing SQL', ('endpoint',))
+serialization_seconds = registry.counter(
+    'serialization_seconds_total', 'Time spent in to_dict and JSON encoding', ('endpoint',))
+hash_seconds = registry.counter(
+    'hash_seconds_total', 'Time requests spent waiting on bcrypt', ('endpoint',))
+profiles_written = registry.counter(
+    'profiles_written_total', 'Slow-request profiles dumped to disk', ('endpoint',))
+
+
+class RequestStats:
+    """Work attributed to the request running in the current context"""
+    
+    __slots__ = ('sql_count', 'sql_seconds', 'serialization_seconds', 'hash_seconds', '_depth')
+    
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.hash_seconds = 0.0
+        self._depth = 0
+
+
+_current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def begin_request():
+    """Start attributing work to a new request; returns a token for end_request"""
+    return _current_stats.set(RequestStats())
+
+
+def current_stats():
+    """Return the RequestStats of the running request, or None outside requests"""
+    return _current_stats.get()
+
+
+def end_request(token):
+    """Stop attributing work to the request started with token"""
+    _current_stats.reset(token)
+
+
+def observe_request(endpoint, method, status, seconds, stats):
+    """Record a finished request and the work attributed to it"""
+    request_duration.observe(seconds, endpoint, method)
+    requests_total.inc(endpoint, method, str(status))
+    if stats is not None:
+        request_statements.observe(stats.sql_count, endpoint)
+        sql_seconds.inc(endpoint, amount=stats.sql_seconds)
+        serialization_seconds.inc(endpoint, amount=stats.serialization_seconds)
+        hash_seconds.inc(endpoint, amount=stats.hash_seconds)
+
+
+@contextlib.contextmanager
+def timed(field):
+    """Add the duration of the block to a RequestStats field"""
+    stats = _current_stats.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(stats, field, getattr(stats, field) + time.perf_counter() - start)
+
+
+def timed_serialization(fn):
+    """Decorator attributing a serializer's run time to the current request"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stats = _current_stats.get()
+        if stats is None or stats._depth:
+            return fn(*args, **kwargs)
+        stats._depth += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.serialization_seconds += time.perf_counter() - start
+            stats._depth -= 1
+    return wrapper
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider whose encoding time counts as serialization"""
+    
+    @timed_serialization
+    def dumps(self, obj, **kwargs):
+        return super().dumps(obj, **kwargs)
+
+
+def install_sql_timing(engine):
+    """Count and time every statement the engine runs on behalf of a request"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+    
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['metrics_query_start'].pop()
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += time.perf_counter() - start
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of registered threads at a fixed interval.
+    
+    Stacks are collected in the collapsed "frame;frame;frame count" format read
+    by flamegraph.pl, speedscope and similar tools.
+    """
+    
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def start(self, thread_id):
+        """Begin sampling a thread"""
+        with self._lock:
+            self._active[thread_id] = StackCounter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+    
+    def after_fork(self):
+        """Forget the sampler thread inherited from a preloaded parent"""
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def stop(self, thread_id):
+        """Stop sampling a thread and return its collapsed stack counts"""
+        with self._lock:
+            return self._active.pop(thread_id, StackCounter())
+    
+    def _run(self):
+        """Sample every registered thread until the process exits"""
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._collapse(frame)] += 1
+    
+    @staticmethod
+    def _collapse(frame):
+        """Render a frame chain outermost-first as one collapsed stack line"""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+def write_profile(directory, endpoint, seconds, stacks):
+    """Dump collapsed stacks for one slow request; returns the file path"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    safe_endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint)
+    path = os.path.join(directory, f'{stamp}-{safe_endpoint}-{int(seconds * 1000)}ms.folded')
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    return path
+
+
+stack_sampler = StackSampler()
+
+
+def init_metrics(app, db):
+    """Register request hooks, SQL timing and the JSON provider on the app"""
+    app.json = TimedJSONProvider(app)
+    with app.app_context():
+        install_sql_timing(db.engine)
+    
+    profiling = app.config['PROFILE_SLOW_REQUESTS']
+    threshold = app.config['PROFILE_SLOW_THRESHOLD_MS'] / 1000
+    sample_rate = app.config['PROFILE_SAMPLE_RATE']
+    profile_dir = app.config['PROFILE_DIR']
+    stack_sampler.interval = app.config['PROFILE_SAMPLE_INTERVAL']
+    
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_token = begin_request()
+        g.metrics_start = time.perf_counter()
+        g.metrics_profiled = profiling and random.random() < sample_rate
+        if g.metrics_profiled:
+            stack_sampler.start(threading.get_ident())
+    
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        token = g.pop('metrics_token', None)
+        if token is None:
+            return
+        seconds = time.perf_counter() - g.pop('metrics_start')
+        endpoint = request.endpoint or 'unmatched'
+        status = g.pop('metrics_status', 500 if exc else 200)
+        observe_request(endpoint, request.method, status, seconds, current_stats())
+        end_request(token)
+        
+        if g.pop('metrics_profiled', False):
+            stacks = stack_sampler.stop(threading.get_ident())
+            if seconds >= threshold and stacks:
+                try:
+                    write_profile(profile_dir, endpoint, seconds, stacks)
+                    profiles_written.inc(endpoint)
+                except OSError as e:
+                    app.logger.error(f'Could not write request profile: {e}')
+    
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
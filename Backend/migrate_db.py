@@ -1,35 +1,32 @@
 """
-Database migration script to add password_hash column
+Database migration command
+Applies the versioned migrations in migrations.py and records them in schema_migrations
+
+Usage: python migrate_db.py [--status] [--to VERSION] [--config production]
 """
+import argparse
 from app import create_app
 from models import db
-import sqlite3
-
-app = create_app()
+from migrations import MIGRATIONS, applied_versions, upgrade
 
-with app.app_context():
-    # Get database path
-    db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply pending database migrations')
+    parser.add_argument('--status', action='store_true', help='list migrations without applying them')
+    parser.add_argument('--to', type=int, help='stop after this migration version')
+    parser.add_argument('--config', default='default', help='configuration name from config.py')
+    args = parser.parse_args()
     
-    # Connect directly to SQLite
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    app = create_app(args.config)
     
-    try:
-        # Check if password_hash column exists
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'password_hash' not in columns:
-            print("Adding password_hash column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN password_hash VARCHAR(255)")
-            conn.commit()
-            print("Migration completed successfully!")
+    with app.app_context():
+        if args.status:
+            applied = applied_versions(db.engine)
+            for version, description, _ in MIGRATIONS:
+                print(f"{'applied' if version in applied else 'pending'}  {version:>3}  {description}")
         else:
-            print("password_hash column already exists.")
-            
-    except Exception as e:
-        print(f"Error during migration: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+            try:
+                done = upgrade(db.engine, target=args.to)
+                print(f"Applied {len(done)} migration(s)." if done else "Database is up to date.")
+            except Exception as e:
+                print(f"Error during migration: {e}")
+                raise SystemExit(1)
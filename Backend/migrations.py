@@ -0,0 +1,205 @@
+"""
+Versioned schema migrations, applied by migrate_db.py instead of on every boot
+"""
+import random
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from cache import ALL_SONGS_KEY, EPOCH_KEY, SONG_FLOOR_KEY
+from models import db, CacheInvalidation, CatalogStamp, Job, MoodSelection, Song, SongFacet
+
+# Applied migrations, kept outside the models' metadata
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _columns(conn, table):
+    """Names of the columns a table currently has"""
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def _type(conn, column_type):
+    """Render a SQLAlchemy type in the connection's SQL dialect"""
+    return conn.dialect.type_compiler.process(column_type)
+
+
+def _backfill_emotion_keys(conn):
+    """Set songs.emotion_key with Song.normalize_emotion; SQL lower() only folds ASCII"""
+    tags = conn.execute(text("SELECT DISTINCT emotion_tag, emotion_key FROM songs")).all()
+    for emotion_tag, emotion_key in tags:
+        normalized = Song.normalize_emotion(emotion_tag) or ''
+        if normalized != emotion_key:
+            conn.execute(text("UPDATE songs SET emotion_key = :key WHERE emotion_tag = :tag"),
+                         {'key': normalized, 'tag': emotion_tag})
+
+
+def create_tables(conn):
+    """Create any missing tables from the models (a fresh database gets the full schema)"""
+    db.metadata.create_all(conn)
+
+
+def add_password_hash(conn):
+    """Add users.password_hash to databases created before authentication"""
+    if 'password_hash' not in _columns(conn, 'users'):
+        conn.execute(text("ALTER TABLE users ADD COLUMN password_hash VARCHAR(255)"))
+
+
+def add_emotion_key(conn):
+    """Add the normalized songs.emotion_key column and its index"""
+    if 'emotion_key' not in _columns(conn, 'songs'):
+        conn.execute(text("ALTER TABLE songs ADD COLUMN emotion_key VARCHAR(50) NOT NULL DEFAULT ''"))
+        _backfill_emotion_keys(conn)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_songs_emotion_key_song_id ON songs (emotion_key, song_id)"))
+
+
+def add_updated_at(conn):
+    """Add songs.updated_at and its index"""
+    if 'updated_at' not in _columns(conn, 'songs'):
+        conn.execute(text(f"ALTER TABLE songs ADD COLUMN updated_at {_type(conn, DateTime())}"))
+        conn.execute(text("UPDATE songs SET updated_at = CURRENT_TIMESTAMP"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_songs_updated_at_song_id ON songs (updated_at, song_id)"))
+
+
+def add_title_artist_index(conn):
+    """Index used to de-duplicate bulk loads"""
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_songs_title_artist ON songs (title, artist)"))
+
+
+def add_song_search(conn):
+    """Full-text index over title, artist and genre, kept in sync by the database (see search.py)"""
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(
+            "ALTER TABLE songs ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(artist, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(genre, '')), 'B')) STORED"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_songs_search_vector ON songs USING GIN (search_vector)"))
+        return
+    
+    # External-content FTS5 table: the index stores postings only, rows stay in songs
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5("
+        "title, artist, genre, content='songs', content_rowid='song_id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN "
+        "INSERT INTO songs_fts (rowid, title, artist, genre) VALUES (new.song_id, new.title, new.artist, new.genre); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN "
+        "INSERT INTO songs_fts (songs_fts, rowid, title, artist, genre) "
+        "VALUES ('delete', old.song_id, old.title, old.artist, old.genre); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE OF title, artist, genre ON songs BEGIN "
+        "INSERT INTO songs_fts (songs_fts, rowid, title, artist, genre) "
+        "VALUES ('delete', old.song_id, old.title, old.artist, old.genre); "
+        "INSERT INTO songs_fts (rowid, title, artist, genre) VALUES (new.song_id, new.title, new.artist, new.genre); "
+        "END"
+    ))
+    # Index songs that existed before the triggers
+    conn.execute(text("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')"))
+
+
+def add_song_facets(conn):
+    """Materialized emotion x genre song counts, backfilled from existing songs"""
+    from facets import rebuild
+    SongFacet.__table__.create(conn, checkfirst=True)
+    rebuild(conn)
+
+
+def add_mood_selections(conn):
+    """Per-user mood selection history"""
+    MoodSelection.__table__.create(conn, checkfirst=True)
+
+
+def add_cache_invalidations(conn):
+    """Change log polled by every worker to invalidate its in-process caches"""
+    CacheInvalidation.__table__.create(conn, checkfirst=True)
+
+
+def add_link_enrichment(conn):
+    """Add the songs.link_* enrichment columns and the jobs table, and queue existing links for enrichment"""
+    columns = _columns(conn, 'songs')
+    for name, column_type in (('link_status', String(20)), ('link_provider', String(20)),
+                              ('link_provider_id', String(100)), ('link_checked_at', DateTime())):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE songs ADD COLUMN {name} {_type(conn, column_type)}"))
+    Job.__table__.create(conn, checkfirst=True)
+    
+    pending = conn.execute(text(
+        "UPDATE songs SET link_status = 'pending' WHERE link IS NOT NULL AND link <> '' AND link_status IS NULL"
+    )).rowcount
+    if pending:
+        from jobs import job_queue
+        job_queue.enqueue('enrich_pending', conn=conn)
+
+
+def fix_emotion_keys(conn):
+    """Recompute emotion keys that migration 3 lower-cased in SQL, which left non-ASCII tags unmatched"""
+    _backfill_emotion_keys(conn)
+
+
+def add_catalog_versions(conn):
+    """Add the shared catalog_versions table behind ETags, with a new random epoch"""
+    CatalogStamp.__table__.create(conn, checkfirst=True)
+    table = CatalogStamp.__table__
+    existing = set(conn.execute(select(table.c.key)).scalars())
+    now = datetime.utcnow()
+    for key, version in ((EPOCH_KEY, random.getrandbits(31)), (ALL_SONGS_KEY, 0), (SONG_FLOOR_KEY, 0)):
+        if key not in existing:
+            conn.execute(table.insert().values(key=key, version=version, changed_at=now))
+
+
+# (version, description, migration); append new migrations with the next version number
+MIGRATIONS = [
+    (1, 'Create tables from the models', create_tables),
+    (2, 'Add users.password_hash', add_password_hash),
+    (3, 'Add songs.emotion_key and its index', add_emotion_key),
+    (4, 'Add songs.updated_at and its index', add_updated_at),
+    (5, 'Add the songs (title, artist) index', add_title_artist_index),
+    (6, 'Add the song full-text search index', add_song_search),
+    (7, 'Add the song_facets table', add_song_facets),
+    (8, 'Add the mood_selections table', add_mood_selections),
+    (9, 'Add the cache_invalidations table', add_cache_invalidations),
+    (10, 'Add song link enrichment columns and the jobs table', add_link_enrichment),
+    (11, 'Recompute non-ASCII emotion keys', fix_emotion_keys),
+    (12, 'Add the shared catalog_versions table', add_catalog_versions),
+]
+
+
+def applied_versions(engine):
+    """Return the set of migration versions already applied"""
+    migration_metadata.create_all(engine)
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine):
+    """Return the migrations not yet applied, in order"""
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply pending migrations up to target, each in its own transaction; returns the versions applied"""
+    done = []
+    for version, description, migrate in pending_migrations(engine):
+        if target is not None and version > target:
+            break
+        log(f'Applying migration {version}: {description}')
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        done.append(version)
+    return done
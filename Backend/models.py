@@ -1,15 +1,31 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
-from datetime import datetime
+from sqlalchemy.orm import validates
+from datetime import datetime, timezone
+from metrics import timed_serialization
+from replicas import RoutingSession
 
 # Initialize SQLAlchemy and Bcrypt
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bcrypt = Bcrypt()
 
+# Song.link_status of a link waiting for its enrich_link job
+LINK_PENDING = 'pending'
+
+def parse_timestamp(raw):
+    """Parse an ISO-8601 timestamp into the naive UTC datetime stored in DateTime columns"""
+    value = datetime.fromisoformat(raw)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 class User(db.Model):
     """User model for authentication"""
     __tablename__ = 'users'
     
+    # Columns exposed by the API, primary key first
+    FIELDS = ('id', 'username', 'email', 'created_at')
+    
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -20,13 +36,21 @@ class User(db.Model):
         return f'<User {self.username}>'
     
     def set_password(self, password):
-        """Hash and set the password"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        """Hash and set the password on the bounded hashing pool"""
+        from hashing import password_hasher
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Check if the provided password matches the hash"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        from hashing import password_hasher
+        return password_hasher.check(self.password_hash, password)
+    
+    def password_needs_rehash(self, log_rounds):
+        """Check whether the stored hash was made with a different bcrypt cost"""
+        from hashing import hash_rounds
+        return hash_rounds(self.password_hash) != log_rounds
     
+    @timed_serialization
     def to_dict(self):
         """Convert user object to dictionary"""
         return {
@@ -48,16 +72,46 @@ class Song(db.Model):
     """Song model for music recommendations"""
     __tablename__ = 'songs'
     
+    # Columns exposed by the API, primary key first
+    FIELDS = ('song_id', 'title', 'artist', 'genre', 'emotion_tag', 'link',
+              'link_status', 'link_provider', 'link_provider_id')
+    
     song_id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     artist = db.Column(db.String(255), nullable=False)
     genre = db.Column(db.String(100))
     emotion_tag = db.Column(db.String(50), nullable=False)
+    # Lower-cased copy of emotion_tag so mood lookups can use an index
+    emotion_key = db.Column(db.String(50), nullable=False)
     link = db.Column(db.String(500))
+    # Filled in by the enrich_link background job (links.py); NULL when there is no link
+    link_status = db.Column(db.String(20))
+    link_provider = db.Column(db.String(20))
+    link_provider_id = db.Column(db.String(100))
+    link_checked_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_songs_emotion_key_song_id', 'emotion_key', 'song_id'),
+        db.Index('ix_songs_updated_at_song_id', 'updated_at', 'song_id'),
+        db.Index('ix_songs_title_artist', 'title', 'artist'),
+    )
     
     def __repr__(self):
         return f'<Song {self.title} by {self.artist}>'
     
+    @staticmethod
+    def normalize_emotion(emotion):
+        """Normalize an emotion tag for indexed lookups"""
+        return emotion.lower() if emotion else emotion
+    
+    @validates('emotion_tag')
+    def _sync_emotion_key(self, key, emotion_tag):
+        """Keep emotion_key in step with emotion_tag"""
+        self.emotion_key = Song.normalize_emotion(emotion_tag)
+        return emotion_tag
+    
+    @timed_serialization
     def to_dict(self):
         """Convert song object to dictionary"""
         return {
@@ -66,7 +120,10 @@ class Song(db.Model):
             'artist': self.artist,
             'genre': self.genre,
             'emotion_tag': self.emotion_tag,
-            'link': self.link
+            'link': self.link,
+            'link_status': self.link_status,
+            'link_provider': self.link_provider,
+            'link_provider_id': self.link_provider_id
         }
     
     @staticmethod
@@ -77,6 +134,140 @@ class Song(db.Model):
             artist=data.get('artist'),
             genre=data.get('genre'),
             emotion_tag=data.get('emotion_tag'),
-            link=data.get('link')
+            link=data.get('link'),
+            link_status=LINK_PENDING if data.get('link') else None
         )
 
+
+class SongFacet(db.Model):
+    """Materialized song count per (emotion_tag, genre), maintained by facets.py"""
+    __tablename__ = 'song_facets'
+    
+    emotion_tag = db.Column(db.String(50), primary_key=True)
+    # '' stands for songs without a genre so the key never holds NULL
+    genre = db.Column(db.String(100), primary_key=True, default='')
+    song_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SongFacet {self.emotion_tag}/{self.genre}: {self.song_count}>'
+
+
+class PlayEvent(db.Model):
+    """Listening event recorded when a user plays or skips a song"""
+    __tablename__ = 'play_events'
+    
+    EVENT_TYPES = ('play', 'skip', 'complete')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Client- or server-generated id so replayed spools do not double count
+    event_uid = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), nullable=False)
+    event_type = db.Column(db.String(20), nullable=False)
+    duration_ms = db.Column(db.Integer)
+    played_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_play_events_user_id_played_at', 'user_id', 'played_at'),
+        db.Index('ix_play_events_song_id', 'song_id'),
+    )
+    
+    def __repr__(self):
+        return f'<PlayEvent {self.event_type} song={self.song_id} user={self.user_id}>'
+    
+    @timed_serialization
+    def to_dict(self):
+        """Convert play event object to dictionary"""
+        return {
+            'id': self.id,
+            'event_uid': self.event_uid,
+            'user_id': self.user_id,
+            'song_id': self.song_id,
+            'event_type': self.event_type,
+            'duration_ms': self.duration_ms,
+            'played_at': self.played_at.isoformat()
+        }
+
+
+class MoodSelection(db.Model):
+    """Mood chosen by a signed-in user when listing songs by emotion"""
+    __tablename__ = 'mood_selections'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Server-generated id so replayed spools do not double count
+    event_uid = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    emotion_key = db.Column(db.String(50), nullable=False)
+    selected_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_mood_selections_user_id_selected_at', 'user_id', 'selected_at'),
+    )
+    
+    def __repr__(self):
+        return f'<MoodSelection {self.emotion_key} user={self.user_id}>'
+
+
+class CacheInvalidation(db.Model):
+    """Catalog or user change broadcast to the in-process caches of every worker"""
+    __tablename__ = 'cache_invalidations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    # JSON object describing what changed, e.g. {"emotions": [...], "song_ids": [...]}
+    payload = db.Column(db.Text, nullable=False)
+    # Publishing process, which applied the change to its own caches already
+    origin = db.Column(db.String(32), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_cache_invalidations_created_at', 'created_at'),
+        # Pollers resume after the last id they saw, so SQLite must never reuse one after a prune
+        {'sqlite_autoincrement': True},
+    )
+    
+    def __repr__(self):
+        return f'<CacheInvalidation {self.id} {self.kind}>'
+
+
+class CatalogStamp(db.Model):
+    """Shared catalog version of one ETag scope, so every worker builds the same ETags"""
+    __tablename__ = 'catalog_versions'
+    
+    # '*' (whole catalog), an emotion key, 'song:<id>', or a '#' marker row (see cache.py)
+    key = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CatalogStamp {self.key} {self.version}>'
+
+
+class Job(db.Model):
+    """Background job run by the job queue (jobs.py)"""
+    __tablename__ = 'jobs'
+    
+    STATUSES = ('queued', 'running', 'done', 'failed')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # JSON object passed to the kind's handler
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    # Earliest time the job may (re)run; retries move it back by the backoff
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Worker holding a running job, and when it claimed it
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
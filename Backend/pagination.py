@@ -0,0 +1,94 @@
+"""
+Keyset (cursor) pagination and field projection for list endpoints
+"""
+from datetime import datetime
+from flask import current_app, request
+from models import db
+
+
+class PaginationError(ValueError):
+    """Raised when limit, after or fields query parameters are invalid"""
+
+
+# Query parameters that switch a list endpoint to keyset pagination
+PAGE_ARGS = ('limit', 'after', 'fields')
+
+
+def wants_page():
+    """Check whether the request asks for pagination or projection"""
+    return any(arg in request.args for arg in PAGE_ARGS)
+
+
+def parse_fields(model):
+    """Parse ?fields= into a column list, always starting with the primary key"""
+    key = model.FIELDS[0]
+    raw = request.args.get('fields')
+    if not raw:
+        return list(model.FIELDS)
+    
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in model.FIELDS]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    
+    return [key] + [field for field in fields if field != key]
+
+
+def _parse_int_arg(name, minimum):
+    """Parse an optional integer query parameter"""
+    raw = request.args.get(name)
+    if raw is None or raw == '':
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        raise PaginationError(f'{name} must be an integer')
+    if value < minimum:
+        raise PaginationError(f'{name} must be at least {minimum}')
+    return value
+
+
+def _serialize_value(value):
+    """Match the formatting used by the models' to_dict methods"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def page_limit(default=None):
+    """Parse ?limit=, falling back to default and capping at API_MAX_PAGE_SIZE"""
+    limit = _parse_int_arg('limit', 1)
+    max_page_size = current_app.config['API_MAX_PAGE_SIZE']
+    if limit is None:
+        limit = default or max_page_size
+    return min(limit, max_page_size)
+
+
+def row_dicts(fields, rows):
+    """Turn selected row tuples into dicts formatted like the models' to_dict output"""
+    return [
+        {field: _serialize_value(value) for field, value in zip(fields, row)}
+        for row in rows
+    ]
+
+
+def keyset_rows(model, *criteria):
+    """
+    Fetch one page of model rows ordered by primary key.
+    
+    Only the requested columns are selected. Returns (fields, rows, next_cursor),
+    where rows are tuples in fields order and next_cursor is None on the last page.
+    """
+    fields = parse_fields(model)
+    limit = page_limit()
+    after = _parse_int_arg('after', 0)
+    
+    key_column = getattr(model, fields[0])
+    query = db.session.query(*[getattr(model, field) for field in fields]).filter(*criteria)
+    if after is not None:
+        query = query.filter(key_column > after)
+    
+    # Fetch one extra row to learn whether another page exists
+    rows = query.order_by(key_column).limit(limit + 1).all()
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    return fields, rows[:limit], next_cursor
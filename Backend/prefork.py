@@ -0,0 +1,68 @@
+"""
+Pre-fork serving: load the app once in the master process, fork workers that
+share its memory copy-on-write, and reset per-process state in each worker
+"""
+import gc
+import os
+import weakref
+from models import db
+from cache import catalog_version
+from events import event_buffer, mood_buffer
+from affinity import affinity_store
+from hashing import password_hasher
+from invalidation import invalidation_bus
+from jobs import job_queue
+from metrics import stack_sampler
+from recommender import recommendation_index
+from ratelimit import rate_limiter
+from replicas import replica_router
+from singleflight import song_list_flights
+
+_apps = weakref.WeakSet()
+_installed = False
+
+
+def _after_fork_in_child():
+    """Reset state a worker must not share with its parent or siblings"""
+    for app in list(_apps):
+        with app.app_context():
+            # Pooled connections belong to the parent; open fresh ones on demand
+            db.engine.dispose(close=False)
+    replica_router.after_fork()
+    catalog_version.after_fork()
+    password_hasher.after_fork()
+    recommendation_index.after_fork()
+    stack_sampler.after_fork()
+    event_buffer.after_fork()
+    mood_buffer.after_fork()
+    affinity_store.after_fork()
+    rate_limiter.after_fork()
+    song_list_flights.after_fork()
+    invalidation_bus.after_fork()
+    job_queue.after_fork()
+
+
+def install_fork_hooks(app):
+    """Reset per-process state whenever a process running app forks"""
+    global _installed
+    _apps.add(app)
+    if not _installed:
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+        _installed = True
+
+
+def warm_up(app):
+    """
+    Import lazily loaded modules and freeze the heap before workers fork.
+    
+    Run in the master of a preloading server only: workers then share these
+    pages instead of each importing them, and gc.freeze() keeps the garbage
+    collector from touching (and so copying) objects that already exist.
+    """
+    from recommender import np
+    np.ndarray  # first attribute access executes the module
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects import postgresql
+    gc.collect()
+    gc.freeze()
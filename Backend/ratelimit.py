@@ -0,0 +1,194 @@
+"""
+Token-bucket rate limiting for the bcrypt-heavy auth endpoints, with pluggable storage
+"""
+import math
+import threading
+import time
+from urllib.parse import urlparse
+from cache import LRUCache
+
+# Seconds per unit in limits written as "<tokens>/<unit>"
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request has no token left; retry_after is in seconds"""
+    
+    def __init__(self, retry_after):
+        super().__init__(f'Rate limit exceeded, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+def parse_limit(limit):
+    """Parse "10/minute" into (capacity, tokens refilled per second)"""
+    count, _, unit = limit.partition('/')
+    if unit not in PERIODS or not count.strip().isdigit() or int(count) < 1:
+        raise ValueError(f"Rate limit must look like '10/minute', got {limit!r}")
+    return int(count), int(count) / PERIODS[unit]
+
+
+class MemoryBackend:
+    """
+    Buckets in this process's memory (the default).
+    
+    Each worker counts on its own, so with N workers a client can get up to
+    N times the configured rate; use a shared backend to enforce it exactly.
+    """
+    
+    def __init__(self, max_entries=100000):
+        # (tokens, updated) per key; idle buckets are full again after the refill time
+        self._buckets = LRUCache(max_entries=max_entries)
+        self._lock = threading.Lock()
+    
+    def take(self, buckets, now):
+        """
+        Take one token from every (key, capacity, rate) bucket, or none at all.
+        
+        Returns 0 if granted, else the seconds until every bucket has a token.
+        """
+        with self._lock:
+            states = []
+            wait = 0.0
+            for key, capacity, rate in buckets:
+                tokens, updated = self._buckets.get(key) or (capacity, now)
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                states.append((key, tokens))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            for key, tokens in states:
+                self._buckets.set(key, (tokens if wait > 0 else tokens - 1, now))
+            return wait
+    
+    def after_fork(self):
+        """Start with fresh buckets and an unheld lock in a forked worker"""
+        self._buckets = LRUCache(max_entries=self._buckets.max_entries)
+        self._lock = threading.Lock()
+
+
+class RedisBackend:
+    """
+    Buckets in Redis or any server speaking its protocol, shared by every worker.
+    
+    The refill-and-take step for all of a request's buckets runs as one Lua
+    script, so concurrent workers never both spend the last token. Needs the
+    optional redis package.
+    """
+    
+    # KEYS = buckets; ARGV = now, then capacity and rate per bucket. Returns seconds to wait as a string.
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local levels, wait = {}, 0
+    for i, key in ipairs(KEYS) do
+        local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+        local state = redis.call('HMGET', key, 'tokens', 'updated')
+        local tokens, updated = tonumber(state[1]) or capacity, tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        levels[i] = tokens
+        if tokens < 1 then
+            wait = math.max(wait, (1 - tokens) / rate)
+        end
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+        local tokens = levels[i]
+        if wait == 0 then
+            tokens = tokens - 1
+        end
+        redis.call('HSET', key, 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+    return tostring(wait)
+    """
+    
+    def __init__(self, url, prefix='moodtunes:ratelimit:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+    
+    def take(self, buckets, now):
+        """Take one token from every (key, capacity, rate) bucket, or none; return seconds to wait"""
+        args = [now]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        return float(self._take(keys=[self.prefix + key for key, _, _ in buckets], args=args))
+    
+    def after_fork(self):
+        """Drop connections inherited from the parent process"""
+        self.client.connection_pool.reset()
+
+
+def create_backend(url):
+    """Backend for RATE_LIMIT_STORAGE_URL: memory:// or redis://host:port/db (rediss:// for TLS)"""
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return MemoryBackend()
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisBackend(url)
+    raise ValueError(f'Unsupported RATE_LIMIT_STORAGE_URL scheme: {scheme!r}')
+
+
+class RateLimiter:
+    """
+    Named token-bucket limits checked per client IP and per account.
+    
+    A limit of "10/minute" allows bursts of 10 requests and refills one token
+    every 6 seconds. A rejected request spends no token from any of its
+    buckets, so a client that waits Retry-After finds one in each.
+    """
+    
+    def __init__(self):
+        self.enabled = True
+        self.limits = {}
+        self.backend = MemoryBackend()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+    
+    def init_app(self, app):
+        """Configure limits and storage"""
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.limits = {name: parse_limit(limit) for name, limit in app.config['RATE_LIMITS'].items() if limit}
+        self.backend = create_backend(app.config['RATE_LIMIT_STORAGE_URL'])
+    
+    def after_fork(self):
+        """Reset per-process state in a forked worker"""
+        self._lock = threading.Lock()
+        self.backend.after_fork()
+    
+    def check(self, *checks):
+        """
+        Take a token for every (limit name, subject) pair, e.g. ('login_ip', '10.0.0.1').
+        
+        Pairs whose limit is not configured or whose subject is empty are
+        skipped. Tokens are only taken when every bucket has one: raises
+        RateLimitExceeded with the longest wait, charging no bucket, when
+        any is empty.
+        """
+        if not self.enabled:
+            return
+        buckets = [(f'{name}:{str(subject).lower()}',) + self.limits[name]
+                   for name, subject in checks if name in self.limits and subject]
+        wait = self.backend.take(buckets, time.time()) if buckets else 0.0
+        with self._lock:
+            if wait > 0:
+                self.rejected += 1
+            else:
+                self.allowed += 1
+        if wait > 0:
+            raise RateLimitExceeded(math.ceil(wait))
+    
+    def stats(self):
+        """Return allowed and rejected counts and the configured limits"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'backend': type(self.backend).__name__,
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'limits': {name: {'capacity': capacity, 'per_second': rate}
+                           for name, (capacity, rate) in self.limits.items()},
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,453 @@
+"""
+Mood-aware song recommendations over a memory-mapped feature matrix
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from affinity import INTERACTION_WEIGHTS
+from jobs import job_queue
+from lazy import lazy_import
+from models import db, PlayEvent, Song
+
+# numpy loads on the first recommendation request rather than at startup
+np = lazy_import('numpy')
+
+# Relative weight of each hashed feature in a song vector
+FEATURE_WEIGHTS = {'emotion': 1.0, 'genre': 0.7, 'artist': 0.5}
+
+# Files backing the index: name -> (dtype, stored per feature dimension)
+INDEX_FILES = {
+    'vectors.f32': ('float32', True),
+    'song_ids.i64': ('int64', False),
+    'emotions.u32': ('uint32', False),
+    'popularity.f32': ('float32', False),
+}
+
+
+def _bucket(namespace, value, dim):
+    """Map a feature value to a stable (index, sign) pair with feature hashing"""
+    digest = zlib.crc32(f'{namespace}:{value.strip().lower()}'.encode('utf-8'))
+    return digest % dim, 1.0 if (digest >> 31) & 1 else -1.0
+
+
+def emotion_code(emotion):
+    """Stable 32-bit code for a normalized emotion, used for vectorized filtering"""
+    return zlib.crc32(Song.normalize_emotion(emotion).encode('utf-8'))
+
+
+def feature_vector(dim, emotion=None, genre=None, artist=None):
+    """Build an L2-normalized hashed feature vector"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for namespace, value in (('emotion', emotion), ('genre', genre), ('artist', artist)):
+        if value:
+            index, sign = _bucket(namespace, value, dim)
+            vector[index] += sign * FEATURE_WEIGHTS[namespace]
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class RecommendationIndex:
+    """
+    Song feature vectors stored in memory-mapped files under RECOMMENDER_DIR.
+    
+    Vectors are laid out one feature dimension per row. Song vectors have at
+    most three non-zero features, so a query only reads the handful of rows
+    its own non-zero features select instead of the whole matrix. The index
+    appends songs newer than the last indexed song_id on demand: writes only
+    mark it stale and the next query pays for the new rows alone.
+    
+    Every worker maps the same files. Writers take an exclusive lock on
+    index.lock and re-read meta.json under it, so appends from several
+    processes never overlap; files are regrown or recreated under a new name
+    and swapped in, and meta.json's generation tells other workers to remap.
+    """
+    
+    def __init__(self):
+        self.directory = None
+        self.dim = 32
+        self.batch_size = 1000
+        self.popularity_days = 30
+        self.capacity = 0
+        self.count = 0
+        self.last_song_id = 0
+        self.generation = None
+        self.arrays = None
+        self._emotion_rows = {}
+        self._popularity_active = False
+        self._buckets = {}
+        self._stale = True
+        self._meta_mtime = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Configure storage location and vector size"""
+        self.directory = app.config['RECOMMENDER_DIR']
+        self.dim = app.config['RECOMMENDER_DIM']
+        self.batch_size = app.config['EXPORT_BATCH_SIZE']
+        self.popularity_days = app.config['RECOMMENDER_POPULARITY_DAYS']
+        self.arrays = None
+        self._buckets = {}
+        self._stale = True
+    
+    def after_fork(self):
+        """Replace the lock inherited from a preloaded parent; the shared mappings stay valid"""
+        self._lock = threading.Lock()
+    
+    def mark_stale(self):
+        """Note that songs were added and the index must catch up before the next query"""
+        self._stale = True
+    
+    # ---- storage ----
+    
+    def _path(self, name):
+        """Absolute path of an index file"""
+        return os.path.join(self.directory, name)
+    
+    def _shape(self, name, capacity):
+        """Array shape of an index file holding capacity songs"""
+        return (self.dim, capacity) if INDEX_FILES[name][1] else (capacity,)
+    
+    @contextmanager
+    def _file_lock(self):
+        """Hold the index lock file so one process at a time writes the files and meta.json"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self._path('index.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+    
+    def _meta_stamp(self):
+        """Modification time of meta.json, or None when there is no index yet"""
+        try:
+            return os.stat(self._path('meta.json')).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _open(self, capacity):
+        """Memory-map every index file"""
+        self.capacity = capacity
+        self.arrays = {
+            name: np.memmap(self._path(name), dtype=dtype, mode='r+', shape=self._shape(name, capacity))
+            for name, (dtype, _) in INDEX_FILES.items()
+        }
+    
+    def _swap_in(self, capacity, count=0):
+        """
+        Write files with room for capacity songs, copying the first count rows,
+        and move them over the live ones. Other workers keep reading the files
+        they have mapped until meta.json's new generation makes them remap.
+        """
+        old = self.arrays
+        for name, (dtype, _) in INDEX_FILES.items():
+            grown = np.memmap(self._path(name + '.tmp'), dtype=dtype, mode='w+', shape=self._shape(name, capacity))
+            if count:
+                grown[..., :count] = old[name][..., :count]
+            grown.flush()
+            del grown
+        self.arrays = old = None
+        for name in INDEX_FILES:
+            os.replace(self._path(name + '.tmp'), self._path(name))
+        self.generation = time.time_ns()
+        self._open(capacity)
+    
+    def _flush(self):
+        """Write mapped arrays to disk, then replace meta.json in one step"""
+        for array in self.arrays.values():
+            array.flush()
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump({
+                'dim': self.dim,
+                'count': self.count,
+                'capacity': self.capacity,
+                'last_song_id': self.last_song_id,
+                'generation': self.generation,
+                'popularity': self._popularity_active
+            }, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+        self._meta_mtime = self._meta_stamp()
+    
+    def _refresh(self):
+        """
+        Catch up with the index on disk, which other workers may have appended
+        to, regrown or rebuilt; starts an empty one when missing or incompatible.
+        Call with the file lock held.
+        """
+        meta = None
+        if os.path.exists(self._path('meta.json')):
+            with open(self._path('meta.json')) as f:
+                meta = json.load(f)
+        
+        # A database reset leaves the index ahead of the songs table
+        max_song_id = db.session.execute(db.select(db.func.max(Song.song_id))).scalar() or 0
+        
+        if meta and meta['dim'] == self.dim and meta['last_song_id'] <= max_song_id:
+            indexed = self.count
+            if self.arrays is None or meta.get('generation') != self.generation:
+                self.generation = meta.get('generation')
+                self._open(meta['capacity'])
+                indexed = 0
+            self.count = meta['count']
+            self.last_song_id = meta['last_song_id']
+            self._popularity_active = meta.get('popularity', False)
+            self._meta_mtime = self._meta_stamp()
+            if indexed > self.count:
+                indexed = 0
+        else:
+            self.count = 0
+            self.last_song_id = 0
+            self._popularity_active = False
+            self._swap_in(1024)
+            self._flush()
+            indexed = 0
+        
+        if indexed == 0:
+            self._emotion_rows = {}
+        self._index_emotions(indexed, self.count)
+    
+    def _index_emotions(self, start, end):
+        """Group rows start..end by emotion so filtered queries only touch their own mood"""
+        if end <= start:
+            return
+        codes = self.arrays['emotions.u32'][start:end]
+        rows = np.arange(start, end)
+        order = np.argsort(codes, kind='stable')
+        unique, starts = np.unique(codes[order], return_index=True)
+        for code, group in zip(unique.tolist(), np.split(rows[order], starts[1:])):
+            existing = self._emotion_rows.get(code)
+            self._emotion_rows[code] = group if existing is None else np.concatenate([existing, group])
+    
+    # ---- maintenance ----
+    
+    def sync(self):
+        """Append vectors for songs added since the last sync, by this or any other worker"""
+        with self._lock:
+            return self._sync()
+    
+    def _sync(self):
+        """sync() with the thread lock held"""
+        if self.arrays is not None and not self._stale and self._meta_stamp() == self._meta_mtime:
+            return 0
+        with self._file_lock():
+            self._refresh()
+            self._stale = False
+            
+            stmt = (
+                db.select(Song.song_id, Song.emotion_tag, Song.genre, Song.artist)
+                .where(Song.song_id > self.last_song_id)
+                .order_by(Song.song_id)
+                .execution_options(yield_per=self.batch_size)
+            )
+            added = 0
+            for batch in db.session.execute(stmt).partitions():
+                self._append(batch)
+                added += len(batch)
+            
+            if added:
+                self._flush()
+            return added
+    
+    def _append(self, rows):
+        """Vectorize a batch of (song_id, emotion, genre, artist) rows and append it"""
+        capacity = self.capacity
+        while self.count + len(rows) > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            self._swap_in(capacity, self.count)
+        
+        start, end = self.count, self.count + len(rows)
+        block = np.zeros((self.dim, len(rows)), dtype=np.float32)
+        for i, (_, emotion, genre, artist) in enumerate(rows):
+            for namespace, value in (('emotion', emotion), ('genre', genre), ('artist', artist)):
+                if value:
+                    index, sign = self._cached_bucket(namespace, value)
+                    block[index, i] += sign * FEATURE_WEIGHTS[namespace]
+        norms = np.linalg.norm(block, axis=0)
+        block /= np.where(norms == 0, 1, norms)
+        
+        self.arrays['vectors.f32'][:, start:end] = block
+        self.arrays['song_ids.i64'][start:end] = [row[0] for row in rows]
+        self.arrays['emotions.u32'][start:end] = [emotion_code(row[1]) for row in rows]
+        self.count = end
+        self.last_song_id = rows[-1][0]
+        self._index_emotions(start, end)
+    
+    def _cached_bucket(self, namespace, value):
+        """Memoized feature bucket lookup; emotions, genres and artists repeat a lot"""
+        key = (namespace, value)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = _bucket(namespace, value, self.dim)
+            if len(self._buckets) < 100000:
+                self._buckets[key] = bucket
+        return bucket
+    
+    def set_popularity(self, song_ids, values, replace=False):
+        """
+        Store listening-signal scores (0..1) that are blended into rankings.
+        With replace, songs missing from song_ids drop back to zero.
+        """
+        with self._lock:
+            self._sync()
+            with self._file_lock():
+                self._refresh()
+                if self.count == 0:
+                    return
+                popularity = self.arrays['popularity.f32']
+                if replace:
+                    popularity[:self.count] = 0
+                ids = self.arrays['song_ids.i64'][:self.count]
+                song_ids = np.asarray(song_ids, dtype=np.int64)
+                rows = np.searchsorted(ids, song_ids)
+                known = (rows < self.count) & (ids[np.minimum(rows, self.count - 1)] == song_ids)
+                popularity[rows[known]] = np.asarray(values, dtype=np.float32)[known]
+                self._popularity_active = bool(np.any(popularity[:self.count]))
+                self._flush()
+    
+    def refresh_popularity(self):
+        """
+        Derive popularity from the last RECOMMENDER_POPULARITY_DAYS of play_events.
+        
+        Each song's events are weighted like affinity interactions (a complete
+        counts twice, a skip against), and the totals are log-scaled against the
+        most played song so one hit does not flatten every other score.
+        Returns the number of songs with a score.
+        """
+        since = datetime.utcnow() - timedelta(days=self.popularity_days)
+        weight = db.case(
+            *[(PlayEvent.event_type == kind, value) for kind, value in INTERACTION_WEIGHTS.items()],
+            else_=0.0
+        )
+        rows = db.session.execute(
+            db.select(PlayEvent.song_id, db.func.sum(weight))
+            .where(PlayEvent.played_at >= since)
+            .group_by(PlayEvent.song_id)
+        ).all()
+        
+        song_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        totals = np.maximum(np.array([row[1] or 0 for row in rows], dtype=np.float32), 0)
+        peak = totals.max() if len(totals) else 0
+        values = np.log1p(totals) / np.log1p(peak) if peak else totals
+        self.set_popularity(song_ids, values, replace=True)
+        return int(np.count_nonzero(values))
+    
+    def rebuild(self):
+        """Discard the stored index and rebuild it from the songs table"""
+        with self._lock, self._file_lock():
+            if os.path.exists(self._path('meta.json')):
+                os.remove(self._path('meta.json'))
+            self.arrays = None
+            self._stale = True
+        return self.sync()
+    
+    # ---- queries ----
+    
+    def _synced_snapshot(self):
+        """Sync, then return the arrays, row count, mood groups and popularity flag of that state"""
+        with self._lock:
+            self._sync()
+            return self.arrays, self.count, dict(self._emotion_rows), self._popularity_active
+    
+    @staticmethod
+    def _row_of(arrays, count, song_id):
+        """Return the row of a snapshot holding song_id, or None"""
+        ids = arrays['song_ids.i64'][:count]
+        row = int(np.searchsorted(ids, song_id))
+        return row if row < count and ids[row] == song_id else None
+    
+    def recommend(self, emotion=None, seed_song_id=None, k=10, diversity=0.0, popularity_weight=0.1):
+        """
+        Return up to k (song_id, score) pairs ranked by cosine similarity.
+        
+        The query combines the seed song's vector with the emotion feature.
+        Only songs in the requested emotion are eligible; without one, the
+        seed song's own mood is used. diversity in [0, 1] re-ranks the
+        candidates with maximal marginal relevance.
+        """
+        # Another thread's sync may remap the files meanwhile; the snapshot's mappings stay readable
+        arrays, count, emotion_rows, popularity_active = self._synced_snapshot()
+        vectors = arrays['vectors.f32']
+        
+        query = np.zeros(self.dim, dtype=np.float32)
+        seed_row = None
+        if seed_song_id is not None:
+            seed_row = self._row_of(arrays, count, seed_song_id)
+            if seed_row is None:
+                raise KeyError(seed_song_id)
+            query += vectors[:, seed_row]
+        if emotion:
+            query += feature_vector(self.dim, emotion=emotion)
+        norm = np.linalg.norm(query)
+        if norm:
+            query /= norm
+        
+        # Candidates are the requested mood's rows (the seed's mood by default),
+        # or the whole catalog when there is neither
+        if emotion:
+            code = emotion_code(emotion)
+        elif seed_row is not None:
+            code = int(arrays['emotions.u32'][seed_row])
+        else:
+            code = None
+        if code is not None:
+            rows = emotion_rows.get(code, np.arange(0))
+            gather = lambda array: array.take(rows, axis=-1)
+        else:
+            rows = np.arange(count)
+            gather = lambda array: array[..., :count]
+        if len(rows) == 0:
+            return []
+        
+        # Only the query's non-zero dimensions contribute to the dot product
+        scores = np.zeros(len(rows), dtype=np.float32)
+        for d in np.flatnonzero(query):
+            scores += query[d] * gather(vectors[d])
+        if popularity_active and popularity_weight:
+            scores += popularity_weight * gather(arrays['popularity.f32'])
+        
+        # Take a candidate pool with argpartition rather than sorting everything
+        wanted = k + (seed_row is not None)
+        pool_size = min(len(rows), max(wanted * 10, 100) if diversity > 0 else wanted)
+        pool = np.argpartition(-scores, pool_size - 1)[:pool_size]
+        pool = pool[np.argsort(-scores[pool], kind='stable')]
+        if seed_row is not None:
+            pool = pool[rows[pool] != seed_row]
+        
+        if diversity > 0:
+            pool = pool[self._rerank(vectors, rows[pool], scores[pool], k, diversity)]
+        pool = pool[:k]
+        
+        song_ids = arrays['song_ids.i64']
+        return [(int(song_ids[rows[i]]), float(scores[i])) for i in pool]
+    
+    def _rerank(self, vectors, rows, relevance, k, diversity):
+        """Greedy maximal-marginal-relevance selection; returns positions into rows"""
+        candidates = vectors.take(rows, axis=1).T
+        max_similarity = np.zeros(len(rows), dtype=np.float32)
+        chosen = np.zeros(len(rows), dtype=bool)
+        order = []
+        
+        for _ in range(min(k, len(rows))):
+            mmr = (1 - diversity) * relevance - diversity * max_similarity
+            mmr[chosen] = -np.inf
+            best = int(np.argmax(mmr))
+            chosen[best] = True
+            order.append(best)
+            max_similarity = np.maximum(max_similarity, candidates @ candidates[best])
+        
+        return np.array(order, dtype=np.int64)
+
+
+recommendation_index = RecommendationIndex()
+
+
+@job_queue.handler('refresh_popularity')
+def refresh_popularity(payload):
+    """Recompute popularity scores from recent listening events"""
+    recommendation_index.refresh_popularity()
@@ -0,0 +1,250 @@
+"""
+Read-replica routing: read-only GET routes query a healthy replica, everything else the primary
+"""
+import functools
+import math
+import os
+import threading
+import time
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc, text
+from database import engine_options, install_sqlite_pragmas, is_sqlite_memory, normalize_database_uri
+from metrics import install_sql_timing
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Shared catalog version a replica has applied, from the row migration 12 keeps for the whole catalog
+CATALOG_VERSION_QUERY = text("SELECT version FROM catalog_versions WHERE key = '*'")
+
+# Seconds between probes while a replica is behind the catalog, so it rejoins soon after catching up
+LAG_PROBE_INTERVAL = 0.5
+
+
+def replica_config(config, url):
+    """Copy of the app config with the database URI pointing at a replica"""
+    return dict(config, SQLALCHEMY_DATABASE_URI=url)
+
+
+class RoutingSession(Session):
+    """db.session that sends the SELECTs of replica-routed requests to the chosen replica"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Use the request's replica for plain reads; writes, flushes and raw connections use the primary"""
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False) and has_app_context():
+            engine = g.get('read_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Round-robin choice among healthy read replicas, with read-your-writes pinning.
+    
+    A background thread probes every replica each REPLICA_HEALTH_INTERVAL
+    seconds; a SQLite replica must exist as a file and report its catalog
+    version. A connection error on a replica takes it out of rotation until
+    a probe passes again.
+    
+    A successful write sets a cookie keeping that client's reads on the
+    primary for REPLICA_MAX_LAG seconds, in whichever worker they land.
+    Other clients keep using the replicas, except ones whose catalog version
+    is behind the newest catalog change this process has applied: ETags and
+    cached bodies carry that version, so they must not be built from older
+    rows. Without shared versions there is nothing to compare, and every
+    catalog read stays on the primary for REPLICA_MAX_LAG seconds instead.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.urls = []
+        self.engines = []
+        self.healthy = []
+        self.reads = []
+        self.primary_reads = 0
+        self.versions = []
+        self.max_lag = 2.0
+        self.health_interval = 5.0
+        self.pin_cookie = 'read_primary_until'
+        # Catalog version a replica needs to take reads, and the monotonic time until which
+        # an unversioned catalog change keeps every read on the primary
+        self.catalog_floor = 0
+        self._held_until = 0.0
+        self._next = 0
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._stopped = threading.Event()
+    
+    def init_app(self, app):
+        """Create replica engines and pin clients after their writes"""
+        self.app = app
+        self.urls = [normalize_database_uri(url) for url in app.config['DATABASE_REPLICA_URLS']]
+        self.max_lag = app.config['REPLICA_MAX_LAG']
+        self.health_interval = app.config['REPLICA_HEALTH_INTERVAL']
+        self.pin_cookie = app.config['REPLICA_PIN_COOKIE']
+        self.catalog_floor = 0
+        self._held_until = 0.0
+        self.engines = []
+        for url in self.urls:
+            engine = create_engine(url, **engine_options(replica_config(app.config, url)))
+            install_sqlite_pragmas(engine, app.config)
+            install_sql_timing(engine)
+            self.install_guards(engine, len(self.engines))
+            self.engines.append(engine)
+        self.healthy = [False] * len(self.engines)
+        self.versions = [None] * len(self.engines)
+        self.reads = [0] * len(self.engines)
+        app.after_request(self._pin_writer)
+    
+    def install_guards(self, engine, index):
+        """Make a replica engine read-only and take its replica out of rotation on connection errors"""
+        if engine.dialect.name == 'sqlite':
+            @event.listens_for(engine, 'connect')
+            def _query_only(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute('PRAGMA query_only=ON')
+                cursor.close()
+        
+        @event.listens_for(engine, 'handle_error')
+        def _mark_down(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+                self._set_health(index, False)
+    
+    def after_fork(self):
+        """Drop the parent's replica connections and restart health checks in a forked worker"""
+        for engine in self.engines:
+            engine.dispose(close=False)
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._stopped = threading.Event()
+    
+    # ---- health ----
+    
+    def _probe(self, engine):
+        """Return the catalog version a replica has applied, or None if it cannot serve reads"""
+        url = engine.url
+        if url.get_backend_name() == 'sqlite' and not is_sqlite_memory(url) and not os.path.exists(url.database):
+            # Connecting would create an empty database in its place
+            return None
+        try:
+            with engine.connect() as conn:
+                return conn.execute(CATALOG_VERSION_QUERY).scalar() or 0
+        except Exception:
+            return None
+    
+    def _set_health(self, index, healthy):
+        """Record a replica's health, logging changes"""
+        if self.healthy[index] != healthy:
+            self.healthy[index] = healthy
+            url = self.engines[index].url.render_as_string(hide_password=True)
+            if healthy:
+                self.app.logger.info(f'Read replica {url} is up')
+            else:
+                self.app.logger.warning(f'Read replica {url} is down')
+    
+    def check(self):
+        """Probe every replica now"""
+        for index, engine in enumerate(self.engines):
+            version = self._probe(engine)
+            self.versions[index] = version
+            self._set_health(index, version is not None)
+    
+    def _lagging(self):
+        """Check whether a healthy replica is still behind the catalog"""
+        return any(healthy and (version or 0) < self.catalog_floor
+                   for healthy, version in zip(self.healthy, self.versions))
+    
+    def _ensure_monitor(self):
+        """Probe once and start the health-check thread on first use"""
+        if self._monitor is not None:
+            return
+        with self._lock:
+            if self._monitor is None:
+                self.check()
+                self._monitor = threading.Thread(target=self._run_monitor, name='replica-health', daemon=True)
+                self._monitor.start()
+    
+    def _run_monitor(self):
+        """Probe on a fixed interval until stopped"""
+        while not self._stopped.wait(min(self.health_interval, LAG_PROBE_INTERVAL) if self._lagging()
+                                     else self.health_interval):
+            self.check()
+    
+    def stop(self):
+        """Stop health checks"""
+        self._stopped.set()
+    
+    # ---- routing ----
+    
+    def catalog_changed(self, version=None):
+        """Keep catalog reads off replicas that have not applied a change yet (all replicas if it has no version)"""
+        if not self.engines:
+            return
+        with self._lock:
+            if version is None:
+                self._held_until = time.monotonic() + self.max_lag
+            else:
+                self.catalog_floor = max(self.catalog_floor, version)
+    
+    def pinned(self, cookies):
+        """Check whether a request's cookies pin its reads to the primary"""
+        try:
+            return float(cookies.get(self.pin_cookie, 0)) > time.time()
+        except ValueError:
+            return False
+    
+    def _pin_writer(self, response):
+        """Pin the client of a successful write to the primary so it reads its own writes"""
+        if self.engines and request.method not in READ_METHODS and response.status_code < 400:
+            response.set_cookie(self.pin_cookie, f'{time.time() + self.max_lag:.3f}',
+                                max_age=math.ceil(self.max_lag), httponly=True, samesite='Lax')
+        return response
+    
+    def choose(self, pinned=False):
+        """Index of the replica a read should use, or None for the primary"""
+        if not self.engines:
+            return None
+        self._ensure_monitor()
+        with self._lock:
+            candidates = []
+            if not pinned and time.monotonic() >= self._held_until:
+                candidates = [index for index, healthy in enumerate(self.healthy)
+                              if healthy and self.versions[index] >= self.catalog_floor]
+            if not candidates:
+                self.primary_reads += 1
+                return None
+            index = candidates[self._next % len(candidates)]
+            self._next += 1
+            self.reads[index] += 1
+            return index
+    
+    def stats(self):
+        """Return each replica's health and read count, and reads kept on the primary"""
+        with self._lock:
+            return {
+                'replicas': [{
+                    'url': engine.url.render_as_string(hide_password=True),
+                    'healthy': self.healthy[index],
+                    'catalog_version': self.versions[index],
+                    'reads': self.reads[index],
+                } for index, engine in enumerate(self.engines)],
+                'primary_reads': self.primary_reads,
+                'catalog_floor': self.catalog_floor,
+                'max_lag': self.max_lag,
+                'health_interval': self.health_interval,
+            }
+
+
+replica_router = ReplicaRouter()
+
+
+def replica_read(view):
+    """Run a read-only view against a read replica when one is available"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        index = replica_router.choose(replica_router.pinned(request.cookies))
+        if index is not None:
+            g.read_engine = replica_router.engines[index]
+        return view(*args, **kwargs)
+    return wrapper
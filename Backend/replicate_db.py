@@ -0,0 +1,54 @@
+"""
+Local read-replica refresh command
+Copies the primary SQLite database onto the SQLite files in DATABASE_REPLICA_URLS, for trying
+replica routing on one machine; real deployments use the database server's own replication
+
+Usage: python replicate_db.py [--every SECONDS] [--config production]
+"""
+import argparse
+import sqlite3
+import time
+from sqlalchemy.engine import make_url
+from config import config
+from database import is_sqlite_memory
+
+
+def sqlite_path(uri):
+    """File behind a SQLite URI; anything else cannot be copied this way"""
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or is_sqlite_memory(url):
+        raise SystemExit(f'Not a SQLite database file: {url.render_as_string(hide_password=True)}')
+    return url.database
+
+
+def copy_database(source, target):
+    """Copy source onto target with SQLite's online backup, which readers of either file may keep using"""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Copy the primary SQLite database onto its replicas')
+    parser.add_argument('--every', type=float, help='keep copying at this interval in seconds')
+    parser.add_argument('--config', default='default', help='configuration name from config.py')
+    args = parser.parse_args()
+    
+    settings = config[args.config]
+    primary = sqlite_path(settings.SQLALCHEMY_DATABASE_URI)
+    replicas = [sqlite_path(uri) for uri in settings.DATABASE_REPLICA_URLS]
+    if not replicas:
+        raise SystemExit('DATABASE_REPLICA_URLS is empty')
+    
+    while True:
+        start = time.perf_counter()
+        for replica in replicas:
+            copy_database(primary, replica)
+        print(f'Copied {primary} to {len(replicas)} replica(s) in {time.perf_counter() - start:.2f}s')
+        if not args.every:
+            break
+        time.sleep(args.every)
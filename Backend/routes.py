@@ -1,15 +1,191 @@
-from flask import Blueprint, request, jsonify
+import zlib
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from models import db, User, Song
+from cache import song_cache, song_list_bodies, catalog_version, emotion_cache_key
+from conditional import add_cache_headers, is_not_modified, not_modified_response
+from pagination import PaginationError, keyset_rows, wants_page
+from encoding import ETAG_TAGS, JSON, encode_fragment, join_fragments, negotiate, pack_rows, rows_response, vary_on_accept
+from search import SearchError, search_page
+from singleflight import song_list_flights
+from facets import FACETS_QUERY, emotions_body
+from export import iter_songs_ndjson, parse_since
+from hashing import HashQueueFull, password_hasher
+from bulk import detect_format, insert_songs, parse_rows, validate_rows
+from recommender import recommendation_index
+from events import event_buffer, mood_buffer, mood_selection, validate_events
+from affinity import affinity_store
+from identity import get_user_profile, optional_user_id, profile_claims, profile_from_token, user_cache
+from metrics import registry
+from ratelimit import RateLimitExceeded, rate_limiter
+from invalidation import invalidation_bus, songs_changed, users_changed
+from replicas import replica_read, replica_router
+from jobs import job_queue
 
 # Create Blueprint for API routes
 api = Blueprint('api', __name__, url_prefix='/api')
 
+def page_response(fields, rows, next_cursor, media_type=JSON):
+    """Build a list response in the negotiated encoding, carrying the next keyset cursor as a header"""
+    response = rows_response(fields, rows, media_type)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response, 200
+
+def encode_song_list(emotion, media_type):
+    """Query and encode the whole catalog, or one mood, for GET /api/songs"""
+    if media_type != JSON:
+        # Encode row tuples directly instead of loading Song objects
+        fields = list(Song.FIELDS)
+        stmt = db.select(*[getattr(Song, field) for field in fields])
+        if emotion:
+            stmt = stmt.where(Song.emotion_key == Song.normalize_emotion(emotion)).order_by(Song.song_id)
+        return pack_rows(fields, db.session.execute(stmt).all())
+    
+    if emotion:
+        # Filter by emotion tag (case-insensitive, served from the emotion index)
+        songs = Song.query.filter(
+            Song.emotion_key == Song.normalize_emotion(emotion)
+        ).order_by(Song.song_id).all()
+    else:
+        # Get all songs
+        songs = Song.query.all()
+    
+    return current_app.json.dumps([song.to_dict() for song in songs]).encode('utf-8')
+
+def encode_genre_fragments(emotion, media_type):
+    """Encode one mood as {genre: (song count, fragment)}, songs in id order, genres by name"""
+    fields = list(Song.FIELDS)
+    by_genre = {}
+    stmt = db.select(*[getattr(Song, field) for field in fields]) \
+        .where(Song.emotion_key == Song.normalize_emotion(emotion)).order_by(Song.song_id)
+    for row in db.session.execute(stmt):
+        by_genre.setdefault(row.genre or '', []).append(row)
+    return {
+        genre: (len(rows), encode_fragment(fields, rows, media_type))
+        for genre, rows in sorted(by_genre.items())
+    }
+
+def personalized_song_list(user_id, emotion, cache_key, version, last_modified, media_type):
+    """
+    Mood list ordered by the user's genre affinity, then by song id.
+    
+    Every song in a mood list shares its emotion, so ranking by affinity only
+    reorders whole genres. The bucket is encoded once per version as one
+    fragment per genre; a request sorts the genres and splices the
+    fragments, which costs the same however many songs the mood holds.
+    
+    Only whole lists get here (pages keep catalog order), so each call is a
+    first visit to the mood; it is recorded as a selection unless the client
+    merely revalidated a list it already has.
+    """
+    bodies = song_list_bodies(cache_key, version)
+    variant = (media_type, 'genres')
+    fragments = bodies.get(variant)
+    if fragments is None:
+        fragments = song_list_flights.do(
+            (cache_key, version) + variant,
+            lambda: bodies.get(variant) or bodies.setdefault(variant, encode_genre_fragments(emotion, media_type))
+        )
+    
+    genres = affinity_store.rank_genres(user_id, fragments)
+    etag = catalog_version.etag('songs', cache_key, version, ETAG_TAGS[media_type], f'user{user_id}',
+                                zlib.crc32('\n'.join(genres).encode('utf-8')))
+    if is_not_modified(etag, last_modified):
+        response = not_modified_response(etag, last_modified)
+    else:
+        affinity_store.record_selection(user_id, emotion)
+        mood_buffer.add([mood_selection(user_id, emotion)])
+        body = join_fragments(Song.FIELDS, [fragments[genre] for genre in genres], media_type)
+        response = add_cache_headers(Response(body, status=200, mimetype=media_type), etag, last_modified)
+    response.headers['Cache-Control'] = current_app.config['AFFINITY_CACHE_CONTROL']
+    response.vary.add('Authorization')
+    return vary_on_accept(response)
+
+def rate_limited_response(error):
+    """Tell the client how long to wait before its next attempt"""
+    response = jsonify({'error': 'Too many attempts, please retry later'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+def hash_queue_full_response():
+    """Tell the client to back off while the hashing pool is saturated"""
+    response = jsonify({'error': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
 @api.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'message': 'Flask backend is running'}), 200
 
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose request, SQL and component metrics in Prometheus text format"""
+    song_stats = song_cache.stats()
+    user_stats = user_cache.stats()
+    hash_stats = password_hasher.stats()
+    event_stats = event_buffer.stats()
+    flight_stats = song_list_flights.stats()
+    limit_stats = rate_limiter.stats()
+    invalidation_stats = invalidation_bus.stats()
+    replica_stats = replica_router.stats()
+    job_stats = job_queue.stats()
+    decode_stats = current_app.extensions['flask-jwt-extended'].decode_stats()
+    # Point-in-time values
+    gauges = [
+        ('song_cache_entries', 'Emotion buckets held in the song cache', song_stats['entries']),
+        ('user_cache_entries', 'Profiles held in the user cache', user_stats['entries']),
+        ('invalidation_lag_seconds', 'Seconds since the change log was last polled',
+         invalidation_stats['lag_seconds'] or 0),
+        ('replicas_healthy', 'Read replicas currently taking reads',
+         sum(replica['healthy'] for replica in replica_stats['replicas'])),
+        ('jobs_due', 'Background jobs waiting for a worker', job_stats['due']),
+        ('hash_in_flight', 'bcrypt jobs running or queued', hash_stats['in_flight']),
+        ('events_buffered', 'Listening events waiting for a group commit', event_stats['buffered']),
+        ('events_pending_spools', 'Spool files waiting to be replayed', event_stats['pending_spools']),
+    ]
+    # Totals since this process started; they reset when a worker restarts
+    counters = [
+        ('song_cache_hits_total', 'Song cache hits', song_stats['hits']),
+        ('song_cache_misses_total', 'Song cache misses', song_stats['misses']),
+        ('song_list_queries_total', 'Song list queries run after a cache miss', flight_stats['leaders']),
+        ('song_list_coalesced_total', 'Song list misses served by another request\'s query',
+         flight_stats['followers']),
+        ('invalidations_published_total', 'Catalog and user changes broadcast to other workers',
+         invalidation_stats['published']),
+        ('invalidations_applied_total', 'Other workers\' changes applied to local caches',
+         invalidation_stats['applied']),
+        ('replica_reads_total', 'Reads served by read replicas',
+         sum(replica['reads'] for replica in replica_stats['replicas'])),
+        ('replica_primary_reads_total', 'Replica-eligible reads kept on the primary', replica_stats['primary_reads']),
+        ('jobs_completed_total', 'Background jobs completed by this process', job_stats['completed']),
+        ('jobs_retried_total', 'Background job attempts that failed and were rescheduled', job_stats['retried']),
+        ('jobs_failed_total', 'Background jobs that failed for good', job_stats['failed']),
+        ('user_cache_hits_total', 'User cache hits', user_stats['hits']),
+        ('user_cache_misses_total', 'User cache misses', user_stats['misses']),
+        ('hash_rejected_total', 'bcrypt jobs rejected with 429', hash_stats['rejected']),
+        ('rate_limited_total', 'Auth requests rejected by the rate limiter', limit_stats['rejected']),
+        ('jwt_decode_seconds_total', 'Time spent decoding access tokens', decode_stats['seconds_total']),
+        ('jwt_decodes_total', 'Access tokens decoded', decode_stats['count']),
+        ('events_flushed_total', 'Listening events written', event_stats['flushed']),
+        ('events_rejected_total', 'Listening events the database refused at flush time', event_stats['rejected']),
+    ]
+    return Response(registry.render(gauges, counters), status=200, mimetype='text/plain; version=0.0.4')
+
+@api.route('/replicas', methods=['GET'])
+def get_replica_stats():
+    """Get read replica health and read counts"""
+    return jsonify(replica_router.stats()), 200
+
+@api.route('/jobs', methods=['GET'])
+def get_job_stats():
+    """Get background job counts by status and this process's job counters"""
+    try:
+        return jsonify(job_queue.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ============ AUTHENTICATION ROUTES ============
 
 @api.route('/auth/register', methods=['POST'])
@@ -22,6 +198,9 @@ def register():
         if not data or 'username' not in data or 'email' not in data or 'password' not in data:
             return jsonify({'error': 'Username, email, and password are required'}), 400
         
+        # Throttle before any bcrypt work
+        rate_limiter.check(('register_ip', request.remote_addr))
+        
         # Validate password length
         if len(data['password']) < 6:
             return jsonify({'error': 'Password must be at least 6 characters long'}), 400
@@ -41,7 +220,7 @@ def register():
         db.session.commit()
         
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(identity=user.id, additional_claims=profile_claims(user))
         refresh_token = create_refresh_token(identity=user.id)
         
         return jsonify({
@@ -50,6 +229,11 @@ def register():
             'access_token': access_token,
             'refresh_token': refresh_token
         }), 201
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except HashQueueFull:
+        db.session.rollback()
+        return hash_queue_full_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -64,6 +248,9 @@ def login():
         if not data or 'login' not in data or 'password' not in data:
             return jsonify({'error': 'Username/Email and password are required'}), 400
         
+        # Throttle before any bcrypt work
+        rate_limiter.check(('login_ip', request.remote_addr), ('login_account', data['login']))
+        
         # Find user by email or username
         login_identifier = data['login']
         user = User.query.filter(
@@ -74,8 +261,13 @@ def login():
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid username/email or password'}), 401
         
+        # Upgrade hashes made with an outdated bcrypt cost
+        if user.password_needs_rehash(current_app.config['BCRYPT_LOG_ROUNDS']):
+            user.set_password(data['password'])
+            db.session.commit()
+        
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(identity=user.id, additional_claims=profile_claims(user))
         refresh_token = create_refresh_token(identity=user.id)
         
         return jsonify({
@@ -84,7 +276,13 @@ def login():
             'access_token': access_token,
             'refresh_token': refresh_token
         }), 200
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except HashQueueFull:
+        db.session.rollback()
+        return hash_queue_full_response()
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @api.route('/auth/refresh', methods=['POST'])
@@ -93,7 +291,13 @@ def refresh():
     """Refresh access token using refresh token"""
     try:
         current_user_id = get_jwt_identity()
-        access_token = create_access_token(identity=current_user_id)
+        additional_claims = None
+        if current_app.config['JWT_PROFILE_CLAIMS']:
+            profile = get_user_profile(current_user_id)
+            if profile is None:
+                return jsonify({'error': 'User not found'}), 404
+            additional_claims = profile_claims(profile)
+        access_token = create_access_token(identity=current_user_id, additional_claims=additional_claims)
         
         return jsonify({
             'access_token': access_token
@@ -106,25 +310,67 @@ def refresh():
 def get_current_user():
     """Get current authenticated user"""
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        # Prefer the profile embedded in the token, then the user cache
+        profile = profile_from_token() or get_user_profile(get_jwt_identity())
         
-        if not user:
+        if not profile:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify(user.to_dict()), 200
+        return jsonify(profile), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/auth/me/affinity', methods=['GET'])
+@jwt_required()
+def get_current_user_affinity():
+    """Get the current user's emotion and genre affinities (shares summing to 1)"""
+    try:
+        emotions, genres = affinity_store.scores(get_jwt_identity())
+        return jsonify({'emotions': emotions, 'genres': genres}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/auth/rate-limits', methods=['GET'])
+def get_rate_limit_stats():
+    """Get configured auth rate limits and allowed/rejected counts"""
+    return jsonify(rate_limiter.stats()), 200
+
+@api.route('/auth/hash-stats', methods=['GET'])
+def get_hash_stats():
+    """Get password hashing queue depth and latency"""
+    return jsonify(password_hasher.stats()), 200
+
+@api.route('/auth/token-stats', methods=['GET'])
+def get_token_stats():
+    """Get JWT decode latency and user profile cache counters"""
+    jwt_manager = current_app.extensions['flask-jwt-extended']
+    return jsonify({
+        'decode': jwt_manager.decode_stats(),
+        'user_cache': user_cache.stats()
+    }), 200
+
 # ============ USER ROUTES ============
 
 @api.route('/users', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_users():
     """Get all users (protected route)"""
     try:
+        media_type = negotiate(request.headers.get('Accept'))
+        if wants_page():
+            return page_response(*keyset_rows(User), media_type)
+        
+        if media_type != JSON:
+            # Encode row tuples directly instead of loading User objects
+            fields = list(User.FIELDS)
+            rows = db.session.execute(db.select(*[getattr(User, field) for field in fields])).all()
+            return rows_response(fields, rows, media_type), 200
+        
         users = User.query.all()
         return jsonify([user.to_dict() for user in users]), 200
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -133,10 +379,10 @@ def get_users():
 def get_user(user_id):
     """Get a specific user by ID (protected route)"""
     try:
-        user = User.query.get(user_id)
-        if user is None:
+        profile = get_user_profile(user_id)
+        if profile is None:
             return jsonify({'error': 'User not found'}), 404
-        return jsonify(user.to_dict()), 200
+        return jsonify(profile), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -180,7 +426,11 @@ def update_user(user_id):
             user.set_password(data['password'])
         
         db.session.commit()
+        users_changed(user_id)
         return jsonify(user.to_dict()), 200
+    except HashQueueFull:
+        db.session.rollback()
+        return hash_queue_full_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -202,6 +452,7 @@ def delete_user(user_id):
         
         db.session.delete(user)
         db.session.commit()
+        users_changed(user_id)
         
         return jsonify({'message': 'User deleted successfully'}), 200
     except Exception as e:
@@ -211,31 +462,117 @@ def delete_user(user_id):
 # ============ SONG ROUTES ============
 
 @api.route('/songs', methods=['GET'])
+@replica_read
 def get_songs():
     """Get all songs or filter by emotion"""
     try:
         # Check if emotion filter is provided
         emotion = request.args.get('emotion')
-        
+        cache_key = emotion_cache_key(emotion)
+        
+        # Answer revalidations from the bucket version without touching the database.
+        # The version is read before querying so a concurrent write can only make
+        # the ETag look older than the body, never newer.
+        media_type = negotiate(request.headers.get('Accept'))
+        version, last_modified = catalog_version.bucket(cache_key)
+        
+        # Signed-in users get mood lists ranked by their own affinities
+        user_id = optional_user_id() if emotion else None
+        if user_id is not None and not wants_page():
+            return personalized_song_list(user_id, emotion, cache_key, version, last_modified, media_type)
+        
+        etag = catalog_version.etag('songs', cache_key, version, ETAG_TAGS[media_type],
+                                    zlib.crc32(request.query_string))
+        if is_not_modified(etag, last_modified):
+            return vary_on_accept(not_modified_response(etag, last_modified))
+        
+        # Paginated or projected requests go straight to the keyset index
+        if wants_page():
+            criteria = []
+            if emotion:
+                criteria.append(Song.emotion_key == Song.normalize_emotion(emotion))
+            response, status = page_response(*keyset_rows(Song, *criteria), media_type)
+            return vary_on_accept(add_cache_headers(response, etag, last_modified)), status
+        
+        # Serve the serialized list straight from the cache when it matches the bucket version;
+        # concurrent misses for the same list wait for one query instead of each running it
+        bodies = song_list_bodies(cache_key, version)
+        body = bodies.get(media_type)
+        if body is None:
+            body = song_list_flights.do(
+                (cache_key, version, media_type),
+                lambda: bodies.get(media_type) or bodies.setdefault(media_type, encode_song_list(emotion, media_type))
+            )
+        
+        response = Response(body, status=200, mimetype=media_type)
         if emotion:
-            # Filter by emotion tag (case-insensitive)
-            songs = Song.query.filter(Song.emotion_tag.ilike(emotion)).all()
-        else:
-            # Get all songs
-            songs = Song.query.all()
-        
-        return jsonify([song.to_dict() for song in songs]), 200
+            # Signed-in requests for the same URL get a personalized order
+            response.vary.add('Authorization')
+        return vary_on_accept(add_cache_headers(response, etag, last_modified))
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/songs/search', methods=['GET'])
+@replica_read
+def search_songs():
+    """Full-text search over title, artist and genre, best matches first"""
+    try:
+        # Rankings depend on the whole catalog, so revalidate against its version
+        media_type = negotiate(request.headers.get('Accept'))
+        version, last_modified = catalog_version.catalog()
+        etag = catalog_version.etag('search', version, ETAG_TAGS[media_type], zlib.crc32(request.query_string))
+        if is_not_modified(etag, last_modified):
+            return vary_on_accept(not_modified_response(etag, last_modified))
+        
+        response, status = page_response(*search_page(
+            emotion=request.args.get('emotion'),
+            default_limit=current_app.config['SEARCH_PAGE_SIZE']
+        ), media_type)
+        return vary_on_accept(add_cache_headers(response, etag, last_modified)), status
+    except (SearchError, PaginationError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/songs/export', methods=['GET'])
+def export_songs():
+    """Stream the song catalog as NDJSON, optionally filtered by emotion and updated_at"""
+    try:
+        since = parse_since(request.args.get('since'))
+    except ValueError:
+        return jsonify({'error': 'since must be an ISO-8601 timestamp'}), 400
+    
+    lines = iter_songs_ndjson(
+        emotion=request.args.get('emotion'),
+        since=since,
+        batch_size=current_app.config['EXPORT_BATCH_SIZE']
+    )
+    return Response(stream_with_context(lines), status=200, mimetype='application/x-ndjson')
+
+@api.route('/songs/cache', methods=['GET'])
+def get_song_cache_stats():
+    """Get song cache size and hit/miss counters, coalesced misses, and invalidation bus state"""
+    stats = song_cache.stats()
+    stats['coalescing'] = song_list_flights.stats()
+    stats['invalidation'] = invalidation_bus.stats()
+    return jsonify(stats), 200
+
 @api.route('/songs/<int:song_id>', methods=['GET'])
+@replica_read
 def get_song(song_id):
     """Get a specific song by ID"""
     try:
+        version, last_modified = catalog_version.song(song_id)
+        etag = catalog_version.etag('song', song_id, version)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        
         song = Song.query.get(song_id)
         if song is None:
             return jsonify({'error': 'Song not found'}), 404
-        return jsonify(song.to_dict()), 200
+        return add_cache_headers(jsonify(song.to_dict()), etag, last_modified), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -252,20 +589,141 @@ def create_song():
         # Create new song
         song = Song.from_dict(data)
         db.session.add(song)
+        if song.link:
+            # Normalizing and checking the link happens in a background job queued with the song
+            db.session.flush()
+            job_queue.enqueue('enrich_link', {'song_id': song.song_id})
         db.session.commit()
+        job_queue.wake()
+        
+        # Drop cached lists and ETags that now miss the new song, here and in every other worker;
+        # the song's own version changes too, in case its id belonged to a deleted song
+        songs_changed([song.emotion_tag], [song.song_id])
         
         return jsonify(song.to_dict()), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@api.route('/songs/bulk', methods=['POST'])
+def bulk_create_songs():
+    """Create many songs from a JSON array, or an uploaded CSV/NDJSON/JSON file"""
+    try:
+        # Parse the payload from an uploaded file or the request body
+        upload = request.files.get('file')
+        if upload:
+            fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+            rows = parse_rows(upload.read().decode('utf-8'), fmt)
+        else:
+            fmt = request.args.get('format') or detect_format(mimetype=request.mimetype)
+            rows = parse_rows(request.get_data(as_text=True), fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    chunk_size = request.args.get('chunk_size', current_app.config['BULK_CHUNK_SIZE'], type=int)
+    if chunk_size < 1:
+        return jsonify({'error': 'chunk_size must be at least 1'}), 400
+    dedupe = request.args.get('dedupe', 'false').lower() in ('1', 'true', 'yes')
+    
+    songs, errors = validate_rows(rows)
+    
+    try:
+        chunks = insert_songs(songs, chunk_size=chunk_size, dedupe=dedupe)
+        return jsonify({
+            'inserted': sum(chunk['inserted'] for chunk in chunks),
+            'skipped': sum(chunk['skipped'] for chunk in chunks),
+            'rejected': len(errors),
+            'chunks': chunks,
+            'errors': errors
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        # Earlier chunks may have committed even if a later one failed
+        songs_changed(song['emotion_tag'] for song in songs)
+        job_queue.wake()
+
 @api.route('/songs/emotions', methods=['GET'])
+@replica_read
 def get_emotions():
-    """Get list of available emotions"""
+    """Get list of available emotions, optionally with per-emotion and per-genre song counts"""
     try:
-        # Get distinct emotion tags
-        emotions = db.session.query(Song.emotion_tag).distinct().all()
-        emotion_list = [emotion[0] for emotion in emotions]
-        return jsonify({'emotions': emotion_list}), 200
+        counts = request.args.get('counts', 'false').lower() in ('1', 'true', 'yes')
+        version, last_modified = catalog_version.catalog()
+        etag = catalog_version.etag('emotions', version, int(counts))
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        
+        # Served from the materialized facet table: one row per emotion and genre
+        rows = db.session.execute(FACETS_QUERY).all()
+        return add_cache_headers(jsonify(emotions_body(rows, counts)), etag, last_modified), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+# ============ RECOMMENDATION ROUTES ============
+
+@api.route('/recommendations', methods=['GET'])
+def get_recommendations():
+    """Recommend songs similar to a mood and/or a seed song"""
+    emotion = request.args.get('emotion')
+    seed_song_id = request.args.get('song_id', type=int)
+    k = request.args.get('k', 10, type=int)
+    diversity = request.args.get('diversity', 0.0, type=float)
+    
+    if not emotion and seed_song_id is None:
+        return jsonify({'error': 'emotion or song_id is required'}), 400
+    if not 1 <= k <= current_app.config['API_MAX_PAGE_SIZE']:
+        return jsonify({'error': 'k is out of range'}), 400
+    if not 0.0 <= diversity <= 1.0:
+        return jsonify({'error': 'diversity must be between 0 and 1'}), 400
+    
+    try:
+        ranked = recommendation_index.recommend(
+            emotion=emotion, seed_song_id=seed_song_id, k=k, diversity=diversity
+        )
+    except KeyError:
+        return jsonify({'error': 'Song not found'}), 404
+    
+    try:
+        songs = Song.query.filter(Song.song_id.in_([song_id for song_id, _ in ranked])).all()
+        songs_by_id = {song.song_id: song for song in songs}
+        
+        results = []
+        for song_id, score in ranked:
+            if song_id in songs_by_id:
+                results.append(dict(songs_by_id[song_id].to_dict(), score=round(score, 6)))
+        return jsonify(results), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============ LISTENING EVENT ROUTES ============
+
+@api.route('/events', methods=['POST'])
+@jwt_required()
+def record_events():
+    """Record a batch of play/skip events for the current user"""
+    data = request.get_json(silent=True)
+    raw_events = data.get('events') if isinstance(data, dict) else data
+    
+    if not isinstance(raw_events, list) or not raw_events:
+        return jsonify({'error': 'A non-empty list of events is required'}), 400
+    if len(raw_events) > current_app.config['EVENT_MAX_BATCH']:
+        return jsonify({'error': 'Too many events in one batch'}), 413
+    
+    try:
+        rows, errors = validate_events(raw_events, get_jwt_identity())
+        if rows:
+            event_buffer.add(rows)
+            affinity_store.record_events(rows)
+        return jsonify({'accepted': len(rows), 'rejected': len(errors), 'errors': errors}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/events/stats', methods=['GET'])
+def get_event_stats():
+    """Get listening-event and mood-selection buffer depth and flush counters"""
+    stats = event_buffer.stats()
+    stats['mood_selections'] = mood_buffer.stats()
+    stats['affinity'] = affinity_store.stats()
+    return jsonify(stats), 200
@@ -0,0 +1,34 @@
+"""
+Background job worker command
+Runs queued jobs (such as song link checks) outside the web servers, for deployments that set JOB_CONCURRENCY=0
+
+Usage: python run_jobs.py [--concurrency 4] [--once] [--config production]
+"""
+import argparse
+import time
+from app import create_app
+from jobs import job_queue
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run background jobs until interrupted')
+    parser.add_argument('--concurrency', type=int, default=4, help='worker threads')
+    parser.add_argument('--once', action='store_true', help='run the jobs due now and exit')
+    parser.add_argument('--config', default='default', help='configuration name from config.py')
+    args = parser.parse_args()
+    
+    app = create_app(args.config)
+    
+    if args.once:
+        ran = 0
+        with app.app_context():
+            while job_queue.run_one():
+                ran += 1
+        print(f'Ran {ran} job(s).')
+    else:
+        job_queue.ensure_started(args.concurrency)
+        print(f'Running jobs with {args.concurrency} worker(s); Ctrl-C to stop.')
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            job_queue.stop()
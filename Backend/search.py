@@ -0,0 +1,176 @@
+"""
+Full-text song search over title, artist and genre
+
+SQLite uses the songs_fts FTS5 table with BM25 ranking; Postgres uses the
+songs.search_vector tsvector column with a GIN index. Both are created by
+migration 6 and kept in sync by the database itself.
+"""
+import re
+from collections import namedtuple
+from flask import current_app, request
+from sqlalchemy import column, func, literal, literal_column, table, tuple_
+from cache import LRUCache
+from models import db, Song
+from pagination import PaginationError, page_limit, parse_fields
+
+# BM25 weights of the title, artist and genre columns
+SEARCH_WEIGHTS = (2.0, 2.0, 1.0)
+
+# Search terms are runs of word characters; everything else separates them
+TERM = re.compile(r'\w+')
+
+# Shortest term matched as a prefix, the smallest prefix size indexed by migration 6
+MIN_PREFIX_LENGTH = 2
+
+# Terms in fewer songs than this are always ranked: their postings are cheap to count
+MIN_STOPWORD_DOCS = 10000
+
+Term = namedtuple('Term', ['word', 'prefix'])
+
+songs_fts = table('songs_fts', column('rowid'))
+
+# Document frequency per Term, and the catalog size under None. Counting a
+# common term costs as much as scanning its postings, and the figures only
+# steer which terms are ranked, so they are cached for a few minutes.
+term_stats = LRUCache(max_entries=10000, ttl=300)
+
+
+class SearchError(ValueError):
+    """Raised when the search query is missing or has no searchable terms"""
+
+
+def parse_terms(raw):
+    """Split ?q= into terms; the last one also matches as a prefix (search-as-you-type)"""
+    words = TERM.findall((raw or '').lower())
+    if not words:
+        raise SearchError('q must contain at least one word')
+    terms = [Term(word, False) for word in words[:-1]]
+    terms.append(Term(words[-1], len(words[-1]) >= MIN_PREFIX_LENGTH))
+    return terms
+
+
+def fts5_query(terms):
+    """FTS5 MATCH expression requiring every term"""
+    return ' '.join(f'"{term.word}"' + ('*' if term.prefix else '') for term in terms)
+
+
+def tsquery(terms):
+    """Postgres equivalent of fts5_query"""
+    return ' & '.join(term.word + (':*' if term.prefix else '') for term in terms)
+
+
+def _match(terms, dialect):
+    """Return (from clause, condition, score) for songs containing every term; lower scores rank first"""
+    if dialect == 'sqlite':
+        fts = literal_column('songs_fts')
+        return songs_fts, fts.match(fts5_query(terms)), func.bm25(fts, *SEARCH_WEIGHTS)
+    
+    vector = literal_column('songs.search_vector')
+    query = func.to_tsquery('simple', tsquery(terms))
+    return Song.__table__, vector.op('@@')(query), -func.ts_rank_cd(vector, query)
+
+
+def _song_id(dialect):
+    """Column holding the song id in _match's from clause"""
+    return songs_fts.c.rowid if dialect == 'sqlite' else Song.song_id
+
+
+def _catalog_size():
+    """Approximate number of songs; ids are never reused, so the largest one is an upper bound"""
+    size = term_stats.get(None)
+    if size is None:
+        size = db.session.execute(db.select(func.max(Song.song_id))).scalar() or 0
+        term_stats.set(None, size)
+    return size
+
+
+def _is_common(term, dialect, threshold):
+    """Check whether at least threshold songs contain term, counting no further than that"""
+    frequency = term_stats.get(term)
+    if frequency is None:
+        source, condition, _ = _match([term], dialect)
+        matches = db.select(literal(1)).select_from(source).where(condition).limit(threshold).subquery()
+        frequency = db.session.execute(db.select(func.count()).select_from(matches)).scalar()
+        term_stats.set(term, frequency)
+    return frequency >= threshold
+
+
+def ranked_terms(terms, dialect):
+    """
+    Drop terms found in at least SEARCH_STOPWORD_RATIO of the catalog.
+    
+    BM25 counts every posting of every query term to weigh it, so one term
+    present in most songs makes the query as slow as a full scan while
+    adding almost nothing to the ranking. As in MySQL's natural-language
+    full-text search, such terms are ignored; returns [] if every term is one.
+    """
+    threshold = int(_catalog_size() * current_app.config['SEARCH_STOPWORD_RATIO'])
+    if threshold < MIN_STOPWORD_DOCS:
+        return terms
+    return [term for term in terms if not _is_common(term, dialect, threshold)]
+
+
+def _parse_cursor(raw):
+    """Parse ?after= into (score, song_id)"""
+    if not raw:
+        return None
+    try:
+        score, song_id = raw.rsplit(':', 1)
+        return float(score), int(song_id)
+    except ValueError:
+        raise PaginationError('after must be a cursor returned in X-Next-Cursor')
+
+
+def search_page(emotion=None, default_limit=None):
+    """
+    Fetch one page of songs matching ?q=, best matches first.
+    
+    Every match is scored and only the page is kept (ORDER BY score LIMIT
+    inside the full-text query), so the best matches win however many songs
+    match; common terms still have to match but are left out of the ranking,
+    which bounds the cost of very broad queries (see ranked_terms). Pages are
+    keyset-paginated on (score, song_id), so a cursor is only stable while
+    the catalog is unchanged. Returns (fields, rows, next_cursor) like keyset_rows,
+    with each song's score as the last field.
+    """
+    terms = parse_terms(request.args.get('q'))
+    fields = parse_fields(Song)
+    limit = page_limit(default_limit)
+    after = _parse_cursor(request.args.get('after'))
+    
+    dialect = db.session.get_bind().dialect.name
+    song_id = _song_id(dialect)
+    ranked = ranked_terms(terms, dialect)
+    source, condition, score = _match(ranked or terms, dialect)
+    if not ranked:
+        # Every term is in a large share of the catalog: ranking would not tell
+        # the matches apart, so return them in catalog order
+        score = literal(0.0)
+    candidates = db.select(song_id.label('song_id'), score.label('score')).select_from(source).where(condition)
+    if emotion:
+        emotion_key = Song.normalize_emotion(emotion)
+        if dialect == 'sqlite':
+            # A correlated lookup keeps the planner driving from the full-text index;
+            # a join lets it scan the whole emotion index and probe songs_fts per row
+            candidates = candidates.where(
+                db.select(Song.emotion_key).where(Song.song_id == song_id).scalar_subquery() == emotion_key
+            )
+        else:
+            candidates = candidates.where(Song.emotion_key == emotion_key)
+    if after is not None:
+        candidates = candidates.where(tuple_(score, song_id) > tuple_(*after))
+    # Rank inside the full-text query and join songs for the page only; one extra
+    # row tells whether another page exists
+    order = (score, song_id) if ranked else (song_id,)
+    hits = candidates.order_by(*order).limit(limit + 1).subquery('hits')
+    
+    stmt = db.select(*[getattr(Song, field) for field in fields], hits.c.score) \
+        .join_from(hits, Song, Song.song_id == hits.c.song_id)
+    rows = db.session.execute(stmt.order_by(hits.c.score, hits.c.song_id)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = f'{last.score!r}:{last.song_id}'
+    
+    rows = [tuple(row[:-1]) + (float(f'{-row.score or 0.0:.6g}'),) for row in rows[:limit]]
+    return fields + ['score'], rows, next_cursor
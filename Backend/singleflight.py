@@ -0,0 +1,113 @@
+"""
+Single-flight request coalescing: concurrent identical cache misses share one computation
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight computation and the callers waiting for it"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time in this process.
+    
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it runs wait and get the same result, or the same exception.
+    Nothing is kept once the call finishes, so keys should include whatever
+    version makes an earlier result stale.
+    """
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+    
+    def do(self, key, fn):
+        """Return fn(), sharing one invocation between concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+    
+    def after_fork(self):
+        """Forget calls that belonged to threads of the parent process"""
+        self._calls = {}
+        self._lock = threading.Lock()
+    
+    def stats(self):
+        """Return in-flight, leader and follower counts"""
+        with self._lock:
+            return {'in_flight': len(self._calls), 'leaders': self.leaders, 'followers': self.followers}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop"""
+    
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+    
+    async def do(self, key, coro_fn):
+        """Return await coro_fn(), sharing one invocation between concurrent callers with the same key"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.followers += 1
+            # shield: a cancelled follower must not cancel the leader's work
+            return await asyncio.shield(future)
+        
+        self.leaders += 1
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when no follower was waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+    
+    def stats(self):
+        """Return in-flight, leader and follower counts"""
+        return {'in_flight': len(self._calls), 'leaders': self.leaders, 'followers': self.followers}
+
+
+# Encoded song lists, keyed by (cache key, bucket version, media type[, variant])
+song_list_flights = SingleFlight()
+async_song_list_flights = AsyncSingleFlight()
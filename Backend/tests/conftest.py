@@ -0,0 +1,81 @@
+"""
+Shared pytest setup; run from the Backend directory with python -m pytest
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from config import Config, config
+
+
+def app_settings(directory, **overrides):
+    """Config values keeping every file of an app under directory, with background threads off"""
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'database.db')}",
+        'EVENT_SPOOL_DIR': os.path.join(directory, 'event_spool'),
+        'RECOMMENDER_DIR': os.path.join(directory, 'recommender'),
+        'AFFINITY_DIR': os.path.join(directory, 'affinity'),
+        'PROFILE_DIR': os.path.join(directory, 'profiles'),
+        'AFFINITY_MAX_USERS': 1024,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'RATE_LIMIT_ENABLED': False,
+        'INVALIDATION_ENABLED': False,
+        'JOB_CONCURRENCY': 0,
+        'LINK_FETCHER': 'links:offline_fetch',
+        'TESTING': True,
+    }
+    settings.update(overrides)
+    return settings
+
+
+def make_app(directory, **overrides):
+    """Create an app on a migrated SQLite database under directory"""
+    from app import create_app
+    from cache import song_cache
+    from identity import user_cache
+    from invalidation import invalidation_bus
+    from migrations import upgrade
+    from models import db
+    
+    config['test'] = type('TestConfig', (Config,), app_settings(directory, **overrides))
+    try:
+        app = create_app('test')
+    finally:
+        del config['test']
+    with app.app_context():
+        upgrade(db.engine, log=lambda *args: None)
+    # The extensions are process-wide: forget the previous app's poller, log position and cached bodies
+    invalidation_bus.after_fork()
+    invalidation_bus._last_id = None
+    song_cache.clear()
+    user_cache.clear()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App on a fresh database"""
+    from events import event_buffer, mood_buffer
+    from invalidation import invalidation_bus
+    
+    app = make_app(str(tmp_path))
+    yield app
+    invalidation_bus.stop()
+    # Write out what the test buffered while its spool directory still belongs to the buffers
+    with app.app_context():
+        for buffer in (event_buffer, mood_buffer):
+            buffer.flush()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_song(client, title, emotion='Happy', artist='Artist', **fields):
+    """Create a song through the API and return it"""
+    response = client.post('/api/songs', json=dict(title=title, artist=artist, emotion_tag=emotion, **fields))
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()
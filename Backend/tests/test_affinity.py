@@ -0,0 +1,52 @@
+"""
+Affinity store: slot assignment and concurrent updates from several processes
+"""
+import multiprocessing
+import pytest
+from affinity import AffinityStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AffinityStore()
+    store.directory = str(tmp_path)
+    store.max_users = 16
+    store.slots = {'emotion': 4, 'genre': 4}
+    return store
+
+
+def test_names_beyond_the_slots_hash_onto_them(store):
+    store._ensure_open()
+    genres = [f'genre{i}' for i in range(12)]
+    slots = [store._slot('genre', genre, add=True) for genre in genres]
+    assert slots[:4] == [0, 1, 2, 3]
+    assert all(0 <= slot < 4 for slot in slots)
+    # Overflow names do not all pile onto the last slot, and keep their slot
+    assert len(set(slots[4:])) > 1
+    assert [store._slot('genre', genre) for genre in genres] == slots
+
+
+def test_selection_scores(store):
+    store.record_selection(3, 'Happy')
+    store.record_selection(3, 'happy')
+    store.record_selection(3, 'Sad')
+    emotions, genres = store.scores(3)
+    assert emotions == {'happy': pytest.approx(0.6667, abs=1e-4), 'sad': pytest.approx(0.3333, abs=1e-4)}
+    assert genres == {}
+
+
+def _select_many(store, count):
+    for _ in range(count):
+        store.record_selection(1, 'happy')
+
+
+def test_concurrent_processes_do_not_lose_updates(store):
+    store._ensure_open()
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_select_many, args=(store, 200)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert float(store.table[1]['emotion'][0]) == pytest.approx(800, rel=1e-3)
@@ -0,0 +1,107 @@
+"""
+ASGI entry point: native async handlers agree with the Flask routes, and everything else falls through to Flask
+"""
+import importlib
+import os
+import sys
+import pytest
+from starlette.testclient import TestClient
+from config import Config, config
+from conftest import app_settings
+from invalidation import invalidation_bus
+
+
+@pytest.fixture(scope='module')
+def asgi(tmp_path_factory):
+    """The asgi module, imported on a fresh migrated database"""
+    from migrations import upgrade
+    from models import db
+    
+    directory = str(tmp_path_factory.mktemp('asgi'))
+    config['asgi_test'] = type('AsgiTestConfig', (Config,), app_settings(directory))
+    os.environ['APP_CONFIG'] = 'asgi_test'
+    try:
+        sys.modules.pop('asgi', None)
+        module = importlib.import_module('asgi')
+    finally:
+        del config['asgi_test']
+        del os.environ['APP_CONFIG']
+    with module.flask_app.app_context():
+        upgrade(db.engine, log=lambda *args: None)
+    yield module
+    invalidation_bus.stop()
+    sys.modules.pop('asgi', None)
+
+
+@pytest.fixture(scope='module')
+def client(asgi):
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+@pytest.fixture(scope='module')
+def songs(client):
+    created = []
+    for title, emotion in (('One', 'Happy'), ('Two', 'Sad'), ('Three', 'happy')):
+        response = client.post('/api/songs', json={'title': title, 'artist': 'Artist', 'emotion_tag': emotion})
+        assert response.status_code == 201, response.text
+        created.append(response.json())
+    return created
+
+
+def test_health(client):
+    assert client.get('/api/health').json()['status'] == 'healthy'
+
+
+def test_song_lists_match_flask(asgi, client, songs):
+    flask_client = asgi.flask_app.test_client()
+    for url in ('/api/songs', '/api/songs?emotion=HAPPY'):
+        native = client.get(url)
+        flask = flask_client.get(url)
+        assert native.status_code == 200
+        assert native.json() == flask.get_json()
+        assert native.headers['ETag'] == flask.headers['ETag']
+        assert native.headers['Access-Control-Allow-Origin'] == '*'
+    assert [song['title'] for song in client.get('/api/songs?emotion=happy').json()] == ['One', 'Three']
+
+
+def test_revalidation(client, songs):
+    first = client.get('/api/songs?emotion=Sad')
+    assert client.get('/api/songs?emotion=Sad', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    
+    # A write through the Flask fallback changes the ETag the native handler serves
+    client.post('/api/songs', json={'title': 'Four', 'artist': 'Artist', 'emotion_tag': 'Sad'})
+    fresh = client.get('/api/songs?emotion=Sad', headers={'If-None-Match': first.headers['ETag']})
+    assert fresh.status_code == 200
+    assert [song['title'] for song in fresh.json()] == ['Two', 'Four']
+
+
+def test_single_song_and_emotions(client, songs):
+    song = client.get(f"/api/songs/{songs[0]['song_id']}")
+    assert song.json()['title'] == 'One'
+    assert client.get(f"/api/songs/{songs[0]['song_id']}",
+                      headers={'If-None-Match': song.headers['ETag']}).status_code == 304
+    assert client.get('/api/songs/9999').status_code == 404
+    
+    emotions = client.get('/api/songs/emotions?counts=true')
+    assert emotions.status_code == 200
+    assert client.get('/api/songs/emotions?counts=true',
+                      headers={'If-None-Match': emotions.headers['ETag']}).status_code == 304
+
+
+def test_pages_fall_through_to_flask(client, songs):
+    response = client.get('/api/songs?limit=1')
+    assert len(response.json()) == 1
+    assert response.headers['X-Next-Cursor']
+
+
+def test_login(client):
+    user = {'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}
+    assert client.post('/api/auth/register', json=user).status_code == 201
+    response = client.post('/api/auth/login', json={'login': 'alice@example.com', 'password': 'secret123'})
+    assert response.status_code == 200
+    token = response.json()['access_token']
+    assert client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'}).json()['username'] == 'alice'
+    
+    assert client.post('/api/auth/login', json={'login': 'alice', 'password': 'wrong'}).status_code == 401
+    assert client.post('/api/auth/login', content=b'not json').status_code == 400
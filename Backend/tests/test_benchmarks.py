@@ -0,0 +1,102 @@
+"""
+Benchmark tooling: deterministic catalogs, cached databases, report comparison and a short end-to-end run
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+import pytest
+from sqlalchemy import create_engine, text
+from benchmarks.compare import compare
+from benchmarks.generators import EMOTIONS, ensure_database, song_batches, zipf_weights
+from benchmarks.report import percentile, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def catalog(count, **options):
+    return [song for batch in song_batches(count, batch_size=300, **options) for song in batch]
+
+
+def test_same_seed_same_catalog():
+    assert catalog(1000) == catalog(1000)
+    assert catalog(1000) != catalog(1000, seed=7)
+    assert [len(batch) for batch in song_batches(700, batch_size=300)] == [300, 300, 100]
+
+
+def test_catalogs_are_skewed():
+    assert zipf_weights(4, 0).tolist() == [0.25] * 4
+    assert zipf_weights(10, 1.2).sum() == pytest.approx(1.0)
+    emotions = Counter(song['emotion_tag'] for song in catalog(4000))
+    assert [emotion for emotion, _ in emotions.most_common()] == list(EMOTIONS)
+    uniform = Counter(song['emotion_tag'] for song in catalog(4000, emotion_skew=0))
+    assert max(uniform.values()) < 1.2 * min(uniform.values())
+
+
+def test_databases_are_reused_until_the_parameters_change(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    params = ensure_database(path, songs=50, users=3, log_rounds=4)
+    assert params['schema'] > 0
+    stamp = os.stat(path).st_mtime_ns
+    assert ensure_database(path, songs=50, users=3, log_rounds=4) == params
+    assert os.stat(path).st_mtime_ns == stamp
+    
+    ensure_database(path, songs=60, users=3, log_rounds=4)
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM songs')).scalar() == 60
+        assert conn.execute(text('SELECT count(*) FROM users')).scalar() == 3
+    engine.dispose()
+
+
+def test_summaries():
+    assert percentile([], 50) is None
+    summary = summarize([0.001 * n for n in range(1, 101)], seconds=2, errors=1, workload='x')
+    assert (summary['operations'], summary['operations_per_sec']) == (100, 50.0)
+    assert (summary['p50_ms'], summary['p99_ms'], summary['max_ms']) == (51.0, 100.0, 100.0)
+    assert (summary['errors'], summary['workload']) == (1, 'x')
+
+
+def report(**workloads):
+    return {'meta': {'commit': 'abc'}, 'results': [dict(result, workload=name) for name, result in workloads.items()]}
+
+
+def test_compare_flags_regressions():
+    baseline = {'a': {'operations_per_sec': 100, 'p99_ms': 10}, 'b': {'operations_per_sec': 100, 'p99_ms': 10}}
+    candidate = {'a': {'operations_per_sec': 85, 'p99_ms': 10.5}, 'b': {'operations_per_sec': 120, 'p99_ms': 12}}
+    rows, regressions = compare(baseline, candidate, threshold=10)
+    assert rows[0]['operations_per_sec'] == {'baseline': 100, 'candidate': 85, 'change_pct': -15.0}
+    assert regressions == ['a operations_per_sec -15.0%', 'b p99_ms +20.0%']
+    assert compare(baseline, candidate, threshold=25)[1] == []
+
+
+def test_compare_exit_status(tmp_path):
+    paths = []
+    for name, ops in (('baseline', 100), ('candidate', 50)):
+        paths.append(str(tmp_path / f'{name}.json'))
+        with open(paths[-1], 'w') as f:
+            json.dump(report(mood_browse={'operations_per_sec': ops, 'p99_ms': 5}), f)
+    
+    def run(*args):
+        return subprocess.run([sys.executable, '-m', 'benchmarks.compare', *args],
+                              cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60)
+    failed = run(paths[0], paths[1], '--json')
+    assert failed.returncode == 1
+    assert json.loads(failed.stdout)['regressions'] == ['mood_browse operations_per_sec -50.0%']
+    assert run(paths[0], paths[0]).returncode == 0
+
+
+def test_a_short_run_reports_every_workload(tmp_path):
+    output = str(tmp_path / 'results.json')
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.run', '--db', str(tmp_path / 'catalog.db'), '--songs', '200',
+         '--users', '5', '--log-rounds', '4', '--workloads', 'mood_browse,login_storm', '--threads', '2',
+         '--seconds', '0.3', '--warmup', '0', '--output', output],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    with open(output) as f:
+        results = json.load(f)['results']
+    assert [r['workload'] for r in results] == ['mood_browse', 'login_storm']
+    for r in results:
+        assert r['operations'] > 0 and r['errors'] == 0, r
@@ -0,0 +1,128 @@
+"""
+Bulk song ingestion: parsing, column-wise validation, chunked inserts and dedupe
+"""
+import io
+import pytest
+from sqlalchemy import event
+from bulk import detect_format, insert_songs, parse_rows, validate_rows
+from models import db, Job, Song
+
+CSV = 'title,artist,emotion_tag,genre\nOne,A,Happy,Pop\n" Two ",B,sad,\n'
+NDJSON = '{"title": "One", "artist": "A", "emotion_tag": "Happy"}\n\n{"title": "Two", "artist": "B", "emotion_tag": "sad"}\n'
+
+
+def song(title, artist='Artist', emotion='Happy', **fields):
+    return dict(title=title, artist=artist, emotion_tag=emotion, **fields)
+
+
+def bulk(client, rows, **args):
+    response = client.post('/api/songs/bulk', json=rows, query_string=args)
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def stored(app):
+    with app.app_context():
+        return [tuple(row) for row in db.session.execute(
+            db.select(Song.title, Song.artist).order_by(Song.song_id))]
+
+
+@pytest.fixture
+def executemany(app):
+    """Row counts of the executemany statements run while the test is active"""
+    calls = []
+    
+    def record(conn, cursor, statement, parameters, context, many):
+        if many and statement.startswith('INSERT INTO songs'):
+            calls.append(len(parameters))
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield calls
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_parses_csv_and_ndjson():
+    assert [row['title'] for row in parse_rows(CSV, 'csv')] == ['One', ' Two ']
+    assert [row['title'] for row in parse_rows(NDJSON, 'ndjson')] == ['One', 'Two']
+    with pytest.raises(ValueError):
+        parse_rows('{"title": "One"}', 'json')
+    with pytest.raises(ValueError):
+        parse_rows('', 'xml')
+
+
+def test_detects_the_format():
+    assert detect_format('songs.CSV') == 'csv'
+    assert detect_format('songs.jsonl') == 'ndjson'
+    assert detect_format(mimetype='application/x-ndjson') == 'ndjson'
+    assert detect_format('songs.json') == 'json'
+
+
+def test_validation_normalizes_and_rejects_by_column():
+    rows = [song(' One ', genre=''), 'nope', song(123), {'title': 'T', 'artist': True, 'emotion_tag': 'x'},
+            {'title': 'T'}, song('x' * 300), song('Linked', link='https://example.com')]
+    valid, errors = validate_rows(rows)
+    assert [(s['title'], s['genre'], s['emotion_key'], s['link_status']) for s in valid] == [
+        ('One', None, 'happy', None), ('Linked', None, 'happy', 'pending')]
+    assert errors == [
+        {'row': 1, 'error': 'Row must be an object'},
+        {'row': 2, 'error': 'Fields must be strings: title'},
+        {'row': 3, 'error': 'Fields must be strings: artist'},
+        {'row': 4, 'error': 'Missing required fields: artist, emotion_tag'},
+        {'row': 5, 'error': 'Fields too long: title'},
+    ]
+
+
+def test_route_reports_rejected_rows(client, app):
+    report = bulk(client, [song('One'), {'title': 123, 'artist': 'A', 'emotion_tag': 'Happy'}])
+    assert (report['inserted'], report['rejected']) == (1, 1)
+    assert report['errors'] == [{'row': 1, 'error': 'Fields must be strings: title'}]
+    assert stored(app) == [('One', 'Artist')]
+
+
+def test_route_accepts_uploads(client, app):
+    for name, text in (('songs.csv', CSV), ('songs.ndjson', NDJSON)):
+        response = client.post('/api/songs/bulk', data={'file': (io.BytesIO(text.encode()), name)},
+                               content_type='multipart/form-data')
+        assert response.status_code == 201, response.get_data(as_text=True)
+        assert response.get_json()['inserted'] == 2
+    assert stored(app) == [('One', 'A'), ('Two', 'B')] * 2
+    assert client.get('/api/songs?emotion=SAD').get_json()[0]['title'] == 'Two'
+
+
+def test_route_rejects_malformed_payloads(client):
+    response = client.post('/api/songs/bulk', data='{"title":', content_type='application/json')
+    assert response.status_code == 400
+    response = client.post('/api/songs/bulk?chunk_size=0', json=[song('One')])
+    assert response.status_code == 400
+
+
+def test_inserts_in_chunks(client, app, executemany):
+    songs = [song(f'Song {n}', link='https://example.com' if n == 4 else None) for n in range(5)]
+    report = bulk(client, songs, chunk_size=2)
+    assert report['chunks'] == [
+        {'chunk': 0, 'offset': 0, 'inserted': 2, 'skipped': 0},
+        {'chunk': 1, 'offset': 2, 'inserted': 2, 'skipped': 0},
+        {'chunk': 2, 'offset': 4, 'inserted': 1, 'skipped': 0},
+    ]
+    assert executemany == [2, 2]
+    with app.app_context():
+        # Only the chunk with a link queues an enrichment job
+        assert db.session.execute(db.select(Job.kind)).scalars().all() == ['enrich_pending']
+        assert db.session.execute(db.select(db.func.count()).select_from(Song)).scalar() == 5
+
+
+def test_dedupe_within_the_input_and_against_the_database(client, app):
+    bulk(client, [song('Old', 'A')])
+    rows = [song('New', 'A'), song('Old', 'A'), song('New', 'A'), song('New', 'B'), song('Old', 'A')]
+    report = bulk(client, rows, chunk_size=2, dedupe='true')
+    assert (report['inserted'], report['skipped']) == (2, 3)
+    assert [(c['inserted'], c['skipped']) for c in report['chunks']] == [(1, 1), (1, 1), (0, 1)]
+    assert stored(app) == [('Old', 'A'), ('New', 'A'), ('New', 'B')]
+
+
+def test_without_dedupe_duplicates_are_inserted(app):
+    with app.app_context():
+        valid, _ = validate_rows([song('Same'), song('Same')])
+        assert insert_songs(valid, chunk_size=10) == [{'chunk': 0, 'offset': 0, 'inserted': 2, 'skipped': 0}]
+    assert stored(app) == [('Same', 'Artist')] * 2
@@ -0,0 +1,93 @@
+"""
+Conditional requests: ETag and Last-Modified validators answered with 304 until the catalog changes
+"""
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from conftest import add_song
+from models import db, Song
+
+
+def revalidate(client, url, response):
+    """Status of a conditional GET with the validators of an earlier response"""
+    return client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code
+
+
+def test_song_list_round_trip(client):
+    add_song(client, 'One', 'Happy')
+    first = client.get('/api/songs?emotion=Happy')
+    assert first.status_code == 200
+    assert first.headers['ETag'] and first.headers['Last-Modified']
+    assert first.headers['Cache-Control']
+    
+    not_modified = client.get('/api/songs?emotion=Happy', headers={'If-None-Match': first.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.get_data() == b''
+    assert not_modified.headers['ETag'] == first.headers['ETag']
+    
+    add_song(client, 'Two', 'happy')
+    assert revalidate(client, '/api/songs?emotion=Happy', first) == 200
+
+
+def test_writes_to_other_moods_keep_the_etag(client):
+    add_song(client, 'One', 'Happy')
+    happy = client.get('/api/songs?emotion=Happy')
+    everything = client.get('/api/songs')
+    add_song(client, 'Two', 'Sad')
+    assert revalidate(client, '/api/songs?emotion=Happy', happy) == 304
+    assert revalidate(client, '/api/songs', everything) == 200
+
+
+def test_queries_get_their_own_etags(client):
+    add_song(client, 'One', 'Happy')
+    full = client.get('/api/songs?emotion=Happy')
+    page = client.get('/api/songs?emotion=Happy&limit=1')
+    assert full.headers['ETag'] != page.headers['ETag']
+    assert revalidate(client, '/api/songs?emotion=Happy&limit=1', page) == 304
+    assert client.get('/api/songs?emotion=Happy&limit=1',
+                      headers={'If-None-Match': full.headers['ETag']}).status_code == 200
+
+
+def test_if_modified_since(client):
+    add_song(client, 'One', 'Happy')
+    first = client.get('/api/songs?emotion=Happy')
+    assert client.get('/api/songs?emotion=Happy',
+                      headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 304
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(days=1), usegmt=True)
+    assert client.get('/api/songs?emotion=Happy', headers={'If-Modified-Since': earlier}).status_code == 200
+    # If-None-Match wins over If-Modified-Since
+    assert client.get('/api/songs?emotion=Happy', headers={
+        'If-None-Match': '"stale"', 'If-Modified-Since': first.headers['Last-Modified']}).status_code == 200
+
+
+def test_single_song_round_trip(client):
+    song = add_song(client, 'One', 'Happy')
+    other = add_song(client, 'Two', 'Happy')
+    first = client.get(f"/api/songs/{song['song_id']}")
+    assert first.get_json()['title'] == 'One'
+    assert revalidate(client, f"/api/songs/{song['song_id']}", first) == 304
+    # Another song's write leaves this one's ETag alone
+    add_song(client, 'Three', 'Happy')
+    assert revalidate(client, f"/api/songs/{song['song_id']}", first) == 304
+    assert client.get(f"/api/songs/{other['song_id'] + 10}").status_code == 404
+
+
+def test_a_reused_song_id_gets_a_new_etag(app, client):
+    song = add_song(client, 'Deleted', 'Happy')
+    first = client.get(f"/api/songs/{song['song_id']}")
+    with app.app_context():
+        # Removed outside the API, e.g. by a maintenance script; SQLite hands the id out again
+        db.session.execute(db.delete(Song).where(Song.song_id == song['song_id']))
+        db.session.commit()
+    assert add_song(client, 'Replacement', 'Happy')['song_id'] == song['song_id']
+    fresh = client.get(f"/api/songs/{song['song_id']}", headers={'If-None-Match': first.headers['ETag']})
+    assert fresh.status_code == 200
+    assert fresh.get_json()['title'] == 'Replacement'
+
+
+def test_emotions_round_trip(client):
+    add_song(client, 'One', 'Happy')
+    first = client.get('/api/songs/emotions?counts=true')
+    assert revalidate(client, '/api/songs/emotions?counts=true', first) == 304
+    assert revalidate(client, '/api/songs/emotions', first) == 200
+    add_song(client, 'Two', 'Sad')
+    assert revalidate(client, '/api/songs/emotions?counts=true', first) == 200
@@ -0,0 +1,55 @@
+"""
+Database engine tuning: pragmas on every SQLite connection and pool options per backend
+"""
+from sqlalchemy.pool import QueuePool
+from config import Config
+from conftest import make_app
+from database import engine_options, normalize_database_uri
+from models import db
+
+
+def pragma(name):
+    return db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+
+
+def settings(uri):
+    return {name: getattr(Config, name) for name in dir(Config) if name.isupper()} | {'SQLALCHEMY_DATABASE_URI': uri}
+
+
+def test_every_connection_gets_the_pragmas(app):
+    with app.app_context():
+        with db.engine.connect() as first, db.engine.connect() as second:
+            for conn in (first, second):
+                values = {name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+                          for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size',
+                                       'busy_timeout', 'temp_store')}
+                # synchronous NORMAL is 1 and temp_store MEMORY is 2
+                assert values == {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -64000,
+                                  'mmap_size': 256 * 1024 * 1024, 'busy_timeout': 5000, 'temp_store': 2}
+
+
+def test_pragmas_follow_the_config(tmp_path):
+    app = make_app(str(tmp_path), SQLITE_SYNCHRONOUS='FULL', SQLITE_CACHE_SIZE=-2000, SQLITE_BUSY_TIMEOUT=250)
+    with app.app_context():
+        assert (pragma('synchronous'), pragma('cache_size'), pragma('busy_timeout')) == (2, -2000, 250)
+
+
+def test_file_databases_get_a_sized_pool(app):
+    with app.app_context():
+        assert isinstance(db.engine.pool, QueuePool)
+        assert db.engine.pool.size() == Config.DB_POOL_SIZE
+
+
+def test_engine_options_per_backend():
+    memory = engine_options(settings('sqlite://'))
+    assert 'pool_size' not in memory
+    assert memory['connect_args'] == {'timeout': 5.0, 'check_same_thread': False}
+    
+    postgres = engine_options(settings('postgresql://db/app'))
+    assert postgres['pool_recycle'] == Config.DB_POOL_RECYCLE
+    assert 'connect_args' not in postgres
+
+
+def test_legacy_postgres_scheme():
+    assert normalize_database_uri('postgres://u@h/db') == 'postgresql://u@h/db'
+    assert normalize_database_uri('sqlite:///x.db') == 'sqlite:///x.db'
@@ -0,0 +1,51 @@
+"""
+Emotion lookups: filters match whatever the case, through the indexed emotion_key
+"""
+from models import db, Song
+from conftest import add_song
+
+
+def titles(response):
+    return [song['title'] for song in response.get_json()]
+
+
+def test_emotion_filter_ignores_case(client):
+    add_song(client, 'One', 'Happy')
+    add_song(client, 'Two', 'HAPPY')
+    add_song(client, 'Three', 'Sad')
+    for emotion in ('happy', 'Happy', 'hApPy'):
+        assert titles(client.get(f'/api/songs?emotion={emotion}')) == ['One', 'Two']
+    assert titles(client.get('/api/songs?emotion=sad')) == ['Three']
+    assert titles(client.get('/api/songs?emotion=Calm')) == []
+
+
+def test_emotion_tag_keeps_its_case(client):
+    add_song(client, 'One', 'HaPpY')
+    assert client.get('/api/songs?emotion=happy').get_json()[0]['emotion_tag'] == 'HaPpY'
+
+
+def test_emotion_key_follows_emotion_tag(app):
+    with app.app_context():
+        song = Song.from_dict({'title': 'One', 'artist': 'Artist', 'emotion_tag': 'Happy'})
+        db.session.add(song)
+        db.session.commit()
+        assert song.emotion_key == 'happy'
+        song.emotion_tag = 'RELAXED'
+        db.session.commit()
+        db.session.expire_all()
+        stored = db.session.get(Song, song.song_id)
+        assert (stored.emotion_tag, stored.emotion_key) == ('RELAXED', 'relaxed')
+
+
+def test_non_ascii_emotions(client):
+    add_song(client, 'Joy', 'Ÿ Fröhlich')
+    assert Song.normalize_emotion('Ÿ Fröhlich') == 'ÿ fröhlich'
+    assert titles(client.get('/api/songs', query_string={'emotion': 'ÿ FRÖHLICH'})) == ['Joy']
+
+
+def test_lookup_uses_the_emotion_index(app):
+    with app.app_context():
+        plan = db.session.execute(db.text(
+            'EXPLAIN QUERY PLAN SELECT song_id FROM songs WHERE emotion_key = :key ORDER BY song_id'
+        ), {'key': 'happy'}).fetchall()
+        assert 'ix_songs_emotion_key_song_id' in ' '.join(str(row[-1]) for row in plan)
@@ -0,0 +1,66 @@
+"""
+Columnar MessagePack responses: negotiation, the same rows as JSON, and ETags per encoding
+"""
+import msgpack
+from conftest import add_song
+from encoding import JSON, MSGPACK, negotiate
+
+PACKED = {'Accept': MSGPACK}
+
+
+def unpacked(response):
+    assert response.status_code == 200, response.get_data()
+    assert response.mimetype == MSGPACK
+    body = msgpack.unpackb(response.get_data())
+    return [dict(zip(body['fields'], row)) for row in body['rows']]
+
+
+def test_negotiation():
+    for accept in (None, '', '*/*', 'text/html', 'application/json, application/msgpack;q=0.5'):
+        assert negotiate(accept) == JSON, accept
+    for accept in ('application/msgpack', 'application/x-msgpack', 'application/msgpack, */*;q=0.1'):
+        assert negotiate(accept) == MSGPACK, accept
+
+
+def test_lists_carry_the_same_rows(client):
+    add_song(client, 'One', 'Happy', genre='Pop')
+    add_song(client, 'Two', 'Sad')
+    for url in ('/api/songs', '/api/songs?emotion=happy', '/api/songs?limit=1', '/api/songs?fields=title',
+                '/api/songs/search?q=one'):
+        json_body = client.get(url).get_json()
+        # The second request is served from the cached body
+        for _ in range(2):
+            assert unpacked(client.get(url, headers=PACKED)) == json_body, url
+
+
+def test_pages_keep_their_cursor(client):
+    for n in range(3):
+        add_song(client, f'Song {n}')
+    first = client.get('/api/songs?limit=2', headers=PACKED)
+    assert [song['title'] for song in unpacked(first)] == ['Song 0', 'Song 1']
+    rest = client.get(f"/api/songs?limit=2&after={first.headers['X-Next-Cursor']}", headers=PACKED)
+    assert [song['title'] for song in unpacked(rest)] == ['Song 2']
+
+
+def test_personalized_lists_are_packed_too(client):
+    add_song(client, 'One', 'Happy', genre='Pop')
+    add_song(client, 'Two', 'Happy', genre='Rock')
+    token = client.post('/api/auth/register', json={'username': 'fan', 'email': 'fan@example.com',
+                                                    'password': 'secret123'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    json_body = client.get('/api/songs?emotion=Happy', headers=headers).get_json()
+    assert unpacked(client.get('/api/songs?emotion=Happy', headers=dict(headers, **PACKED))) == json_body
+
+
+def test_each_encoding_has_its_own_etag(client):
+    add_song(client, 'One')
+    for url in ('/api/songs', '/api/songs?limit=1', '/api/songs/search?q=one'):
+        as_json = client.get(url)
+        packed = client.get(url, headers=PACKED)
+        assert as_json.headers['ETag'] != packed.headers['ETag'], url
+        assert 'Accept' in packed.headers['Vary'] and 'Accept' in as_json.headers['Vary']
+        
+        # A cached JSON body is not revalidated as MessagePack, or the other way round
+        assert client.get(url, headers={'If-None-Match': as_json.headers['ETag']}).status_code == 304
+        assert client.get(url, headers=dict(PACKED, **{'If-None-Match': as_json.headers['ETag']})).status_code == 200
+        assert client.get(url, headers=dict(PACKED, **{'If-None-Match': packed.headers['ETag']})).status_code == 304
@@ -0,0 +1,78 @@
+"""
+NDJSON catalog export: emotion filter, inclusive since cursor and timezone handling
+"""
+import json
+from datetime import datetime
+import pytest
+from export import parse_since
+from models import db, Song
+
+
+@pytest.fixture
+def catalog(app):
+    """Three songs with known update times"""
+    with app.app_context():
+        for title, emotion, updated_at in (('Early', 'Happy', datetime(2024, 1, 1, 8)),
+                                           ('Noon', 'sad', datetime(2024, 1, 1, 12)),
+                                           ('Late', 'HAPPY', datetime(2024, 1, 1, 18))):
+            song = Song.from_dict({'title': title, 'artist': 'Artist', 'emotion_tag': emotion})
+            song.updated_at = updated_at
+            db.session.add(song)
+        db.session.commit()
+
+
+def export(client, **args):
+    response = client.get('/api/songs/export', query_string=args)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def titles(songs):
+    return [song['title'] for song in songs]
+
+
+def test_exports_every_song_in_update_order(client, catalog):
+    songs = export(client)
+    assert titles(songs) == ['Early', 'Noon', 'Late']
+    assert songs[0]['updated_at'] == '2024-01-01T08:00:00'
+    assert set(songs[0]) == set(Song.FIELDS) | {'updated_at'}
+
+
+def test_emotion_filter_ignores_case(client, catalog):
+    assert titles(export(client, emotion='happy')) == ['Early', 'Late']
+    assert titles(export(client, emotion='SAD')) == ['Noon']
+
+
+def test_since_is_inclusive(client, catalog):
+    assert titles(export(client, since='2024-01-01T12:00:00')) == ['Noon', 'Late']
+    assert titles(export(client, since='2024-01-01T12:00:01')) == ['Late']
+    assert titles(export(client, since='2024-01-01T12:00:00', emotion='happy')) == ['Late']
+
+
+def test_since_with_an_offset_is_read_as_utc(client, catalog):
+    # 14:00 at UTC+2 is noon UTC
+    assert titles(export(client, since='2024-01-01T14:00:00+02:00')) == ['Noon', 'Late']
+    assert titles(export(client, since='2024-01-01T07:00:00-05:00')) == ['Noon', 'Late']
+    assert titles(export(client, since='2024-01-01T12:00:00Z')) == ['Noon', 'Late']
+
+
+def test_parse_since():
+    assert parse_since('') is None
+    assert parse_since('2024-01-01T14:00:00+02:00') == datetime(2024, 1, 1, 12)
+    assert parse_since('2024-01-01T14:00:00+02:00').tzinfo is None
+
+
+def test_malformed_since_is_rejected(client):
+    response = client.get('/api/songs/export?since=yesterday')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_event_times_with_an_offset_are_stored_as_utc(app, catalog):
+    from events import validate_events
+    with app.app_context():
+        rows, errors = validate_events([{'song_id': 1, 'event_type': 'play',
+                                         'played_at': '2024-01-01T14:00:00+02:00'}], user_id=1)
+        assert errors == []
+        assert rows[0]['played_at'] == '2024-01-01T12:00:00'
@@ -0,0 +1,69 @@
+"""
+Materialized emotion x genre counts: kept in step with inserts, bulk loads, re-tags and deletes
+"""
+from conftest import add_song
+from facets import FACETS_QUERY, rebuild
+from models import db, Song
+
+
+def facets(client):
+    """(emotion_tag, genre, count) per facet from the emotions endpoint"""
+    body = client.get('/api/songs/emotions?counts=true').get_json()
+    return sorted((facet['emotion_tag'], facet['genre'], facet['count']) for facet in body['facets'])
+
+
+def recounted(app):
+    """song_facets as rebuild would recompute it from songs"""
+    with app.app_context():
+        stored = db.session.execute(FACETS_QUERY).all()
+        with db.engine.begin() as conn:
+            rebuild(conn)
+        return stored == db.session.execute(FACETS_QUERY).all()
+
+
+def test_counts_follow_inserts(client):
+    add_song(client, 'One', 'Happy', genre='Pop')
+    add_song(client, 'Two', 'Happy', genre='Pop')
+    add_song(client, 'Three', 'Sad')
+    add_song(client, 'Four', 'happy', genre='Rock')
+    body = client.get('/api/songs/emotions?counts=true').get_json()
+    assert body['emotions'] == ['Happy', 'Sad']
+    assert (body['total'], body['counts']) == (4, {'happy': 3, 'sad': 1})
+    assert facets(client) == [('Happy', 'Pop', 2), ('Happy', 'Rock', 1), ('Sad', None, 1)]
+    assert client.get('/api/songs/emotions').get_json() == {'emotions': ['Happy', 'Sad']}
+
+
+def test_counts_follow_bulk_loads(app, client):
+    add_song(client, 'One', 'Happy', genre='Pop')
+    rows = [{'title': f'Song {n}', 'artist': 'Artist', 'emotion_tag': 'Calm', 'genre': 'Ambient'} for n in range(3)]
+    assert client.post('/api/songs/bulk', json=rows).status_code == 201
+    assert facets(client) == [('Calm', 'Ambient', 3), ('Happy', 'Pop', 1)]
+    assert recounted(app)
+
+
+def test_counts_follow_retags_and_deletes(app, client):
+    first = add_song(client, 'One', 'Happy', genre='Pop')
+    second = add_song(client, 'Two', 'Happy', genre='Pop')
+    with app.app_context():
+        song = db.session.get(Song, first['song_id'])
+        song.emotion_tag, song.genre = 'Sad', None
+        db.session.commit()
+    assert facets(client) == [('Happy', 'Pop', 1), ('Sad', None, 1)]
+    
+    # A facet whose last song goes is dropped rather than left at zero
+    with app.app_context():
+        db.session.delete(db.session.get(Song, second['song_id']))
+        db.session.commit()
+    assert facets(client) == [('Sad', None, 1)]
+    assert client.get('/api/songs/emotions').get_json() == {'emotions': ['Sad']}
+    assert recounted(app)
+
+
+def test_revalidation_follows_the_counts(client):
+    add_song(client, 'One', 'Happy')
+    etag = client.get('/api/songs/emotions?counts=true').headers['ETag']
+    assert client.get('/api/songs/emotions?counts=true', headers={'If-None-Match': etag}).status_code == 304
+    add_song(client, 'Two', 'Happy')
+    response = client.get('/api/songs/emotions?counts=true', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['total'] == 2
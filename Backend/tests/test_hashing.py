@@ -0,0 +1,75 @@
+"""
+Password hashing pool: bounded queue, 429 when saturated, and cost upgrades on login
+"""
+import threading
+from conftest import make_app
+from hashing import hash_rounds, password_hasher
+from models import User
+
+USER = {'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}
+
+
+def occupy_pool():
+    """Hold every hashing worker until the returned event is set"""
+    release = threading.Event()
+    started = threading.Event()
+    
+    def block():
+        started.set()
+        release.wait(10)
+    future = password_hasher._submit('test', block)
+    assert started.wait(5)
+    return release, future
+
+
+def test_hash_and_check(app):
+    # The pool and its counters are process-wide, shared with earlier apps
+    latency = password_hasher.stats()['latency']
+    before = {kind: latency.get(kind, {}).get('count', 0) for kind in ('hash', 'check')}
+    with app.app_context():
+        hashed = password_hasher.hash('secret123')
+        assert hash_rounds(hashed) == 4
+        assert password_hasher.check(hashed, 'secret123')
+        assert not password_hasher.check(hashed, 'wrong')
+        stats = password_hasher.stats()
+        assert stats['latency']['hash']['count'] == before['hash'] + 1
+        assert stats['latency']['check']['count'] == before['check'] + 2
+        assert stats['in_flight'] == 0
+
+
+def test_hash_rounds():
+    assert hash_rounds('$2b$12$abcdefghijklmnopqrstuv') == 12
+    assert hash_rounds('plain') is None
+    assert hash_rounds(None) is None
+
+
+def test_full_queue_returns_429(tmp_path):
+    app = make_app(str(tmp_path), HASH_WORKERS=1, HASH_QUEUE_SIZE=0)
+    client = app.test_client()
+    assert client.post('/api/auth/register', json=USER).status_code == 201
+    rejected = password_hasher.stats()['rejected']
+    release, future = occupy_pool()
+    try:
+        for path, body in (('/api/auth/register', dict(USER, username='bob', email='bob@example.com')),
+                           ('/api/auth/login', {'login': 'alice', 'password': 'secret123'})):
+            response = client.post(path, json=body)
+            assert response.status_code == 429, path
+            assert response.headers['Retry-After'] == '1'
+        assert password_hasher.stats()['rejected'] == rejected + 2
+        with app.app_context():
+            assert User.query.filter_by(username='bob').first() is None
+    finally:
+        release.set()
+        future.result(5)
+    assert client.post('/api/auth/login', json={'login': 'alice', 'password': 'secret123'}).status_code == 200
+
+
+def test_login_upgrades_outdated_hashes(tmp_path):
+    client = make_app(str(tmp_path)).test_client()
+    assert client.post('/api/auth/register', json=USER).status_code == 201
+    
+    app = make_app(str(tmp_path), BCRYPT_LOG_ROUNDS=5)
+    client = app.test_client()
+    assert client.post('/api/auth/login', json={'login': 'alice', 'password': 'secret123'}).status_code == 200
+    with app.app_context():
+        assert hash_rounds(User.query.filter_by(username='alice').one().password_hash) == 5
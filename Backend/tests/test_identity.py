@@ -0,0 +1,89 @@
+"""
+Identity resolution: cached profiles, profiles embedded in tokens, and invalidation on change
+"""
+import time
+import pytest
+from conftest import make_app
+from identity import profile_changes, user_cache
+from models import db, User
+
+
+def register(client, name='alice'):
+    """Register a user; returns (user id, auth headers)"""
+    body = client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com',
+                                                    'password': 'secret123'}).get_json()
+    return body['user']['id'], {'Authorization': f"Bearer {body['access_token']}"}
+
+
+def test_profiles_come_from_the_cache(app, client):
+    user_id, headers = register(client)
+    assert client.get('/api/auth/me', headers=headers).get_json()['username'] == 'alice'
+    hits = user_cache.stats()['hits']
+    with app.app_context():
+        # A cached profile does not need the row
+        db.session.execute(db.update(User).where(User.id == user_id).values(username='renamed-behind-our-back'))
+        db.session.commit()
+    assert client.get('/api/auth/me', headers=headers).get_json()['username'] == 'alice'
+    assert client.get(f'/api/users/{user_id}', headers=headers).get_json()['username'] == 'alice'
+    assert user_cache.stats()['hits'] == hits + 2
+
+
+def test_updates_invalidate_the_cached_profile(client):
+    user_id, headers = register(client)
+    client.get('/api/auth/me', headers=headers)
+    response = client.put(f'/api/users/{user_id}', json={'username': 'alicia'}, headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert client.get('/api/auth/me', headers=headers).get_json()['username'] == 'alicia'
+
+
+def test_deleted_users_are_not_found(client):
+    user_id, headers = register(client)
+    other_id, other_headers = register(client, 'bob')
+    client.get(f'/api/users/{user_id}', headers=other_headers)
+    assert client.delete(f'/api/users/{user_id}', headers=headers).status_code == 200
+    assert client.get(f'/api/users/{user_id}', headers=other_headers).status_code == 404
+
+
+@pytest.fixture
+def claims_client(tmp_path):
+    profile_changes.clear()
+    yield make_app(str(tmp_path), JWT_PROFILE_CLAIMS=True).test_client()
+    profile_changes.clear()
+
+
+def test_token_profiles_skip_the_database(claims_client):
+    app = claims_client.application
+    user_id, headers = register(claims_client)
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.id == user_id).values(username='renamed-behind-our-back'))
+        db.session.commit()
+    user_cache.clear()
+    assert claims_client.get('/api/auth/me', headers=headers).get_json()['username'] == 'alice'
+    assert user_cache.stats()['entries'] == 0
+
+
+def test_token_profiles_older_than_a_change_are_ignored(claims_client):
+    user_id, headers = register(claims_client)
+    # Tokens carry whole seconds; make the change land after this token was issued
+    time.sleep(1.1)
+    assert claims_client.put(f'/api/users/{user_id}', json={'username': 'alicia'},
+                             headers=headers).status_code == 200
+    assert claims_client.get('/api/auth/me', headers=headers).get_json()['username'] == 'alicia'
+    
+    token = claims_client.post('/api/auth/login', json={'login': 'alicia', 'password': 'secret123'}).get_json()
+    assert token['user']['username'] == 'alicia'
+
+
+def test_invalid_tokens_on_public_routes_are_anonymous(client):
+    response = client.get('/api/songs?emotion=Happy', headers={'Authorization': 'Bearer not-a-token'})
+    assert response.status_code == 200
+    assert client.get('/api/auth/me', headers={'Authorization': 'Bearer not-a-token'}).status_code == 422
+
+
+def test_token_stats_count_decodes(client):
+    _, headers = register(client)
+    before = client.get('/api/auth/token-stats').get_json()['decode']['count']
+    client.get('/api/auth/me', headers=headers)
+    stats = client.get('/api/auth/token-stats').get_json()
+    assert stats['decode']['count'] == before + 1
+    assert {'hits', 'misses', 'entries'} <= set(stats['user_cache'])
@@ -0,0 +1,86 @@
+"""
+Cache invalidation between two app instances sharing one database
+"""
+import json
+import os
+import subprocess
+import sys
+import pytest
+from conftest import make_app
+from invalidation import invalidation_bus
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# A second instance in its own process, as another worker or node would be:
+# adds a song and prints the ETag it then serves for the mood's list
+WRITER = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+from conftest import make_app
+app = make_app(sys.argv[2], INVALIDATION_ENABLED=True, INVALIDATION_POLL_INTERVAL=3600)
+client = app.test_client()
+response = client.post('/api/songs', json=json.loads(sys.argv[3]))
+assert response.status_code == 201, response.get_data(as_text=True)
+print(json.dumps({'etag': client.get('/api/songs?emotion=Happy').headers['ETag']}))
+"""
+
+
+def write_elsewhere(directory, song):
+    """Add a song through another app instance on the same database; returns its list ETag"""
+    result = subprocess.run([sys.executable, '-c', WRITER, TESTS_DIR, directory, json.dumps(song)],
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])['etag']
+
+
+@pytest.fixture
+def shared(tmp_path):
+    """This process's app, with the invalidation bus on but polled only by the test"""
+    app = make_app(str(tmp_path), INVALIDATION_ENABLED=True, INVALIDATION_POLL_INTERVAL=3600)
+    yield app, str(tmp_path)
+    invalidation_bus.stop()
+
+
+def titles(response):
+    return sorted(song['title'] for song in response.get_json())
+
+
+def test_write_in_one_instance_invalidates_the_other(shared):
+    app, directory = shared
+    client = app.test_client()
+    assert client.post('/api/songs', json={'title': 'First', 'artist': 'A', 'emotion_tag': 'Happy'}).status_code == 201
+    
+    cached = client.get('/api/songs?emotion=Happy')
+    assert titles(cached) == ['First']
+    etag = cached.headers['ETag']
+    assert client.get('/api/songs?emotion=Happy', headers={'If-None-Match': etag}).status_code == 304
+    
+    other_etag = write_elsewhere(directory, {'title': 'Second', 'artist': 'B', 'emotion_tag': 'happy'})
+    
+    # Until it polls, this instance still serves its cached list
+    assert titles(client.get('/api/songs?emotion=Happy')) == ['First']
+    
+    with app.app_context():
+        assert invalidation_bus.poll() == 1
+    fresh = client.get('/api/songs?emotion=Happy')
+    assert titles(fresh) == ['First', 'Second']
+    assert fresh.headers['ETag'] != etag
+    # Both instances derive the same ETag from the shared catalog version
+    assert fresh.headers['ETag'] == other_etag
+    assert client.get('/api/songs?emotion=Happy', headers={'If-None-Match': etag}).status_code == 200
+    
+    with app.app_context():
+        assert invalidation_bus.poll() == 0
+
+
+def test_unrelated_moods_stay_cached(shared):
+    app, directory = shared
+    client = app.test_client()
+    client.post('/api/songs', json={'title': 'Calm', 'artist': 'A', 'emotion_tag': 'Relaxed'})
+    etag = client.get('/api/songs?emotion=Relaxed').headers['ETag']
+    
+    write_elsewhere(directory, {'title': 'Loud', 'artist': 'B', 'emotion_tag': 'Angry'})
+    with app.app_context():
+        assert invalidation_bus.poll() == 1
+    assert client.get('/api/songs?emotion=Relaxed', headers={'If-None-Match': etag}).status_code == 304
+    assert titles(client.get('/api/songs?emotion=Angry')) == ['Loud']
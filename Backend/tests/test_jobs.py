@@ -0,0 +1,155 @@
+"""
+Job queue: claiming, retries with backoff, lease expiry and the link enrichment jobs
+"""
+from datetime import datetime, timedelta
+import pytest
+from jobs import PermanentJobError, job_queue
+from links import link_enricher
+from models import db, Job, Song
+
+
+@pytest.fixture
+def calls():
+    """Payloads received by test_job, which fails its first payload['fail'] runs, or for good with 'permanent'"""
+    received = []
+    
+    @job_queue.handler('test_job')
+    def test_job(payload):
+        received.append(payload)
+        if payload.get('permanent'):
+            raise PermanentJobError('bad payload')
+        if len(received) <= payload.get('fail', 0):
+            raise RuntimeError('try again')
+    
+    yield received
+    job_queue.handlers.pop('test_job', None)
+
+
+def enqueue(payload=None, delay=0):
+    """Queue a test_job and return its id"""
+    job_queue.enqueue('test_job', payload, delay=delay)
+    db.session.commit()
+    return db.session.execute(db.select(db.func.max(Job.id))).scalar()
+
+
+def job(job_id):
+    """Fresh copy of a job row"""
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+
+def test_claims_due_jobs_once(app, calls):
+    with app.app_context():
+        first = enqueue({'n': 1})
+        enqueue({'n': 2}, delay=3600)
+        assert job_queue.run_one()
+        assert not job_queue.run_one()
+        assert calls == [{'n': 1}]
+        done = job(first)
+        assert (done.status, done.attempts, done.locked_by) == ('done', 1, None)
+        assert done.finished_at is not None
+
+
+def test_a_claimed_job_is_not_claimed_again(app, calls):
+    with app.app_context():
+        job_id = enqueue()
+        claimed = job_queue._claim()
+        assert claimed['id'] == job_id
+        assert job(job_id).status == 'running'
+        assert job(job_id).locked_by == job_queue.worker_id
+        assert job_queue._claim() is None
+
+
+def test_failed_attempts_retry_with_backoff(app, calls, monkeypatch):
+    monkeypatch.setattr(job_queue, 'backoff_base', 10.0)
+    monkeypatch.setattr(job_queue, 'backoff_max', 25.0)
+    with app.app_context():
+        job_id = enqueue({'fail': 3})
+        delays = []
+        for attempt in range(1, 4):
+            before = datetime.utcnow()
+            assert job_queue.run_one()
+            retried = job(job_id)
+            assert (retried.status, retried.attempts) == ('queued', attempt)
+            assert retried.last_error == 'RuntimeError: try again'
+            delays.append((retried.run_after - before).total_seconds())
+            # Not due until the backoff has passed
+            assert not job_queue.run_one()
+            retried.run_after = datetime.utcnow()
+            db.session.commit()
+        # 10s doubled per attempt, capped at 25s, each +-10%
+        for delay, expected in zip(delays, (10, 20, 25)):
+            assert expected * 0.9 - 1 <= delay <= expected * 1.1 + 1
+        assert job_queue.run_one()
+        assert job(job_id).status == 'done'
+        assert len(calls) == 4
+
+
+def test_gives_up_after_max_attempts(app, calls, monkeypatch):
+    monkeypatch.setattr(job_queue, 'max_attempts', 2)
+    monkeypatch.setattr(job_queue, 'backoff_base', 0)
+    with app.app_context():
+        job_id = enqueue({'fail': 5})
+        assert job_queue.run_one()
+        assert job(job_id).status == 'queued'
+        assert job_queue.run_one()
+        assert (job(job_id).status, job(job_id).attempts) == ('failed', 2)
+        assert not job_queue.run_one()
+
+
+def test_permanent_errors_fail_at_once(app, calls):
+    with app.app_context():
+        job_id = enqueue({'permanent': True})
+        assert job_queue.run_one()
+        failed = job(job_id)
+        assert (failed.status, failed.attempts) == ('failed', 1)
+        assert failed.last_error == 'PermanentJobError: bad payload'
+
+
+def test_expired_leases_are_requeued(app, calls, monkeypatch):
+    monkeypatch.setattr(job_queue, 'lease', 60.0)
+    with app.app_context():
+        job_id = enqueue()
+        assert job_queue._claim()['id'] == job_id
+        now = datetime.utcnow()
+        # Within the lease the running job stays with its worker
+        monkeypatch.setattr(job_queue, '_last_sweep', None)
+        job_queue._sweep(now + timedelta(seconds=30))
+        assert job(job_id).status == 'running'
+        # After it, the worker is presumed dead and the job runs again
+        monkeypatch.setattr(job_queue, '_last_sweep', None)
+        job_queue._sweep(now + timedelta(seconds=61))
+        requeued = job(job_id)
+        assert (requeued.status, requeued.locked_by, requeued.attempts) == ('queued', None, 1)
+        assert job_queue.run_one()
+        assert (job(job_id).status, job(job_id).attempts) == ('done', 2)
+        assert len(calls) == 1
+
+
+def test_link_jobs_with_a_stub_fetcher(app, client, monkeypatch):
+    statuses = {'https://example.com/gone': 404}
+    monkeypatch.setattr(link_enricher, 'fetcher', lambda url, timeout: statuses.get(url, 200))
+    links = ['https://example.com/gone', 'https://example.com/here?utm_source=x', 'ftp://x.y/z']
+    song_ids = []
+    for n, link in enumerate(links):
+        response = client.post('/api/songs', json={'title': f'Song {n}', 'artist': 'Artist',
+                                                   'emotion_tag': 'Happy', 'link': link})
+        assert response.get_json()['link_status'] == 'pending'
+        song_ids.append(response.get_json()['song_id'])
+    with app.app_context():
+        # A song stored without its job, as bulk loads and migrations leave them
+        loaded = Song.from_dict({'title': 'Loaded', 'artist': 'Artist', 'emotion_tag': 'Sad',
+                                 'link': 'https://youtu.be/dQw4w9WgXcQ'})
+        db.session.add(loaded)
+        job_queue.enqueue('enrich_pending')
+        db.session.commit()
+        song_ids.append(loaded.song_id)
+        
+        while job_queue.run_one():
+            pass
+        db.session.expire_all()
+        songs = [db.session.get(Song, song_id) for song_id in song_ids]
+        assert [song.link_status for song in songs] == ['dead', 'ok', 'invalid', 'ok']
+        assert songs[1].link == 'https://example.com/here'
+        assert (songs[3].link_provider, songs[3].link_provider_id) == ('youtube', 'dQw4w9WgXcQ')
+        assert db.session.execute(db.select(db.func.count()).select_from(Job).where(Job.status != 'done')).scalar() == 0
@@ -0,0 +1,157 @@
+"""
+Song links: normalization of provider share formats and refusal of non-public hosts
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+import links
+from links import UnsafeLinkError, check_url, http_fetch, link_enricher, normalize_link
+from models import db, Song
+
+VIDEO = 'dQw4w9WgXcQ'
+TRACK = '4uLU6hMCjMI75M1A2tKUQC'
+
+
+@pytest.mark.parametrize('raw', [
+    f'https://www.youtube.com/watch?v={VIDEO}',
+    f'http://youtube.com/watch?v={VIDEO}&t=42s&si=abc',
+    f'm.youtube.com/watch?v={VIDEO}',
+    f'https://music.youtube.com/watch?v={VIDEO}&feature=share',
+    f'https://youtu.be/{VIDEO}?si=tracking',
+    f'https://www.youtube.com/shorts/{VIDEO}',
+    f'https://www.youtube.com/embed/{VIDEO}',
+    f'https://www.youtube.com/live/{VIDEO}/',
+])
+def test_youtube_share_formats(raw):
+    assert normalize_link(raw) == {
+        'link': f'https://www.youtube.com/watch?v={VIDEO}', 'provider': 'youtube', 'provider_id': VIDEO,
+    }
+
+
+@pytest.mark.parametrize('raw', [
+    f'https://open.spotify.com/track/{TRACK}',
+    f'https://open.spotify.com/track/{TRACK}?si=0123456789abcdef',
+    f'https://open.spotify.com/intl-de/track/{TRACK}',
+    f'spotify:track:{TRACK}',
+])
+def test_spotify_share_formats(raw):
+    assert normalize_link(raw) == {
+        'link': f'https://open.spotify.com/track/{TRACK}', 'provider': 'spotify', 'provider_id': f'track:{TRACK}',
+    }
+
+
+@pytest.mark.parametrize('raw, track', [
+    ('https://soundcloud.com/Artist/Song-Name?utm_source=clipboard', 'artist/song-name'),
+    ('https://m.soundcloud.com/artist/song-name/', 'artist/song-name'),
+    ('https://soundcloud.com/artist/sets/album-name/s-token', 'artist/sets/album-name'),
+])
+def test_soundcloud_share_formats(raw, track):
+    assert normalize_link(raw) == {
+        'link': f'https://soundcloud.com/{track}', 'provider': 'soundcloud', 'provider_id': track,
+    }
+
+
+def test_other_links_lose_tracking():
+    info = normalize_link('HTTPS://Example.COM/music/song?id=7&utm_source=x&fbclid=y#player')
+    assert info == {'link': 'https://example.com/music/song?id=7', 'provider': None, 'provider_id': None}
+
+
+def test_provider_links_are_checked_through_oembed():
+    url = check_url(normalize_link(f'https://youtu.be/{VIDEO}'))
+    assert url.startswith('https://www.youtube.com/oembed?')
+    assert check_url(normalize_link('https://example.com/song')) == 'https://example.com/song'
+
+
+@pytest.mark.parametrize('raw', ['ftp://example.com/song.mp3', 'javascript:alert(1)', 'mailto:a@example.com',
+                                 'not a link', '', 'http://intranet/song'])
+def test_rejects_non_http_links(raw):
+    with pytest.raises(ValueError):
+        normalize_link(raw)
+
+
+@pytest.mark.parametrize('raw', [
+    'http://169.254.169.254/latest/meta-data/',
+    'http://127.0.0.1:6379/',
+    'http://10.1.2.3/admin',
+    'https://192.168.0.1/',
+    'http://172.16.5.4/',
+    'http://100.64.0.1/',
+    'http://0.0.0.0/',
+    'http://224.0.0.1/',
+    'http://[::1]/',
+    'http://[fe80::1]/',
+    'http://[fd00::1]/',
+    'http://[::ffff:127.0.0.1]/',
+    'http://localhost.localhost/',
+    'http://api.localhost:8080/',
+])
+def test_rejects_private_hosts(raw):
+    with pytest.raises(UnsafeLinkError):
+        normalize_link(raw)
+
+
+def test_accepts_public_ip():
+    assert normalize_link('http://93.184.216.34/song')['link'] == 'http://93.184.216.34/song'
+    assert normalize_link('https://[2606:4700::1111]:8443/')['link'] == 'https://[2606:4700::1111]:8443/'
+
+
+def test_fetch_refuses_names_resolving_to_private_addresses(monkeypatch):
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(2, 1, 6, '', ('10.0.0.8', port))]
+    monkeypatch.setattr(links.socket, 'getaddrinfo', getaddrinfo)
+    with pytest.raises(UnsafeLinkError):
+        http_fetch('http://songs.example.com/track', timeout=1)
+
+
+@pytest.fixture
+def redirecting_server():
+    """Local server answering every request with a redirect to 127.0.0.2 on the same port"""
+    requests = []
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            self.send_response(302)
+            self.send_header('Location', f'http://127.0.0.2:{self.server.server_port}/internal')
+            self.end_headers()
+        
+        def log_message(self, *args):
+            pass
+    
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_refuses_loopback(redirecting_server):
+    server, requests = redirecting_server
+    with pytest.raises(UnsafeLinkError):
+        http_fetch(f'http://127.0.0.1:{server.server_port}/', timeout=1)
+    assert requests == []
+
+
+def test_fetch_checks_every_redirect_hop(redirecting_server, monkeypatch):
+    server, requests = redirecting_server
+    # Let the first hop through as if it were public; its redirect target is not
+    monkeypatch.setattr(links, 'is_public_address', lambda address: address == '127.0.0.1')
+    with pytest.raises(UnsafeLinkError):
+        http_fetch(f'http://127.0.0.1:{server.server_port}/song', timeout=1)
+    assert requests == ['/song']
+
+
+def test_enrich_marks_private_links_invalid(app, monkeypatch):
+    fetched = []
+    monkeypatch.setattr(link_enricher, 'fetcher', lambda url, timeout: fetched.append(url) or 200)
+    with app.app_context():
+        song = Song(title='Song', artist='Artist', emotion_tag='Happy', link='http://169.254.169.254/latest')
+        public = Song(title='Other', artist='Artist', emotion_tag='Happy', link='https://Example.com/a?si=1')
+        db.session.add_all([song, public])
+        db.session.commit()
+        link_enricher.enrich(song.song_id)
+        link_enricher.enrich(public.song_id)
+        assert db.session.get(Song, song.song_id).link_status == 'invalid'
+        assert db.session.get(Song, public.song_id).link_status == 'ok'
+    assert fetched == ['https://example.com/a']
@@ -0,0 +1,79 @@
+"""
+Request metrics: Prometheus exposition, per-request SQL counts and slow-request profiles
+"""
+import os
+import re
+import time
+from conftest import add_song, make_app
+from metrics import MetricsRegistry, begin_request, current_stats, end_request
+from models import db, Song
+
+
+def sample(text, name, **labels):
+    """Value of one sample in Prometheus text output, or None"""
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = '^' + re.escape(name) + (r'\{' + re.escape(wanted) + r'\}' if wanted else '') + r' (\S+)$'
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_rendering():
+    registry = MetricsRegistry('test')
+    counter = registry.counter('things_total', 'Things', ('kind',))
+    histogram = registry.histogram('size', 'Sizes', (1, 5))
+    counter.inc('a"b')
+    counter.inc('a"b', amount=2)
+    for value in (0.5, 3, 9):
+        histogram.observe(value)
+    text = registry.render(gauges=[('depth', 'Depth', 4)], counters=[('done_total', 'Done', 2.0)])
+    assert '# TYPE test_things_total counter' in text
+    assert 'test_things_total{kind="a\\"b"} 3' in text
+    assert [sample(text, 'test_size_bucket', le=le) for le in ('1', '5', '+Inf')] == [1, 2, 3]
+    assert (sample(text, 'test_size_sum'), sample(text, 'test_size_count')) == (12.5, 3)
+    assert '# TYPE test_depth gauge\ntest_depth 4' in text
+    assert '# TYPE test_done_total counter\ntest_done_total 2' in text
+
+
+def test_requests_are_counted(client):
+    add_song(client, 'One')
+    before = client.get('/api/metrics').get_data(as_text=True)
+    client.get('/api/songs?emotion=Happy')
+    client.get('/api/songs/999')
+    text = client.get('/api/metrics').get_data(as_text=True)
+    
+    def delta(name, **labels):
+        return (sample(text, name, **labels) or 0) - (sample(before, name, **labels) or 0)
+    assert delta('moodtunes_requests_total', endpoint='api.get_songs', method='GET', status='200') == 1
+    assert delta('moodtunes_requests_total', endpoint='api.get_song', method='GET', status='404') == 1
+    assert delta('moodtunes_request_duration_seconds_count', endpoint='api.get_songs', method='GET') == 1
+    assert sample(text, 'moodtunes_song_cache_misses_total') is not None
+
+
+def test_sql_statements_are_attributed_to_the_request(app):
+    with app.app_context():
+        token = begin_request()
+        try:
+            db.session.execute(db.select(Song)).all()
+            db.session.execute(db.select(db.func.count()).select_from(Song)).scalar()
+            stats = current_stats()
+            assert stats.sql_count == 2
+            assert stats.sql_seconds > 0
+        finally:
+            end_request(token)
+        assert current_stats() is None
+
+
+def test_slow_requests_are_profiled(tmp_path):
+    app = make_app(str(tmp_path), PROFILE_SLOW_REQUESTS=True, PROFILE_SLOW_THRESHOLD_MS=20,
+                   PROFILE_SAMPLE_INTERVAL=0.001)
+    app.add_url_rule('/slow', 'slow', lambda: time.sleep(0.1) or 'done')
+    app.add_url_rule('/fast', 'fast', lambda: 'done')
+    client = app.test_client()
+    client.get('/fast')
+    client.get('/slow')
+    
+    profiles = os.listdir(app.config['PROFILE_DIR'])
+    assert len(profiles) == 1 and re.match(r'\d+T\d+-slow-\d+ms\.folded$', profiles[0])
+    with open(os.path.join(app.config['PROFILE_DIR'], profiles[0])) as f:
+        stacks = f.read()
+    assert '<lambda> (test_metrics.py' in stacks
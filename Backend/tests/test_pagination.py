@@ -0,0 +1,66 @@
+"""
+Keyset pagination and field projection on the list endpoints
+"""
+from conftest import add_song, make_app
+
+
+def walk(client, url):
+    """Follow X-Next-Cursor from url to the last page; returns the pages"""
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        pages.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f"{url.split('&after=')[0]}&after={cursor}" if cursor else None
+    return pages
+
+
+def test_pages_follow_the_cursor_without_gaps(client):
+    ids = [add_song(client, f'Song {n}', 'Happy' if n % 2 else 'Sad')['song_id'] for n in range(7)]
+    pages = walk(client, '/api/songs?limit=3')
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [song['song_id'] for page in pages for song in page] == ids
+    
+    happy = walk(client, '/api/songs?emotion=happy&limit=2')
+    assert [song['song_id'] for page in happy for song in page] == ids[1::2]
+
+
+def test_last_full_page_has_no_cursor(client):
+    for n in range(4):
+        add_song(client, f'Song {n}')
+    response = client.get('/api/songs?limit=4')
+    assert len(response.get_json()) == 4
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_rows_added_behind_the_cursor_are_not_repeated(client):
+    for n in range(4):
+        add_song(client, f'Song {n}')
+    first = client.get('/api/songs?limit=2')
+    cursor = first.headers['X-Next-Cursor']
+    add_song(client, 'Late')
+    rest = client.get(f'/api/songs?limit=10&after={cursor}').get_json()
+    assert [song['title'] for song in rest] == ['Song 2', 'Song 3', 'Late']
+
+
+def test_fields_projection_keeps_the_key(client):
+    add_song(client, 'One', genre='Pop')
+    songs = client.get('/api/songs?fields=title,genre').get_json()
+    assert songs == [{'song_id': songs[0]['song_id'], 'title': 'One', 'genre': 'Pop'}]
+
+
+def test_invalid_arguments_are_rejected(client):
+    for query in ('limit=0', 'limit=x', 'after=-1', 'fields=title,password'):
+        response = client.get(f'/api/songs?{query}')
+        assert response.status_code == 400, query
+        assert 'error' in response.get_json()
+
+
+def test_limit_is_capped(tmp_path):
+    client = make_app(str(tmp_path), API_MAX_PAGE_SIZE=2).test_client()
+    for n in range(3):
+        add_song(client, f'Song {n}')
+    response = client.get('/api/songs?limit=100')
+    assert len(response.get_json()) == 2
+    assert response.headers['X-Next-Cursor']
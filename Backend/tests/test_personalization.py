@@ -0,0 +1,57 @@
+"""
+Personalized mood lists: genre order from the user's affinities, and which requests count as selections
+"""
+from conftest import add_song
+from events import mood_buffer
+from models import db, MoodSelection
+
+
+def sign_up(client, name='fan'):
+    response = client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com',
+                                                       'password': 'secret123'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def selections(app):
+    with app.app_context():
+        mood_buffer.flush()
+        return db.session.execute(db.select(db.func.count()).select_from(MoodSelection)).scalar()
+
+
+def titles(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [song['title'] for song in response.get_json()]
+
+
+def test_genres_the_user_plays_come_first(client):
+    add_song(client, 'Pop One', 'Happy', genre='Pop')
+    add_song(client, 'Rock One', 'Happy', genre='Rock')
+    add_song(client, 'Pop Two', 'Happy', genre='Pop')
+    headers = sign_up(client)
+    assert titles(client.get('/api/songs?emotion=Happy', headers=headers)) == ['Pop One', 'Pop Two', 'Rock One']
+    events = [{'song_id': 2, 'event_type': 'complete'}]
+    assert client.post('/api/events', json={'events': events}, headers=headers).status_code == 202
+    assert titles(client.get('/api/songs?emotion=Happy', headers=headers)) == ['Rock One', 'Pop One', 'Pop Two']
+    # Others, and pages, keep catalog order
+    assert titles(client.get('/api/songs?emotion=Happy')) == ['Pop One', 'Rock One', 'Pop Two']
+    assert titles(client.get('/api/songs?emotion=Happy&limit=5', headers=headers)) == \
+        ['Pop One', 'Rock One', 'Pop Two']
+
+
+def test_only_served_lists_count_as_selections(app, client):
+    add_song(client, 'One', 'Happy', genre='Pop')
+    add_song(client, 'Two', 'Happy', genre='Pop')
+    headers = sign_up(client)
+    first = client.get('/api/songs?emotion=Happy', headers=headers)
+    assert selections(app) == 1
+    
+    # Revalidating the list it already has is not choosing the mood again
+    revalidated = dict(headers, **{'If-None-Match': first.headers['ETag']})
+    assert client.get('/api/songs?emotion=Happy', headers=revalidated).status_code == 304
+    # Nor is fetching further pages of it
+    page = client.get('/api/songs?emotion=Happy&limit=1', headers=headers)
+    client.get(f"/api/songs?emotion=Happy&limit=1&after={page.headers['X-Next-Cursor']}", headers=headers)
+    assert selections(app) == 1
+    
+    assert client.get('/api/songs?emotion=Happy', headers=headers).status_code == 200
+    assert selections(app) == 2
@@ -0,0 +1,68 @@
+"""
+Token-bucket rate limits: refill, all-or-nothing charging and 429 responses on the auth routes
+"""
+import pytest
+from conftest import make_app
+from ratelimit import MemoryBackend, create_backend, parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit('10/minute') == (10, 10 / 60)
+    assert parse_limit('1/second') == (1, 1.0)
+    for limit in ('10', '0/minute', 'x/minute', '10/fortnight'):
+        with pytest.raises(ValueError):
+            parse_limit(limit)
+    with pytest.raises(ValueError):
+        create_backend('memcached://localhost')
+
+
+def test_buckets_refill_over_time():
+    backend = MemoryBackend()
+    bucket = [('a', 2, 0.5)]
+    assert [backend.take(bucket, 100.0) for _ in range(2)] == [0, 0]
+    assert backend.take(bucket, 100.0) == pytest.approx(2.0)
+    # Half a token after one second, a whole one after two
+    assert backend.take(bucket, 101.0) == pytest.approx(1.0)
+    assert backend.take(bucket, 102.0) == 0
+    # An idle bucket refills to its capacity and no further
+    assert [backend.take(bucket, 1000.0) for _ in range(3)] == [0, 0, pytest.approx(2.0)]
+
+
+def test_a_rejected_request_spends_no_token():
+    backend = MemoryBackend()
+    ip, account = ('ip', 3, 1.0), ('account', 1, 1.0)
+    assert backend.take([ip, account], 0.0) == 0
+    assert backend.take([ip, account], 0.0) == pytest.approx(1.0)
+    # The IP bucket was not charged for the rejected attempt
+    assert [backend.take([ip], 0.0) for _ in range(3)] == [0, 0, pytest.approx(1.0)]
+
+
+def login(client, name, password='wrong', addr='10.0.0.1'):
+    return client.post('/api/auth/login', json={'login': name, 'password': password},
+                       environ_base={'REMOTE_ADDR': addr})
+
+
+def test_login_attempts_are_limited_per_account_and_address(tmp_path):
+    app = make_app(str(tmp_path), RATE_LIMIT_ENABLED=True,
+                   RATE_LIMITS={'login_ip': '3/minute', 'login_account': '2/minute', 'register_ip': ''})
+    client = app.test_client()
+    before = client.get('/api/auth/rate-limits').get_json()
+    assert [login(client, 'alice').status_code for _ in range(3)] == [401, 401, 429]
+    response = login(client, 'ALICE', addr='10.0.0.2')
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 30
+    # Another account from the first address still has its last address token
+    assert login(client, 'bob').status_code == 401
+    assert login(client, 'carol').status_code == 429
+    stats = client.get('/api/auth/rate-limits').get_json()
+    assert (stats['allowed'] - before['allowed'], stats['rejected'] - before['rejected']) == (3, 3)
+
+
+def test_registration_is_limited_per_address(tmp_path):
+    app = make_app(str(tmp_path), RATE_LIMIT_ENABLED=True, RATE_LIMITS={'register_ip': '1/hour'})
+    client = app.test_client()
+    users = [{'username': name, 'email': f'{name}@example.com', 'password': 'secret123'} for name in ('a1', 'b1')]
+    assert client.post('/api/auth/register', json=users[0]).status_code == 201
+    response = client.post('/api/auth/register', json=users[1])
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == 3600
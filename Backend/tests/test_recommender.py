@@ -0,0 +1,160 @@
+"""
+Recommendation index: mood filtering, popularity from listening events, and workers sharing the files
+"""
+import json
+import threading
+from datetime import datetime
+import pytest
+from bulk import insert_songs, validate_rows
+from conftest import add_song
+from events import event_buffer
+from jobs import job_queue
+from models import db, Job
+from recommender import RecommendationIndex, recommendation_index
+
+
+def recommended(client, **args):
+    response = client.get('/api/recommendations', query_string=args)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [song['title'] for song in response.get_json()]
+
+
+def load(count, start=0, emotion='Happy'):
+    """Insert count songs straight into the table, as bulk_load.py does"""
+    valid, _ = validate_rows([{'title': f'Song {n}', 'artist': f'Artist {n % 7}', 'emotion_tag': emotion}
+                              for n in range(start, start + count)])
+    insert_songs(valid)
+
+
+def second_worker(app):
+    """Another index on the same files, as a separate worker process would have"""
+    index = RecommendationIndex()
+    index.init_app(app)
+    return index
+
+
+def test_recommends_within_the_mood(client):
+    add_song(client, 'Up', 'Happy', genre='Pop')
+    add_song(client, 'Down', 'Sad', genre='Pop')
+    seed = add_song(client, 'Seed', 'happy', genre='Pop')
+    assert recommended(client, emotion='HAPPY') == ['Up', 'Seed']
+    assert recommended(client, song_id=seed['song_id']) == ['Up']
+    assert client.get('/api/recommendations?song_id=999').status_code == 404
+    assert client.get('/api/recommendations').status_code == 400
+
+
+def test_a_played_song_ranks_higher(app, client, monkeypatch):
+    monkeypatch.setattr(event_buffer, 'flush_job_delay', 0)
+    for title in ('Quiet', 'Hit', 'Skipped'):
+        add_song(client, title, 'Happy', artist='Same', genre='Pop')
+    assert recommended(client, emotion='Happy') == ['Quiet', 'Hit', 'Skipped']
+    
+    token = client.post('/api/auth/register', json={'username': 'fan', 'email': 'fan@example.com',
+                                                    'password': 'secret123'}).get_json()['access_token']
+    events = [{'song_id': 2, 'event_type': 'play'}, {'song_id': 2, 'event_type': 'complete'},
+              {'song_id': 3, 'event_type': 'skip'}]
+    response = client.post('/api/events', json={'events': events}, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 202, response.get_data(as_text=True)
+    
+    with app.app_context():
+        assert event_buffer.flush() == 3
+        # The flush queued one popularity refresh, and a second flush does not queue another
+        event_buffer.add([dict(events[0], event_uid='again', user_id=1, duration_ms=None,
+                               played_at=datetime.utcnow().isoformat())])
+        event_buffer.flush()
+        assert db.session.execute(db.select(Job.kind).where(Job.status == 'queued')).scalars().all() == \
+            ['refresh_popularity']
+        assert job_queue.run_one()
+    
+    assert recommended(client, emotion='Happy') == ['Hit', 'Quiet', 'Skipped']
+
+
+def test_old_events_age_out(app, client):
+    for title in ('Quiet', 'Hit'):
+        add_song(client, title, 'Happy', artist='Same')
+    with app.app_context():
+        db.session.execute(db.text(
+            "INSERT INTO play_events (event_uid, user_id, song_id, event_type, played_at) "
+            "VALUES ('old', 1, 2, 'complete', '2000-01-01 00:00:00')"))
+        db.session.commit()
+        assert recommendation_index.refresh_popularity() == 0
+    assert recommended(client, emotion='Happy') == ['Quiet', 'Hit']
+
+
+def test_workers_share_appends_and_growth(app):
+    with app.app_context():
+        load(10)
+        other = second_worker(app)
+        assert recommendation_index.sync() == 10
+        assert other.sync() == 0
+        assert other.count == 10
+        
+        # Past the initial capacity the files are regrown under a new generation
+        load(1100, start=10)
+        generation = recommendation_index.generation
+        recommendation_index.mark_stale()
+        assert recommendation_index.sync() == 1100
+        assert recommendation_index.generation != generation
+        
+        # The other worker remaps instead of appending the same songs again
+        assert other.sync() == 0
+        assert (other.count, other.capacity, other.generation) == (1110, 2048, recommendation_index.generation)
+        assert len(other.recommend(emotion='Happy', k=2000)) == 1110
+        
+        # And its appends are seen here without a local write marking this index stale
+        load(5, start=1110, emotion='Sad')
+        other.mark_stale()
+        assert other.sync() == 5
+        assert recommendation_index.sync() == 0
+        assert recommendation_index.count == 1115
+        with open(recommendation_index._path('meta.json')) as f:
+            assert json.load(f)['count'] == 1115
+
+
+def test_popularity_from_another_worker_is_seen(app, client):
+    for title in ('Quiet', 'Hit'):
+        add_song(client, title, 'Happy', artist='Same')
+    assert recommended(client, emotion='Happy') == ['Quiet', 'Hit']
+    with app.app_context():
+        second_worker(app).set_popularity([2], [1.0])
+    assert recommended(client, emotion='Happy') == ['Hit', 'Quiet']
+
+
+def test_queries_survive_concurrent_regrowth(app):
+    with app.app_context():
+        load(1000)
+        recommendation_index.sync()
+    errors = []
+    stop = threading.Event()
+    
+    def query():
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    recommendation_index.recommend(emotion='Happy', seed_song_id=1, k=5)
+                except Exception as e:
+                    errors.append(e)
+                    return
+    
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        with app.app_context():
+            for batch in range(3):
+                load(600, start=1000 + batch * 600)
+                recommendation_index.mark_stale()
+                recommendation_index.sync()
+            recommendation_index.rebuild()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert errors == []
+
+
+@pytest.mark.parametrize('diversity', [0.0, 0.5])
+def test_k_and_diversity(client, diversity):
+    for n in range(6):
+        add_song(client, f'Song {n}', 'Happy', artist=f'Artist {n % 2}', genre=f'Genre {n % 3}')
+    assert len(recommended(client, emotion='Happy', k=4, diversity=diversity)) == 4
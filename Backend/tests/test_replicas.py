@@ -0,0 +1,108 @@
+"""
+Read replicas: round-robin reads, the writer's cookie pin, and replicas behind the catalog kept out of rotation
+"""
+import os
+import time
+import pytest
+from conftest import add_song, make_app
+from replicas import replica_router
+from replicate_db import copy_database
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """App with one SQLite replica; returns (app, replicate) where replicate copies the primary and re-probes"""
+    primary = str(tmp_path / 'database.db')
+    replica = str(tmp_path / 'replica.db')
+    app = make_app(str(tmp_path), DATABASE_REPLICA_URLS=[f'sqlite:///{replica}'], REPLICA_HEALTH_INTERVAL=60,
+                   REPLICA_MAX_LAG=0.5)
+    
+    def replicate():
+        copy_database(primary, replica)
+        replica_router.check()
+    replicate()
+    yield app, replicate
+    replica_router.stop()
+    replica_router.after_fork()
+
+
+def totals():
+    stats = replica_router.stats()
+    return stats['replicas'][0]['reads'], stats['primary_reads']
+
+
+def counter():
+    """Function returning (replica reads, primary reads) since counter() was called"""
+    start = totals()
+    return lambda: tuple(now - then for now, then in zip(totals(), start))
+
+
+def titles(client, url='/api/songs'):
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [song['title'] for song in response.get_json()]
+
+
+def test_reads_go_to_a_healthy_replica(replicated):
+    app, replicate = replicated
+    client = app.test_client()
+    reads = counter()
+    assert replica_router.stats()['replicas'][0]['healthy']
+    assert client.get('/api/songs/emotions').get_json() == {'emotions': []}
+    titles(client, '/api/songs?limit=5')
+    assert reads() == (2, 0)
+
+
+def test_the_writer_is_pinned_and_lagging_replicas_are_skipped(replicated):
+    app, replicate = replicated
+    writer, reader = app.test_client(), app.test_client()
+    reads = counter()
+    add_song(writer, 'One')
+    assert writer.get_cookie(replica_router.pin_cookie) is not None
+    
+    # The replica has not applied the change yet, so nobody reads from it
+    assert replica_router.catalog_floor > replica_router.stats()['replicas'][0]['catalog_version']
+    assert titles(writer) == ['One']
+    assert titles(reader) == ['One']
+    assert reads() == (0, 2)
+    
+    # Once it has, other clients use it while the writer stays on the primary until its pin expires
+    replicate()
+    assert titles(reader, '/api/songs?emotion=Happy') == ['One']
+    assert titles(writer, '/api/songs?emotion=Happy') == ['One']
+    assert reads() == (1, 3)
+    time.sleep(0.6)
+    titles(writer, '/api/songs?limit=1')
+    assert reads() == (2, 3)
+
+
+def test_unversioned_changes_hold_every_client_briefly(replicated):
+    app, replicate = replicated
+    client = app.test_client()
+    reads = counter()
+    replica_router.catalog_changed()
+    titles(client)
+    time.sleep(0.6)
+    titles(client)
+    assert reads() == (1, 1)
+
+
+def test_a_missing_replica_leaves_the_rotation(replicated, tmp_path):
+    app, replicate = replicated
+    client = app.test_client()
+    reads = counter()
+    os.remove(tmp_path / 'replica.db')
+    replica_router.check()
+    assert titles(client) == []
+    assert reads() == (0, 1)
+    assert replica_router.stats()['replicas'][0] == {
+        'url': f"sqlite:///{tmp_path / 'replica.db'}", 'healthy': False, 'catalog_version': None, 'reads': 0
+    }
+
+
+def test_pin_cookie_values():
+    future, past = str(time.time() + 5), str(time.time() - 5)
+    assert replica_router.pinned({replica_router.pin_cookie: future})
+    assert not replica_router.pinned({replica_router.pin_cookie: past})
+    assert not replica_router.pinned({replica_router.pin_cookie: 'garbage'})
+    assert not replica_router.pinned({})
@@ -0,0 +1,84 @@
+"""
+Full-text search: BM25 ranking, search-as-you-type prefixes, cursors and common terms
+"""
+import pytest
+import search
+from conftest import add_song
+from search import SearchError, Term, parse_terms
+
+
+def titles(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [song['title'] for song in response.get_json()]
+
+
+def test_terms():
+    assert parse_terms('Blue, moon!') == [Term('blue', False), Term('moon', True)]
+    assert parse_terms('a') == [Term('a', False)]
+    with pytest.raises(SearchError):
+        parse_terms(' -- ')
+
+
+def test_best_matches_come_first(client):
+    add_song(client, 'Evening Walk', genre='Rock')
+    add_song(client, 'Rock Rock Rock', genre='Rock')
+    add_song(client, 'Morning', artist='Rock Band')
+    add_song(client, 'Unrelated', genre='Jazz')
+    assert titles(client, '/api/songs/search?q=rock') == ['Rock Rock Rock', 'Morning', 'Evening Walk']
+    assert titles(client, '/api/songs/search?q=rock+walk') == ['Evening Walk']
+    
+    # The last word matches as a prefix, the earlier ones only whole
+    assert titles(client, '/api/songs/search?q=unrel') == ['Unrelated']
+    assert titles(client, '/api/songs/search?q=unrel+jazz') == []
+    scores = [song['score'] for song in client.get('/api/songs/search?q=rock').get_json()]
+    assert scores == sorted(scores, reverse=True) and scores[-1] > 0
+
+
+def test_emotion_filter(client):
+    add_song(client, 'Rain Song', 'Sad')
+    add_song(client, 'Rain Dance', 'Happy')
+    assert titles(client, '/api/songs/search?q=rain&emotion=SAD') == ['Rain Song']
+
+
+def test_cursor_walks_every_match_once(client):
+    for n in range(7):
+        add_song(client, f'Love {"love " * (n % 3)}{n}')
+    seen, url = [], '/api/songs/search?q=love&limit=3'
+    while url:
+        response = client.get(url)
+        seen.extend(song['title'] for song in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/songs/search?q=love&limit=3&after={cursor}' if cursor else None
+    assert len(seen) == 7
+    assert seen == titles(client, '/api/songs/search?q=love&limit=50')
+
+
+def test_common_terms_are_left_out_of_the_ranking(app, client, monkeypatch):
+    monkeypatch.setattr(search, 'MIN_STOPWORD_DOCS', 1)
+    monkeypatch.setitem(app.config, 'SEARCH_STOPWORD_RATIO', 0.6)
+    search.term_stats.clear()
+    for title in ('The Night', 'The Day', 'The Night Night Night', 'The Sun', 'The Moon'):
+        add_song(client, title, genre='Pop')
+    # 'the' is in every song, so only 'night' is ranked; it still has to match
+    assert titles(client, '/api/songs/search?q=the+night') == ['The Night Night Night', 'The Night']
+    assert search.term_stats.get(Term('the', False)) == 3
+    # With every term common the matches come back in catalog order
+    assert titles(client, '/api/songs/search?q=the+pop') == \
+        ['The Night', 'The Day', 'The Night Night Night', 'The Sun', 'The Moon']
+
+
+def test_invalid_queries(client):
+    for query in ('', 'q=--', 'q=x&after=nonsense', 'q=x&limit=0'):
+        response = client.get(f'/api/songs/search?{query}')
+        assert response.status_code == 400, query
+        assert 'error' in response.get_json()
+
+
+def test_revalidation_follows_the_catalog(client):
+    add_song(client, 'Blue')
+    first = client.get('/api/songs/search?q=blue')
+    etag = first.headers['ETag']
+    assert client.get('/api/songs/search?q=blue', headers={'If-None-Match': etag}).status_code == 304
+    add_song(client, 'Blue Again')
+    assert client.get('/api/songs/search?q=blue', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,51 @@
+"""
+Song list cache: repeated reads are served from memory and writes invalidate the lists they touch
+"""
+from cache import ALL_SONGS_KEY, song_cache
+from conftest import add_song
+
+
+def titles(response):
+    return [song['title'] for song in response.get_json()]
+
+
+def test_repeated_reads_hit_the_cache(client):
+    add_song(client, 'One', 'Happy')
+    first = client.get('/api/songs?emotion=Happy')
+    hits = song_cache.stats()['hits']
+    second = client.get('/api/songs?emotion=Happy')
+    assert second.get_data() == first.get_data()
+    assert song_cache.stats()['hits'] > hits
+    assert titles(second) == ['One']
+
+
+def test_emotion_filters_share_one_entry_whatever_their_case(client):
+    add_song(client, 'One', 'Happy')
+    client.get('/api/songs?emotion=happy')
+    entries = song_cache.stats()['entries']
+    assert titles(client.get('/api/songs?emotion=HAPPY')) == ['One']
+    assert song_cache.stats()['entries'] == entries
+
+
+def test_writes_invalidate_only_their_mood(client):
+    add_song(client, 'Up', 'Happy')
+    add_song(client, 'Down', 'Sad')
+    client.get('/api/songs?emotion=Happy')
+    client.get('/api/songs?emotion=Sad')
+    client.get('/api/songs')
+    sad = song_cache.get('sad')
+    
+    add_song(client, 'Up Again', 'happy')
+    assert song_cache.get('happy') is None
+    assert song_cache.get(ALL_SONGS_KEY) is None
+    assert song_cache.get('sad') is sad
+    
+    assert titles(client.get('/api/songs?emotion=Happy')) == ['Up', 'Up Again']
+    assert sorted(titles(client.get('/api/songs'))) == ['Down', 'Up', 'Up Again']
+    assert titles(client.get('/api/songs?emotion=Sad')) == ['Down']
+
+
+def test_cache_stats_endpoint(client):
+    client.get('/api/songs')
+    stats = client.get('/api/songs/cache').get_json()
+    assert {'entries', 'hits', 'misses', 'coalescing', 'invalidation'} <= set(stats)
@@ -0,0 +1,9 @@
+"""
+WSGI entry point for pre-fork servers
+
+Run: python migrate_db.py --config production && gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+from app import create_app
+
+app = create_app(os.environ.get('APP_CONFIG', 'production'))
@@ -10,6 +10,8 @@ const error = document.getElementById('error');
 
 // State
 let currentMood = null;
+// Song counts per mood, from the precomputed emotion facets
+let moodCounts = {};
 
 // Event Listeners
 moodButtons.forEach(button => {
@@ -133,5 +135,27 @@ async function checkBackendConnection() {
     }
 }
 
+// Fetch Song Counts per Mood (without fetching the song lists)
+async function fetchMoodCounts() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/songs/emotions?counts=true`);
+        if (!response.ok) {
+            return;
+        }
+
+        moodCounts = (await response.json()).counts;
+        moodButtons.forEach(button => {
+            // Counts are keyed by the lower-cased emotion, as songs are matched
+            const count = moodCounts[button.dataset.emotion.toLowerCase()];
+            if (count !== undefined) {
+                button.title = `${count} songs`;
+            }
+        });
+    } catch (err) {
+        console.error('Error fetching mood counts:', err);
+    }
+}
+
 // Initialize
 checkBackendConnection();
+fetchMoodCounts();